@@ -0,0 +1,241 @@
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time as wall_clock
+import tracemalloc
+import numpy as np
+
+from catalog import PLANET_CATALOG
+from planet import Planet
+from runner import INTEGRATORS, DerivativeBuffers, get_derivatives
+from simulation import DELTA_T, get_ensemble, get_planet_configs, get_simulation
+
+
+BENCHMARK_SEED = 20180101
+YEAR = 365.25 * 24 * 3600
+SHIPS_COUNTS = (1, 10, 100, 1000)
+BODIES_COUNTS = (3, 10, 30, 100, 300)
+# Earth, Mars and the ship, then the catalog planets, then massless asteroids
+STEP_BODIES_COUNTS = (3, 3 + len(PLANET_CATALOG), 100, 1000)
+LAMBDA_OFFSETS = (0, 45, 90, 135, 180, 225, 270, 315)
+
+
+def best_time(function, repeat, setup=None):
+    """Least wall time of repeat calls of function, seconds, each given a fresh untimed setup() if any."""
+    times = []
+    for _ in range(repeat):
+        arguments = (setup(),) if setup is not None else ()
+        start = wall_clock.perf_counter()
+        function(*arguments)
+        times.append(wall_clock.perf_counter() - start)
+    return min(times)
+
+
+def get_random_ships(count, rng):
+    return [
+        dict(
+            ship_true_anomaly=rng.uniform(0, 360),
+            ship_start_velocity=rng.uniform(25000, 35000),
+            ship_mars_a_config=[(rng.uniform(1e9, 1e10), rng.uniform(0.001, 0.01))],
+        )
+        for _ in range(count)
+    ]
+
+
+def get_step_counts(simulation, duration):
+    """(accepted steps, right-hand side evaluations) of a simulation advanced duration seconds from 0."""
+    stepper = simulation.stepper
+    steps = stepper.accepted if stepper.adaptive else int(round(duration / simulation.sample_interval))
+    return steps, stepper.evaluations
+
+
+def time_steps(repeat, get_simulation, duration):
+    """Result fields of the best of repeat runs of duration seconds of fresh simulations from get_simulation."""
+    simulations = []
+
+    def setup():
+        simulations.append(get_simulation())
+        return simulations[-1]
+    seconds = best_time(lambda simulation: simulation.advance(duration), repeat, setup=setup)
+    steps, evaluations = get_step_counts(simulations[-1], duration)
+    return dict(
+        seconds=seconds,
+        steps=steps,
+        evaluations=evaluations,
+        steps_per_second=steps / seconds,
+        evaluations_per_second=evaluations / seconds,
+        simulated_seconds_per_second=duration / seconds,
+    )
+
+
+def bench_steps(repeat, steps=200, ships_counts=SHIPS_COUNTS):
+    """
+    Accepted steps and right-hand side evaluations per second of every integrator with a growing ensemble of ships.
+
+    Runs last steps * DELTA_T simulated seconds; dopri5 chooses its own steps.
+    """
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    results = []
+    for ships_count in ships_counts:
+        ships = get_random_ships(ships_count, rng)
+        for integrator in sorted(INTEGRATORS):
+            result = time_steps(repeat, lambda: get_ensemble(ships, integrator=integrator), steps * DELTA_T)
+            results.append(dict(
+                integrator=integrator,
+                ships=ships_count,
+                bodies=2 + ships_count,
+                ship_steps_per_second=result['steps'] * ships_count / result['seconds'],
+                **result
+            ))
+    return results
+
+
+def bench_body_steps(repeat, steps=200, bodies_counts=STEP_BODIES_COUNTS):
+    """
+    Accepted steps and right-hand side evaluations per second of every integrator by body count.
+
+    The Earth, Mars and a ship come first, then the catalog planets and
+    then massless asteroids up to the body count.
+    """
+    results = []
+    for bodies in bodies_counts:
+        extra_planets = list(PLANET_CATALOG)[:max(bodies - 3, 0)]
+        minor_bodies = max(bodies - 3 - len(extra_planets), 0)
+        for integrator in sorted(INTEGRATORS):
+            result = time_steps(
+                repeat,
+                lambda: get_simulation(integrator=integrator, extra_planets=extra_planets, minor_bodies=minor_bodies),
+                steps * DELTA_T,
+            )
+            results.append(dict(
+                integrator=integrator,
+                bodies=bodies,
+                massive_bodies=3 + len(extra_planets),
+                **result
+            ))
+    return results
+
+
+def bench_derivatives(repeat, evaluations=1000, bodies_counts=BODIES_COUNTS):
+    """Seconds per right-hand side evaluation of N massive bodies on random orbits."""
+    rng = np.random.default_rng(BENCHMARK_SEED)
+    sun_mass = get_planet_configs(0, 0, 0, 0, 0, 0)['sun_config']['mass']
+    results = []
+    for count in bodies_counts:
+        radius = rng.uniform(1e11, 3e11, count)
+        angle = rng.uniform(0, 2 * np.pi, count)
+        state = np.column_stack([
+            radius * np.cos(angle), -3e4 * np.sin(angle), radius * np.sin(angle), 3e4 * np.cos(angle),
+        ])
+        masses = rng.uniform(1e23, 1e25, count)
+        out = np.empty_like(state)
+        buffers = DerivativeBuffers(count, count)
+
+        def run():
+            for _ in range(evaluations):
+                get_derivatives(state, masses, sun_mass, out=out, buffers=buffers)
+        seconds = best_time(run, repeat)
+        results.append(dict(bodies=count, seconds_per_evaluation=seconds / evaluations))
+    return results
+
+
+def bench_planet_init(repeat, planets=100, lambda_offsets=LAMBDA_OFFSETS):
+    """Seconds per canvas-less Planet construction by ship true anomaly."""
+    results = []
+    for lambda_offset in lambda_offsets:
+        configs = get_planet_configs(0, 0, 30000, 0, 0, lambda_offset)
+
+        def run():
+            for _ in range(planets):
+                Planet('Ship', None, 1, **configs['ship_config'])
+        seconds = best_time(run, repeat)
+        results.append(dict(lambda_offset=lambda_offset, seconds_per_planet=seconds / planets))
+    return results
+
+
+def bench_memory(repeat, years=1):
+    """Peak traced memory of a headless run of every integrator keeping every step."""
+    results = []
+    for integrator in sorted(INTEGRATORS):
+        peaks = []
+        for _ in range(repeat):
+            simulation = get_simulation(integrator=integrator)
+            tracemalloc.start()
+            simulation.run(years * YEAR)
+            peaks.append(tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+        results.append(dict(integrator=integrator, bytes_per_year=min(peaks) / years))
+    return results
+
+
+BENCHMARKS = dict(
+    steps=bench_steps,
+    body_steps=bench_body_steps,
+    derivatives=bench_derivatives,
+    planet_init=bench_planet_init,
+    memory=bench_memory,
+)
+QUICK_OPTIONS = dict(
+    steps=dict(steps=20, ships_counts=(1, 100)),
+    body_steps=dict(steps=20, bodies_counts=(3, 100)),
+    derivatives=dict(evaluations=100, bodies_counts=(3, 30)),
+    planet_init=dict(planets=10, lambda_offsets=(0, 180)),
+    memory=dict(years=0.1),
+)
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(names=None, repeat=3, quick=False):
+    """Dict of the environment and the results of the named BENCHMARKS, all by default."""
+    return dict(
+        revision=get_revision(),
+        python=platform.python_version(),
+        numpy=np.__version__,
+        machine=platform.machine(),
+        platform=platform.platform(),
+        seed=BENCHMARK_SEED,
+        repeat=repeat,
+        quick=quick,
+        results={
+            name: BENCHMARKS[name](repeat, **(QUICK_OPTIONS[name] if quick else {}))
+            for name in (names or BENCHMARKS)
+        },
+    )
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Benchmark the integrators, force model and Planet setup.')
+    parser.add_argument(
+        'benchmarks', nargs='*', metavar='BENCHMARK', help='any of %s, all by default' % ', '.join(BENCHMARKS),
+    )
+    parser.add_argument('--repeat', type=int, default=3, help='keep the best of this many runs')
+    parser.add_argument('--quick', action='store_true', help='smaller cases, to check the suite runs')
+    parser.add_argument('--output', help='JSON file to write, stdout by default')
+    return parser
+
+
+def run(args=None):
+    parser = get_argument_parser()
+    args = parser.parse_args(args)
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: %s' % ', '.join(sorted(unknown)))
+    results = run_benchmarks(args.benchmarks, repeat=args.repeat, quick=args.quick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,100 @@
+import math
+import numpy as np
+
+from planet import get_orbit_states, to_radian
+
+
+AU = 1.496 * math.pow(10, 11)  # meters
+MINOR_BODIES_SEED = 1801  # year Ceres was found
+MINOR_BODIES_SEMI_MAJOR_AXIS = (2.1 * AU, 3.3 * AU)  # main asteroid belt
+MINOR_BODIES_ECCENTRICITY = (0, 0.25)
+
+# massive bodies besides the Earth and Mars of get_planet_configs, as Planet
+# keyword arguments; lambda_offset is the default true anomaly in degrees
+PLANET_CATALOG = dict(
+    Mercury=dict(
+        large_half_life=5.791 * math.pow(10, 10),
+        planet_r=3,
+        eccentricity=0.2056,
+        color='gray',
+        lambda_offset=175,
+        perihelion_longitude=77,
+        mass=3.301 * math.pow(10, 23),
+    ),
+    Venus=dict(
+        large_half_life=1.0821 * math.pow(10, 11),
+        planet_r=6,
+        eccentricity=0.0068,
+        color='orange',
+        lambda_offset=50,
+        perihelion_longitude=132,
+        mass=4.867 * math.pow(10, 24),
+    ),
+    Jupiter=dict(
+        large_half_life=7.7857 * math.pow(10, 11),
+        planet_r=12,
+        eccentricity=0.0489,
+        color='#d8ca9d',
+        lambda_offset=20,
+        perihelion_longitude=15,
+        mass=1.898 * math.pow(10, 27),
+    ),
+    Saturn=dict(
+        large_half_life=1.4335 * math.pow(10, 12),
+        planet_r=10,
+        eccentricity=0.0565,
+        color='#e3e0c0',
+        lambda_offset=318,
+        perihelion_longitude=92,
+        mass=5.683 * math.pow(10, 26),
+    ),
+    Uranus=dict(
+        large_half_life=2.8725 * math.pow(10, 12),
+        planet_r=8,
+        eccentricity=0.0457,
+        color='#afdbf5',
+        lambda_offset=142,
+        perihelion_longitude=171,
+        mass=8.681 * math.pow(10, 25),
+    ),
+    Neptune=dict(
+        large_half_life=4.4951 * math.pow(10, 12),
+        planet_r=8,
+        eccentricity=0.0113,
+        color='#3f54ba',
+        lambda_offset=260,
+        perihelion_longitude=45,
+        mass=1.024 * math.pow(10, 26),
+    ),
+)
+
+
+def get_catalog_configs(names, orbit_center=(0, 0), true_anomalies=None):
+    """Planet configs of the PLANET_CATALOG names, with true_anomalies in degrees overriding the defaults."""
+    unknown = set(names) - set(PLANET_CATALOG)
+    if unknown:
+        raise ValueError('Unknown planets: %s' % ', '.join(sorted(unknown)))
+    return [
+        dict(
+            PLANET_CATALOG[name],
+            orbit_center=orbit_center,
+            **({'lambda_offset': true_anomalies[name]} if true_anomalies and name in true_anomalies else {})
+        )
+        for name in names
+    ]
+
+
+def get_minor_bodies_state(
+    count,
+    seed=MINOR_BODIES_SEED,
+    semi_major_axis=MINOR_BODIES_SEMI_MAJOR_AXIS,
+    eccentricity=MINOR_BODIES_ECCENTRICITY,
+):
+    """(count, 4) states of massless minor bodies on random orbits, uniform within the given ranges."""
+    rng = np.random.default_rng(seed)
+    return get_orbit_states(
+        rng.uniform(*semi_major_axis, size=count),
+        rng.uniform(*eccentricity, size=count),
+        rng.uniform(0, 2 * math.pi, size=count),
+        to_radian(rng.uniform(0, 360, size=count)),
+    ).reshape(-1, 4)
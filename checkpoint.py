@@ -0,0 +1,56 @@
+import json
+import os
+import os.path
+import numpy as np
+
+
+CHECKPOINT_VERSION = 1
+
+
+def get_checkpoint(simulation, config):
+    """
+    Snapshot of a Simulation built by simulation.get_simulation from config.
+
+    config holds the get_bodies inputs: anomalies, ship start velocity,
+    the ship a_config tables, with_ship, extra_planets and minor_bodies.
+    delta_t is the configured sample interval, not the step an adaptive
+    integrator happens to propose next.
+    """
+    return dict(
+        time=float(simulation.time),
+        state=simulation.state.copy(),
+        names=list(simulation.names),
+        delta_t=float(simulation.sample_interval),
+        integrator=simulation.integrator,
+        integrator_options=dict(simulation.integrator_options),
+        config=dict(config),
+    )
+
+
+def save_checkpoint(path, checkpoint):
+    """Write checkpoint to an .npz file, replacing path only once it is complete."""
+    settings = dict(
+        {name: checkpoint[name] for name in ('names', 'delta_t', 'integrator', 'integrator_options', 'config')},
+        version=CHECKPOINT_VERSION,
+    )
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    partial_path = '%s.partial' % path
+    with open(partial_path, 'wb') as f:
+        np.savez(f, time=checkpoint['time'], state=checkpoint['state'], settings=json.dumps(settings))
+    os.replace(partial_path, path)
+
+
+def load_checkpoint(path):
+    with np.load(path) as data:
+        checkpoint = json.loads(str(data['settings']))
+        if checkpoint.pop('version') != CHECKPOINT_VERSION:
+            raise ValueError('%s is not a version %s checkpoint' % (path, CHECKPOINT_VERSION))
+        checkpoint.update(time=float(data['time']), state=data['state'])
+    checkpoint['config'] = {
+        name: [tuple(pair) for pair in value] if name.endswith('_a_config') else value
+        for name, value in checkpoint['config'].items()
+    }
+    return checkpoint
+
@@ -0,0 +1,146 @@
+import math
+import multiprocessing
+import time as wall_clock
+
+from queue import Empty, Full
+
+from simulation import DELTA_T, get_simulation
+
+
+QUEUE_SIZE = 256
+STOP_TIMEOUT = 1  # seconds for all workers together
+SCENARIO_COLORS = ('orange', 'magenta', 'cyan', 'white', 'pink', 'yellow green', 'light blue', 'gold')
+CLOCK_WALL, CLOCK_TIME, CLOCK_SPEED = range(3)
+
+
+def run_scenario(config, delta_t, interval, integrator, integrator_options, clock, running, stopped, states):
+    """
+    Worker process body: integrate one scenario and publish (time, ship state) pairs to states.
+
+    The run keeps to the shared clock of (wall time, simulated time,
+    speed), so all scenarios advance together, and blocks while its queue
+    is full. A failure is published as the exception instead.
+    """
+    def publish(item):
+        while not stopped.is_set():
+            try:
+                states.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    try:
+        simulation = get_simulation(delta_t, integrator, integrator_options, **config)
+        ship = simulation.names.index('Ship')
+        while not stopped.is_set():
+            if not running.wait(timeout=0.1) or stopped.is_set():
+                continue
+            if not simulation.adaptive:
+                simulation.delta_t = interval
+            simulation.advance(simulation.time + interval)
+            publish((simulation.time, simulation.state[ship].copy()))
+            while running.is_set() and not stopped.is_set():
+                with clock.get_lock():
+                    wall_start, time_start, speed = clock[:]
+                ahead = math.inf
+                if speed > 0:
+                    ahead = (simulation.time - time_start) / speed - (wall_clock.time() - wall_start)
+                    if ahead <= 0:
+                        break
+                wall_clock.sleep(min(ahead, 0.1))
+    except Exception as e:
+        publish(e)
+
+
+class Comparison:
+    """
+    Ship scenarios run side by side, one worker process each, for overlaying on a main run.
+
+    configs are get_simulation keyword dicts like Panel.get_config; every
+    scenario gets a ship and no asteroids. States are published every
+    interval simulated seconds on a clock shared by all workers, so N
+    scenarios take about the wall time of one given N free CPUs.
+    """
+
+    def __init__(
+        self, configs, interval, speed, delta_t=DELTA_T, integrator='rk4', integrator_options=None,
+        queue_size=QUEUE_SIZE,
+    ):
+        # fork is unsafe next to the Tk and simulation threads
+        context = multiprocessing.get_context('spawn')
+        self.configs = [dict(config, with_ship=True, minor_bodies=0) for config in configs]
+        self.clock = context.Array('d', 3)
+        self.running = context.Event()
+        self.stopped = context.Event()
+        self.queues = [context.Queue(maxsize=queue_size) for _ in self.configs]
+        self.processes = [
+            context.Process(
+                target=run_scenario,
+                args=(
+                    config, delta_t, interval, integrator, integrator_options or {},
+                    self.clock, self.running, self.stopped, queue,
+                ),
+                daemon=True,
+            )
+            for config, queue in zip(self.configs, self.queues)
+        ]
+        self.errors = {}
+        self.new_errors = []
+        self.set_clock(0, speed)
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def set_clock(self, time, speed):
+        """Keep speed simulated seconds per wall second from time on."""
+        with self.clock.get_lock():
+            self.clock[CLOCK_WALL] = wall_clock.time()
+            self.clock[CLOCK_TIME] = time
+            self.clock[CLOCK_SPEED] = speed
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self, time, speed):
+        self.set_clock(time, speed)
+        self.running.set()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Signal every worker, give them timeout seconds in all to exit, then terminate the rest."""
+        self.stopped.set()
+        self.running.set()
+        deadline = wall_clock.monotonic() + timeout
+        for process in self.processes:
+            process.join(timeout=max(deadline - wall_clock.monotonic(), 0))
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+
+    def drain(self):
+        """
+        For every scenario the (time, ship state) pairs published since the last drain, oldest first.
+
+        A failed scenario publishes nothing more; its exception goes to
+        errors by scenario index and is returned once by pop_errors.
+        """
+        drained = []
+        for i, queue in enumerate(self.queues):
+            items = []
+            while i not in self.errors:
+                try:
+                    item = queue.get_nowait()
+                except Empty:
+                    break
+                if isinstance(item, Exception):
+                    self.errors[i] = item
+                    self.new_errors.append((i, item))
+                else:
+                    items.append(item)
+            drained.append(items)
+        return drained
+
+    def pop_errors(self):
+        """(scenario index, exception) of the scenarios failed since the last call."""
+        errors, self.new_errors = self.new_errors, []
+        return errors
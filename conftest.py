@@ -0,0 +1 @@
+# the modules live at the top level, this puts it on sys.path for the tests
@@ -0,0 +1,98 @@
+import numpy as np
+
+from runner import G, X, V_X, Y, V_Y
+
+
+DRIFT_EVERY = 10
+
+
+class DriftAlarm(RuntimeError):
+    """Conserved quantities drifted beyond the accuracy budget."""
+
+
+def get_conserved_quantities(states, masses, sun_mass):
+    """
+    (energy, angular momentum) of the first len(masses) rows of (..., N, 4) states.
+
+    Both are for those bodies moving around the sun fixed at the origin,
+    where they are conserved up to the integration error. Works on any
+    number of leading sample axes at once.
+    """
+    masses = np.asarray(masses, dtype=float)
+    massive = np.asarray(states, dtype=float)[..., :len(masses), :]
+    x, v_x, y, v_y = massive[..., X], massive[..., V_X], massive[..., Y], massive[..., V_Y]
+    first, second = np.triu_indices(len(masses), 1)
+    energy = (
+        (0.5 * masses * (v_x ** 2 + v_y ** 2)).sum(axis=-1)
+        - (G * sun_mass * masses / np.hypot(x, y)).sum(axis=-1)
+        - (G * masses[first] * masses[second] / np.hypot(
+            x[..., first] - x[..., second], y[..., first] - y[..., second],
+        )).sum(axis=-1)
+    )
+    angular_momentum = (masses * (x * v_y - y * v_x)).sum(axis=-1)
+    return energy, angular_momentum
+
+
+def get_planet_masses(simulation):
+    """
+    Masses of the planets of a simulation, the rows its conserved quantities are taken over.
+
+    Ships are left out: their thrust does work on them and their masses
+    are too small to show in the totals anyway.
+    """
+    return [planet.mass for planet in simulation.planets]
+
+
+class ConservationMonitor:
+    """
+    Relative drift of the energy and angular momentum from the first state checked.
+
+    Only every every-th check computes them, the others return the last
+    drifts. With a threshold, drifts beyond it set alarm, or raise
+    DriftAlarm if raise_alarm.
+    """
+
+    def __init__(self, masses, sun_mass, every=DRIFT_EVERY, threshold=None, raise_alarm=False):
+        self.masses = np.asarray(masses, dtype=float)
+        self.sun_mass = sun_mass
+        self.every = every
+        self.threshold = threshold
+        self.raise_alarm = raise_alarm
+        self.reference = None
+        self.checks = 0
+        self.drifts = (0.0, 0.0)
+        self.max_drifts = (0.0, 0.0)
+        self.alarm = False
+
+    def reset(self, state):
+        self.reference = get_conserved_quantities(state, self.masses, self.sun_mass)
+        self.checks = 0
+        self.drifts = self.max_drifts = (0.0, 0.0)
+        self.alarm = False
+
+    def get_drifts(self, states):
+        """(energy, angular momentum) relative drifts of (..., N, 4) states from the reference."""
+        return tuple(
+            (value - reference) / abs(reference) if reference else value - reference
+            for value, reference in zip(get_conserved_quantities(states, self.masses, self.sun_mass), self.reference)
+        )
+
+    def check(self, state):
+        """Drifts of the (N, 4) state, the first one checked being the reference."""
+        if self.reference is None:
+            self.reset(state)
+        self.checks += 1
+        if self.checks % self.every:
+            return self.drifts
+        self.drifts = tuple(float(drift) for drift in self.get_drifts(state))
+        self.max_drifts = tuple(max(abs(drift), top) for drift, top in zip(self.drifts, self.max_drifts))
+        if self.threshold and max(self.max_drifts) > self.threshold:
+            self.alarm = True
+            if self.raise_alarm:
+                raise DriftAlarm('relative drift %.3g exceeds %.3g' % (max(self.max_drifts), self.threshold))
+        return self.drifts
+
+    def format(self):
+        return 'Energy drift %+.2e, angular momentum drift %+.2e%s' % (
+            self.drifts + (' - ALARM' if self.alarm else '',)
+        )
@@ -1,114 +1,58 @@
-import math
-
 import os.path
-
-from copy import deepcopy
-from itertools import chain
-
-from planet import Planet
-from runner import get_get_new_positions
+import time as wall_clock
+
+from collections import deque
+
+import numpy as np
+
+from comparison import SCENARIO_COLORS, Comparison
+from diagnostics import ConservationMonitor, get_planet_masses
+from history import TrajectoryHistory
+from checkpoint import get_checkpoint, load_checkpoint, save_checkpoint
+from catalog import MINOR_BODIES_SEED, PLANET_CATALOG, get_catalog_configs, get_minor_bodies_state
+from planet import MinorBodies, Planet, TRACE_LENGTH
+from profiling import PROFILER
+from runner import INTEGRATORS, X, Y
+from simulation import (
+    DELTA_T, START_VELOCITY, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, SHIP_TRUE_ANOMALY,
+    Simulation, get_planet_configs,
+)
+from simulation_thread import SimulationThread
+from viewport import ZOOM_STEP, Viewport, get_inside, get_visible_runs
+from telemetry import TelemetryWriter, get_ship_telemetry, get_telemetry_columns
 
 from tkinter import (
-    Canvas, Button, Entry, Label, LabelFrame, Text,
-    BooleanVar, DoubleVar,
+    Canvas, Button, Entry, Label, LabelFrame, OptionMenu, Scale, Text,
+    BooleanVar, DoubleVar, IntVar, StringVar,
     W, N, E, S,
     ALL, DISABLED, NORMAL, BOTH, END,
-    TOP, BOTTOM, LEFT, RIGHT,
+    TOP, BOTTOM, LEFT, RIGHT, HORIZONTAL,
     INSERT,
 )
 
+from tkinter.filedialog import askopenfilename, asksaveasfilename
+from tkinter.messagebox import showerror
 from tkinter.ttk import Frame, Checkbutton
 
 
-DELTA_T = 100000
-START_VELOCITY = 30000
-ANIMATION_T = 10
+FRAMES_PER_SECOND = 30
+ANIMATION_T = 1000 // FRAMES_PER_SECOND
+SIMULATION_SPEED = 100 * DELTA_T  # simulated seconds per wall second
+INTEGRATOR = 'rk4'
+RELATIVE_TOLERANCE = 1e-8
 RESULT_DIRECTORY = 'results'
-FILE_NAME_PREFIX = 'log_file'
-
-
-def get_planet_configs(
-    canvas_width,
-    canvas_height,
-    ship_start_velocity,
-    earth_true_anomaly,
-    mars_true_anomaly,
-    ship_true_anomaly,
-    ship_earth_a_config=(),
-    ship_mars_a_config=(),
-    ship_sun_a_config=(),
-):
-    canvas_orbit_radius = min(canvas_height, canvas_width) / 2 - 30
-    start_of_coordinates = (canvas_width / 2, canvas_height / 2)
-
-    sun_config = dict(
-        large_half_life=0,
-        planet_r=15,  # pixels
-        orbit_center=start_of_coordinates,
-        eccentricity=0,
-        color='yellow',
-        lambda_offset=0,
-        mass=1.989 * math.pow(10, 30),
-        a_config=ship_sun_a_config,
-    )
-
-    earth_config = dict(
-        large_half_life=1.496 * math.pow(10, 11),  # meters
-        planet_r=7,  # pixels
-        orbit_center=start_of_coordinates,
-        eccentricity=0.0167,
-        color='blue',
-        lambda_offset=earth_true_anomaly,
-        perihelion_longitude=336,
-        mass=5.972 * math.pow(10, 24),
-        a_config=ship_earth_a_config,
-    )
-
-    mars_config = dict(
-        large_half_life=2.279 * math.pow(10, 11),  # meters
-        planet_r=4,  # pixels
-        orbit_center=start_of_coordinates,
-        eccentricity=0.0934,
-        color='red',
-        lambda_offset=mars_true_anomaly,
-        perihelion_longitude=101,
-        mass=6.39 * math.pow(10, 23),
-        a_config=ship_mars_a_config,
-    )
-
-    ship_config = deepcopy(earth_config)
-    ship_config.update(dict(
-        color='green',
-        lambda_offset=ship_true_anomaly,
-        planet_r=2,
-        mass=10000,
-        a_config=(),
-        start_velocity=ship_start_velocity,
-    ))
-
-    scale = canvas_orbit_radius / max(
-        earth_config['large_half_life'] * (1 + earth_config['eccentricity']),
-        mars_config['large_half_life'] * (1 + mars_config['eccentricity']),
-    )
-    return dict(
-        earth_config=earth_config,
-        sun_config=sun_config,
-        mars_config=mars_config,
-        ship_config=ship_config,
-        canvas_orbit_radius=canvas_orbit_radius,
-        scale=scale,
-    )
-
-
-def chunkinate_iterable(iterable, size):
-    while True:
-        next_item = next(iterable)
-
-        def query_chunk():
-            yield next_item
-            for i in range(size - 1):
-                yield next(iterable)
-        yield query_chunk()
+TELEMETRY_PREFIX = 'telemetry'
+TELEMETRY_EVERY = 1
+CHECKPOINT_FILE = os.path.join(RESULT_DIRECTORY, 'checkpoint.npz')
+CHECKPOINT_INTERVAL = 60  # wall seconds between automatic checkpoints
+PROFILE_REFRESH_FRAMES = FRAMES_PER_SECOND // 2
+# Panel.get_config entries that are not get_planet_configs arguments
+BODY_SET_CONFIG = ('with_ship', 'extra_planets', 'minor_bodies', 'minor_bodies_seed')
+DRIFT_CHECK_FRAMES = 5
+DRIFT_THRESHOLD = 1e-6  # relative, 0 - no alarm
+DAY = 24 * 3600
+TIMELINE_RESOLUTION = 0.1  # days
+FREE_CAMERA = 'Free'
 
 
 class Panel(Frame):
@@ -122,15 +66,46 @@ class Panel(Frame):
         self.with_ship = BooleanVar(self, value=True)
         self.delta_t = DoubleVar(self, value=DELTA_T)
         self.start_velocity = DoubleVar(self, value=START_VELOCITY)
+        self.integrator = StringVar(self, value=INTEGRATOR)
+        self.relative_tolerance = DoubleVar(self, value=RELATIVE_TOLERANCE)
+        self.trace_length = IntVar(self, value=TRACE_LENGTH)
+        self.speed = DoubleVar(self, value=SIMULATION_SPEED)
+        self.extra_planets = StringVar(self, value='')
+        self.minor_bodies_count = IntVar(self, value=0)
+        self.minor_bodies_seed = MINOR_BODIES_SEED
 
         self.runner = None
+        self.simulation = self.worker = None
+        self.time = 0
+        self.frame = None
+        self.run_config = None
+        self.checkpoint_time = None
+        self.profile = BooleanVar(self, value=False)
+        self.profile_text = StringVar(self, value='')
+        self.frames_drawn = 0
         self.planets = self.objects_with_custom_accelerations = ()
         self.earth = self.mars = self.ship = self.sun = None
+        self.minor_bodies = None
         self.acceleration_settings_near_earth = []
         self.acceleration_settings_near_mars = []
         self.acceleration_settings_near_sun = []
-        self.file_to_write = None
+        self.telemetry = None
+        self.monitor = None
+        self.history = None
+        self.scrubbing = False
+        self.timeline = DoubleVar(self, value=0)
+        self.viewport = None
+        self.camera = StringVar(self, value=FREE_CAMERA)
+        self.drag_start = None
+        self.drift_threshold = DoubleVar(self, value=DRIFT_THRESHOLD)
+        self.drift_text = StringVar(self, value='')
+        self.scenarios = []
+        self.scenarios_text = StringVar(self, value='No scenarios to compare')
+        self.comparison = None
+        self.scenario_ships = []
+        self.scenario_states = []
         self.write_logs_to_file = BooleanVar(self, value=False)
+        self.telemetry_every = IntVar(self, value=TELEMETRY_EVERY)
         self.init_ui()
 
     def init_ui(self):
@@ -151,12 +126,79 @@ class Panel(Frame):
         self.start_velocity_widget = Entry(fr, textvariable=self.start_velocity)
         self.start_velocity_widget.pack(side=RIGHT)
 
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.speed_label = Label(fr, text='Simulated seconds per second')
+        self.speed_label.pack(side=LEFT)
+        self.speed_widget = Entry(fr, textvariable=self.speed)
+        self.speed_widget.pack(side=RIGHT)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.integrator_label = Label(fr, text='Integrator')
+        self.integrator_label.pack(side=LEFT)
+        self.integrator_widget = OptionMenu(fr, self.integrator, *sorted(INTEGRATORS))
+        self.integrator_widget.pack(side=RIGHT)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.relative_tolerance_label = Label(fr, text='Relative tolerance (adaptive)')
+        self.relative_tolerance_label.pack(side=LEFT)
+        self.relative_tolerance_widget = Entry(fr, textvariable=self.relative_tolerance)
+        self.relative_tolerance_widget.pack(side=RIGHT)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.trace_length_label = Label(fr, text='Trace length (0 - unlimited)')
+        self.trace_length_label.pack(side=LEFT)
+        self.trace_length_widget = Entry(fr, textvariable=self.trace_length)
+        self.trace_length_widget.pack(side=RIGHT)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.extra_planets_label = Label(fr, text='Extra planets')
+        self.extra_planets_label.pack(side=LEFT)
+        self.extra_planets_widget = Entry(fr, textvariable=self.extra_planets)
+        self.extra_planets_widget.pack(side=RIGHT)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.minor_bodies_label = Label(fr, text='Asteroids')
+        self.minor_bodies_label.pack(side=LEFT)
+        self.minor_bodies_widget = Entry(fr, textvariable=self.minor_bodies_count)
+        self.minor_bodies_widget.pack(side=RIGHT)
+
+        profile_button = Checkbutton(
+            self, text='Profile',
+            variable=self.profile,
+            command=self.toggle_profiling,
+        )
+        profile_button.pack()
+        self.profile_label = Label(self, textvariable=self.profile_text, justify=LEFT, font='TkFixedFont')
+        self.profile_label.pack(side=TOP)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.drift_threshold_label = Label(fr, text='Drift alarm (0 - off)')
+        self.drift_threshold_label.pack(side=LEFT)
+        self.drift_threshold_widget = Entry(fr, textvariable=self.drift_threshold)
+        self.drift_threshold_widget.pack(side=RIGHT)
+        self.drift_label = Label(self, textvariable=self.drift_text)
+        self.drift_label.pack(side=TOP)
+
         write_logs_to_file_button = Checkbutton(
             self, text='Write logs to file',
             variable=self.write_logs_to_file,
         )
         write_logs_to_file_button.pack()
 
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.telemetry_every_label = Label(fr, text='Log every N-th state')
+        self.telemetry_every_label.pack(side=LEFT)
+        self.telemetry_every_widget = Entry(fr, textvariable=self.telemetry_every)
+        self.telemetry_every_widget.pack(side=RIGHT)
+
         self.setup_true_anomaly_setting_fields()
 
         with_ship_button = Checkbutton(
@@ -179,6 +221,43 @@ class Panel(Frame):
         self.set_resume_button_state()
         self.resume_button.pack(side=TOP)
 
+        self.timeline_widget = Scale(
+            self, label='Timeline, days', variable=self.timeline, command=self.scrub,
+            orient=HORIZONTAL, from_=0, to=0, resolution=TIMELINE_RESOLUTION, length=300,
+        )
+        self.timeline_widget.pack(side=TOP)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        self.camera_label = Label(fr, text='Camera')
+        self.camera_label.pack(side=LEFT)
+        self.camera_widget = OptionMenu(fr, self.camera, FREE_CAMERA)
+        self.camera_widget.pack(side=LEFT)
+        reset_view_button = Button(fr, text='RESET VIEW', command=self.reset_view, bg='#aaddff')
+        reset_view_button.pack(side=RIGHT)
+        # wheel zooms at the cursor on Windows and macOS (MouseWheel) and X11 (buttons 4 and 5), drag pans
+        for sequence in ('<MouseWheel>', '<Button-4>', '<Button-5>'):
+            self.canvas.bind(sequence, self.zoom)
+        self.canvas.bind('<ButtonPress-1>', self.start_drag)
+        self.canvas.bind('<B1-Motion>', self.drag)
+        self.canvas.bind('<ButtonRelease-1>', lambda event: self.redraw_view())
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        add_scenario_button = Button(fr, text='ADD SCENARIO', command=self.add_scenario, bg='#aaddff')
+        add_scenario_button.pack(side=LEFT)
+        clear_scenarios_button = Button(fr, text='CLEAR SCENARIOS', command=self.clear_scenarios, bg='#aaddff')
+        clear_scenarios_button.pack(side=RIGHT)
+        self.scenarios_label = Label(self, textvariable=self.scenarios_text)
+        self.scenarios_label.pack(side=TOP)
+
+        fr = Frame(self)
+        fr.pack(side=TOP)
+        save_checkpoint_button = Button(fr, text='SAVE CHECKPOINT', command=self.save_checkpoint, bg='#aaddff')
+        save_checkpoint_button.pack(side=LEFT)
+        restore_checkpoint_button = Button(fr, text='RESTORE CHECKPOINT', command=self.restore_checkpoint, bg='#aaddff')
+        restore_checkpoint_button.pack(side=RIGHT)
+
         self.earth_acc_group = LabelFrame(self, text='Ship Acceleration settings near The Earth')
         self.earth_acc_group.pack(side=TOP)
         self.setup_ship_earth_acceleration_setting_fields()
@@ -210,7 +289,7 @@ class Panel(Frame):
         self.earth_true_anomaly_label.pack(side=LEFT)
         self.earth_true_anomaly_widget = Entry(fr1)
         self.earth_true_anomaly_widget.pack(side=RIGHT)
-        self.earth_true_anomaly_widget.insert(INSERT, 259)
+        self.earth_true_anomaly_widget.insert(INSERT, EARTH_TRUE_ANOMALY)
 
         fr2 = Frame(group)
         fr2.pack(side=TOP)
@@ -218,7 +297,7 @@ class Panel(Frame):
         self.mars_true_anomaly_label.pack(side=LEFT)
         self.mars_true_anomaly_widget = Entry(fr2)
         self.mars_true_anomaly_widget.pack(side=RIGHT)
-        self.mars_true_anomaly_widget.insert(INSERT, 244)
+        self.mars_true_anomaly_widget.insert(INSERT, MARS_TRUE_ANOMALY)
 
         fr3 = Frame(group)
         fr3.pack(side=TOP)
@@ -226,7 +305,7 @@ class Panel(Frame):
         self.ship_true_anomaly_label.pack(side=LEFT)
         self.ship_true_anomaly_widget = Entry(fr3)
         self.ship_true_anomaly_widget.pack(side=RIGHT)
-        self.ship_true_anomaly_widget.insert(INSERT, 260)
+        self.ship_true_anomaly_widget.insert(INSERT, SHIP_TRUE_ANOMALY)
 
     def setup_ship_earth_acceleration_setting_fields(self):
         self.fr_earth_acc = Frame(self.earth_acc_group)
@@ -337,106 +416,456 @@ class Panel(Frame):
             'ship_sun_a_config': [(float(d.get()), float(a.get())) for d, a in self.acceleration_settings_near_sun],
         }
 
-    def init_start_positions(self):
-        self.canvas.delete(ALL)
-        if self.runner is not None:
-            self.master.after_cancel(self.runner)
-
+    def get_config(self):
+        """get_bodies inputs of the panel fields, as kept in checkpoints."""
         try:
             velocity = self.start_velocity.get()
         except:
             velocity = None
-
-        configs = get_planet_configs(
-            int(self.canvas['width']),
-            int(self.canvas['height']),
-            velocity,
+        return dict(
+            ship_start_velocity=velocity,
             earth_true_anomaly=float(self.earth_true_anomaly_widget.get()),
             mars_true_anomaly=float(self.mars_true_anomaly_widget.get()),
             ship_true_anomaly=float(self.ship_true_anomaly_widget.get()),
+            with_ship=self.with_ship.get(),
+            extra_planets=[
+                name.capitalize() for name in self.extra_planets.get().replace(',', ' ').split()
+                if name.capitalize() in PLANET_CATALOG
+            ],
+            minor_bodies=self.minor_bodies_count.get(),
+            minor_bodies_seed=self.minor_bodies_seed,
             **self.get_acceleration_config()
         )
+
+    def set_config(self, config):
+        self.start_velocity.set(config['ship_start_velocity'] or 0)
+        for widget, name in (
+            (self.earth_true_anomaly_widget, 'earth_true_anomaly'),
+            (self.mars_true_anomaly_widget, 'mars_true_anomaly'),
+            (self.ship_true_anomaly_widget, 'ship_true_anomaly'),
+        ):
+            widget.delete(0, END)
+            widget.insert(INSERT, config[name])
+        self.with_ship.set(config['with_ship'])
+        self.extra_planets.set(' '.join(config.get('extra_planets', ())))
+        self.minor_bodies_count.set(config.get('minor_bodies', 0))
+        self.minor_bodies_seed = config.get('minor_bodies_seed', MINOR_BODIES_SEED)
+        for settings, name in (
+            (self.acceleration_settings_near_earth, 'ship_earth_a_config'),
+            (self.acceleration_settings_near_mars, 'ship_mars_a_config'),
+            (self.acceleration_settings_near_sun, 'ship_sun_a_config'),
+        ):
+            settings[:] = [(DoubleVar(value=d), DoubleVar(value=a)) for d, a in config[name]]
+        for frame, setup in (
+            (self.fr_earth_acc, self.setup_ship_earth_acceleration_setting_fields),
+            (self.fr_mars_acc, self.setup_ship_mars_acceleration_setting_fields),
+            (self.fr_sun_acc, self.setup_ship_sun_acceleration_setting_fields),
+        ):
+            frame.destroy()
+            setup()
+
+    def add_scenario(self):
+        """Keep the current ship settings to run alongside the next START."""
+        self.scenarios.append(self.get_config())
+        self.update_scenarios_text()
+
+    def clear_scenarios(self):
+        self.scenarios = []
+        self.update_scenarios_text()
+
+    def update_scenarios_text(self):
+        self.scenarios_text.set(', '.join(
+            '%s: %s m/s' % (SCENARIO_COLORS[i % len(SCENARIO_COLORS)], config['ship_start_velocity'])
+            for i, config in enumerate(self.scenarios)
+        ) or 'No scenarios to compare')
+
+    def start_comparison(self, scale):
+        """Overlay the ships of the added scenarios, integrated in worker processes."""
+        self.stop_comparison()
+        if not self.scenarios:
+            return
+        self.scenario_ships = []
+        for i, config in enumerate(self.scenarios):
+            ship_config = get_planet_configs(
+                int(self.canvas['width']),
+                int(self.canvas['height']),
+                **{
+                    name: value for name, value in config.items()
+                    if name not in BODY_SET_CONFIG
+                }
+            )['ship_config']
+            ship_config['color'] = SCENARIO_COLORS[i % len(SCENARIO_COLORS)]
+            self.scenario_ships.append(
+                Planet('Ship %s' % i, self.canvas, scale, trace_length=self.trace_length.get(), **ship_config)
+            )
+        self.scenario_states = [deque() for _ in self.scenarios]
+        self.comparison = Comparison(
+            self.scenarios, self.delta_t.get(), self.speed.get(),
+            delta_t=self.delta_t.get(),
+            integrator=self.simulation.integrator,
+            integrator_options=self.simulation.integrator_options,
+        )
+        self.comparison.start()
+
+    def stop_comparison(self):
+        if self.comparison is not None:
+            self.comparison.stop()
+            self.comparison = None
+        self.scenario_ships = []
+        self.scenario_states = []
+
+    def draw_comparison(self):
+        """Move every scenario ship to its latest state not after the main run's time."""
+        for states, items in zip(self.scenario_states, self.comparison.drain()):
+            states.extend(items)
+        for i, error in self.comparison.pop_errors():
+            # the other scenarios and the main run go on, the failed ship stays where it stopped
+            self.after_idle(lambda i=i, error=error: showerror(
+                'Scenario %s failed' % i, '%s: %s' % (type(error).__name__, error), parent=self,
+            ))
+        for states, ship in zip(self.scenario_states, self.scenario_ships):
+            state = None
+            while states and states[0][0] <= self.time:
+                time, state = states.popleft()
+            if state is not None:
+                x, v_x, y, v_y = state
+                ship.move(x, y)
+                ship.left_trace_dot(time)
+                ship.set_coordinates_and_velocity(x, v_x, y, v_y)
+
+    def init_start_positions(self, checkpoint=None):
+        self.canvas.delete(ALL)
+        if self.runner is not None:
+            self.master.after_cancel(self.runner)
+        if self.worker is not None:
+            self.worker.stop()
+            self.worker.join()
+        self.stop_comparison()
+
+        self.run_config = self.get_config()
+        configs = get_planet_configs(
+            int(self.canvas['width']),
+            int(self.canvas['height']),
+            **{
+                name: value for name, value in self.run_config.items()
+                if name not in BODY_SET_CONFIG
+            }
+        )
         scale = configs['scale']
+        trace_length = self.trace_length.get()
 
-        self.earth = Planet('Earth', self.canvas, scale, **configs['earth_config'])
-        self.mars = Planet('Mars', self.canvas, scale, **configs['mars_config'])
+        self.earth = Planet('Earth', self.canvas, scale, trace_length=trace_length, **configs['earth_config'])
+        self.mars = Planet('Mars', self.canvas, scale, trace_length=trace_length, **configs['mars_config'])
 
         self.planets = (
             self.earth,
             self.mars,
+        ) + tuple(
+            Planet(name, self.canvas, scale, trace_length=trace_length, **config)
+            for name, config in zip(
+                self.run_config['extra_planets'],
+                get_catalog_configs(self.run_config['extra_planets'], configs['sun_config']['orbit_center']),
+            )
         )
-        if self.with_ship.get():
-            self.ship = Planet('Ship', self.canvas, scale, **configs['ship_config'])
+        if self.run_config['with_ship']:
+            self.ship = Planet('Ship', self.canvas, scale, trace_length=trace_length, **configs['ship_config'])
             self.objects_with_custom_accelerations = (self.ship,)
         else:
             self.ship, self.objects_with_custom_accelerations = None, ()
 
         self.sun = Planet('Sun', self.canvas, scale, **configs['sun_config'])
-
-        if self.file_to_write:
-            self.file_to_write.close()
-            self.file_to_write = None
+        integrator = self.integrator.get()
+        self.simulation = Simulation(
+            self.sun, self.planets, self.objects_with_custom_accelerations,
+            delta_t=self.delta_t.get(),
+            integrator=integrator,
+            minor_state=get_minor_bodies_state(
+                self.run_config['minor_bodies'], self.run_config['minor_bodies_seed'],
+            ) if self.run_config['minor_bodies'] else None,
+            **(dict(rtol=self.relative_tolerance.get()) if INTEGRATORS[integrator].adaptive else {})
+        )
+        self.time = 0
+        if checkpoint is not None:
+            self.simulation.restore(checkpoint['time'], checkpoint['state'])
+            self.time = checkpoint['time']
+            for (x, v_x, y, v_y), p in zip(checkpoint['state'], self.simulation.bodies):
+                p.move(x, y)
+                p.set_coordinates_and_velocity(x, v_x, y, v_y)
+        self.viewport = Viewport(int(self.canvas['width']), int(self.canvas['height']), scale)
+        self.set_camera_options([self.sun.name] + [body.name for body in self.simulation.bodies])
+        self.minor_bodies = MinorBodies(
+            self.canvas, scale, configs['sun_config']['orbit_center'], self.simulation.minor_state,
+        ) if self.run_config['minor_bodies'] else None
+        self.monitor = ConservationMonitor(
+            get_planet_masses(self.simulation), self.sun.mass,
+            every=DRIFT_CHECK_FRAMES, threshold=self.drift_threshold.get(),
+        )
+        self.monitor.reset(self.simulation.state)
+        self.frame = self.time, self.simulation.state.copy()
+        self.history = TrajectoryHistory((len(self.simulation.bodies), 4))
+        self.history.append(self.time, self.simulation.state[:len(self.simulation.bodies)])
+        self.scrubbing = False
+        self.checkpoint_time = wall_clock.monotonic()
+        PROFILER.disable()
+        if self.profile.get():
+            PROFILER.enable()
+            PROFILER.instrument(self.simulation.stepper)
+        self.worker = SimulationThread(self.simulation, self.delta_t.get(), self.speed.get())
+        self.worker.start()
+        if checkpoint is None:
+            self.start_comparison(scale)
+
+        self.close_telemetry()
         if self.objects_with_custom_accelerations and self.write_logs_to_file.get():
-            file_name_prefix = '%s/%s' % (RESULT_DIRECTORY, FILE_NAME_PREFIX)
-            files_count = len([
-                name for name in os.listdir(RESULT_DIRECTORY)
-                if os.path.isfile('%s/%s' % (RESULT_DIRECTORY, name)) and FILE_NAME_PREFIX in name
+            directories_count = len([
+                name for name in os.listdir(RESULT_DIRECTORY) if name.startswith(TELEMETRY_PREFIX)
             ])
-            file_name = '%s%s.txt' % (file_name_prefix, ' (%s)' % files_count if files_count else '')
-            if self.file_to_write:
-                self.file_to_write.close()
-            self.file_to_write = open(file_name, 'w')
-            self.file_to_write.write(
-                'Time\tVelocity Ship-Sun\tVelocity Ship-Sun X\tVelocity Ship-Sun Y\t'
-                'Distance Ship-Sun\tVelocity Ship-Earth\t'
-                'Distance Ship-Earth\tVelocity Ship-Mars\tDistance Ship-Mars\n'
+            self.telemetry = TelemetryWriter(
+                os.path.join(
+                    RESULT_DIRECTORY,
+                    '%s%s' % (TELEMETRY_PREFIX, ' (%s)' % directories_count if directories_count else ''),
+                ),
+                get_telemetry_columns([planet.name for planet in self.planets]),
+                every=self.telemetry_every.get(),
             )
-        self.time = 0
         self.resume_running()
 
-    def run_system(self, sun, planets, objects_with_custom_accelerations):
-        results = iter(get_get_new_positions(
-            sun,
-            planets=planets,
-            delta_t=self.delta_t.get(),
-            objects_with_custom_accelerations=objects_with_custom_accelerations,
-        ))
-        for (x, v_x, y, v_y), p in zip(chunkinate_iterable(results, 4),
-                                       chain(planets, objects_with_custom_accelerations)):
+    def run_system(self):
+        if self.worker.error is not None:
+            return self.fail_run(self.worker.error)
+        self.worker.interval = self.delta_t.get()
+        if self.speed.get() != self.worker.speed:
+            self.worker.set_speed(self.speed.get())
+            if self.comparison:
+                self.comparison.set_clock(self.time, self.speed.get())
+        with PROFILER.phase('drain'):
+            frames = self.worker.drain()
+        if self.telemetry and frames:
+            with PROFILER.phase('telemetry'):
+                times, states = zip(*frames)
+                self.telemetry.extend(get_ship_telemetry(times, states, len(self.planets), len(self.planets)))
+        if frames:
+            with PROFILER.phase('history'):
+                times, states = zip(*frames)
+                bodies = len(self.simulation.bodies)
+                self.history.extend(times, np.stack([state[:bodies] for state in states]))
+                self.update_timeline()
+            self.frame = frames[-1]
+            self.time, state = self.frame
+            with PROFILER.phase('draw'):
+                for (x, v_x, y, v_y), p in zip(state, self.simulation.bodies):
+                    p.move(x, y)
+                    p.left_trace_dot(self.time)
+                    p.set_coordinates_and_velocity(x, v_x, y, v_y)
+                if self.minor_bodies:
+                    self.minor_bodies.move(state[len(self.simulation.bodies):])
+                if self.comparison:
+                    self.draw_comparison()
+                if self.camera.get() != FREE_CAMERA:
+                    self.apply_view()
+            with PROFILER.phase('drift'):
+                self.update_drift(state)
+            if wall_clock.monotonic() - self.checkpoint_time > CHECKPOINT_INTERVAL:
+                with PROFILER.phase('checkpoint'):
+                    self.write_checkpoint(CHECKPOINT_FILE, self.time, state)
+        self.frames_drawn += 1
+        if PROFILER.enabled and self.frames_drawn % PROFILE_REFRESH_FRAMES == 0:
+            self.update_profile()
+        self.runner = self.master.after(ANIMATION_T, self.run_system)
+        self.set_stop_button_state()
+
+    def update_timeline(self):
+        first, last = self.history.span
+        self.timeline_widget.configure(from_=first / DAY, to=last / DAY)
+        self.timeline.set(last / DAY)
+
+    def scrub(self, value):
+        """Show the kept state nearest to the timeline position, pausing the run."""
+        # reconfiguring the range while live calls back with the live end too
+        if self.history is None or (
+            not self.scrubbing and abs(float(value) * DAY - self.history.span[1]) < TIMELINE_RESOLUTION * DAY
+        ):
+            return
+        if not self.scrubbing:
+            self.stop_running()
+            self.scrubbing = True
+        self.show_history(float(value) * DAY)
+
+    def show_history(self, time):
+        self.time, state = self.history.at(time)
+        for (x, v_x, y, v_y), p in zip(state, self.simulation.bodies):
             p.move(x, y)
-            p.left_trace_dot()
             p.set_coordinates_and_velocity(x, v_x, y, v_y)
-        self.time += self.delta_t.get()
-        if objects_with_custom_accelerations and self.write_logs_to_file.get():
-            ship, = objects_with_custom_accelerations
-            to_file_data = '%s\t%s\t%s\t%s\t%s\t' % (
-                self.time, math.sqrt(ship.v_x ** 2 + ship.v_y ** 2),
-                ship.v_x, ship.v_y, math.sqrt(ship.x ** 2 + ship.y ** 2),
-            )
-            for p in planets:
-                rel_v_x = ship.v_x - p.v_x
-                rel_v_y = ship.v_y - p.v_y
-                rel_x = ship.x - p.x
-                rel_y = ship.y - p.y
-                to_file_data += '%s\t%s\t' % (
-                    math.sqrt(rel_v_x ** 2 + rel_v_y ** 2),
-                    math.sqrt(rel_x ** 2 + rel_y ** 2),
-                )
-            to_file_data += '\n'
-            self.file_to_write.write(to_file_data)
-        self.runner = self.master.after(
-            ANIMATION_T,
-            lambda: self.run_system(sun, planets, objects_with_custom_accelerations),
+        self.apply_view()
+        self.draw_traces()
+
+    def set_camera_options(self, names):
+        menu = self.camera_widget['menu']
+        menu.delete(0, END)
+        for name in [FREE_CAMERA] + names:
+            menu.add_command(label=name, command=lambda name=name: self.set_camera(name))
+        self.camera.set(FREE_CAMERA)
+
+    def set_camera(self, name):
+        self.camera.set(name)
+        self.redraw_view()
+
+    def zoom(self, event):
+        if self.viewport is None:
+            return
+        factor = ZOOM_STEP if event.num == 4 or event.delta > 0 else 1 / ZOOM_STEP
+        self.viewport.zoom_at(factor, event.x, event.y)
+        self.redraw_view()
+
+    def start_drag(self, event):
+        self.drag_start = event.x, event.y
+
+    def drag(self, event):
+        if self.viewport is None or self.drag_start is None:
+            return
+        self.viewport.pan(event.x - self.drag_start[0], event.y - self.drag_start[1])
+        self.drag_start = event.x, event.y
+        self.camera.set(FREE_CAMERA)
+        self.apply_view()
+
+    def reset_view(self):
+        if self.viewport is None:
+            return
+        self.viewport.reset()
+        self.camera.set(FREE_CAMERA)
+        self.redraw_view()
+
+    def apply_view(self):
+        """Center the camera body if any and move everything drawn to the viewport."""
+        camera = self.camera.get()
+        for body in (self.sun,) + self.simulation.bodies:
+            if body.name == camera:
+                self.viewport.center = (body.x, body.y)
+        orbit_center = self.viewport.orbit_center
+        for p in (self.sun,) + self.simulation.bodies + tuple(self.scenario_ships):
+            p.set_view(self.viewport.scale, orbit_center)
+        if self.minor_bodies:
+            self.minor_bodies.set_view(self.viewport.scale, orbit_center)
+
+    def redraw_view(self):
+        """Apply the viewport and redraw the traces from the history at its level of detail."""
+        if self.viewport is None:
+            return
+        self.apply_view()
+        self.draw_traces()
+
+    def draw_traces(self):
+        """
+        Traces up to the shown time from the history, culled to the viewport.
+
+        The level of detail is the finest one with at most trace length
+        samples seen, so zooming into a flyby brings back its full detail.
+        """
+        bounds = self.viewport.get_bounds()
+        _, states = self.history.samples(
+            self.history.span[0], self.time, self.trace_length.get() or self.history.levels[0].size,
+            counted=lambda states: get_inside(states[..., X], states[..., Y], bounds).any(axis=-1),
         )
+        for i, p in enumerate(self.simulation.bodies):
+            p.set_trace(get_visible_runs(states[:, i, X], states[:, i, Y], bounds), self.time)
+
+    def update_drift(self, state):
+        self.monitor.threshold = self.drift_threshold.get()
+        self.monitor.check(state)
+        self.drift_text.set(self.monitor.format())
+        self.drift_label.configure(fg='red' if self.monitor.alarm else 'black')
+
+    def toggle_profiling(self):
+        if self.profile.get():
+            PROFILER.enable()
+            if self.simulation is not None:
+                PROFILER.instrument(self.simulation.stepper)
+        else:
+            PROFILER.disable()
+            self.profile_text.set('')
+
+    def update_profile(self):
+        PROFILER.count('canvas items', len(self.canvas.find_all()))
+        PROFILER.count('trace points', sum(len(p.trace_points) for p in self.simulation.bodies))
+        PROFILER.count('queued states', self.worker.states.qsize())
+        self.profile_text.set(PROFILER.format())
+
+    def write_checkpoint(self, path, time, state):
+        save_checkpoint(path, dict(get_checkpoint(self.simulation, self.run_config), time=time, state=state))
+        self.checkpoint_time = wall_clock.monotonic()
+
+    def save_checkpoint(self):
+        if self.simulation is None:
+            return
+        path = asksaveasfilename(
+            initialdir=RESULT_DIRECTORY, defaultextension='.npz', filetypes=[('Checkpoints', '*.npz')],
+        )
+        if path:
+            self.write_checkpoint(path, *self.drawn_state())
+
+    def drawn_state(self):
+        """
+        (time, full state) of the picture: the last drawn frame, or the scrubbed moment.
+
+        The history has no asteroids, so with them a scrubbed view saves the last frame.
+        """
+        if self.scrubbing and not self.minor_bodies:
+            return self.time, np.array([(p.x, p.v_x, p.y, p.v_y) for p in self.simulation.bodies])
+        return self.frame
+
+    def restore_checkpoint(self):
+        path = askopenfilename(initialdir=RESULT_DIRECTORY, filetypes=[('Checkpoints', '*.npz')])
+        if not path:
+            return
+        checkpoint = load_checkpoint(path)
+        self.set_config(checkpoint['config'])
+        self.delta_t.set(checkpoint['delta_t'])
+        self.integrator.set(checkpoint['integrator'])
+        if 'rtol' in checkpoint['integrator_options']:
+            self.relative_tolerance.set(checkpoint['integrator_options']['rtol'])
+        self.init_start_positions(checkpoint)
+
+    def close_telemetry(self):
+        if self.telemetry:
+            self.telemetry.close()
+            self.telemetry = None
+
+    def quit(self):
+        self.close_telemetry()
+        self.stop_comparison()
+        super().quit()
+
+    def fail_run(self, error):
+        """Stop the run its thread gave up on and tell why; START begins a new one."""
+        self.stop_running()
+        self.worker = self.runner = None
+        self.resume_button.configure(state=DISABLED)
         self.set_stop_button_state()
+        showerror('Simulation failed', '%s: %s' % (type(error).__name__, error), parent=self)
 
     def stop_running(self):
         self.set_resume_button_state()
+        if self.worker is not None:
+            self.worker.pause()
+        if self.comparison is not None:
+            self.comparison.pause()
         if self.runner is not None:
             self.master.after_cancel(self.runner)
 
     def resume_running(self):
-        self.run_system(self.sun, self.planets, self.objects_with_custom_accelerations)
+        if self.worker is None:
+            return
+        if self.runner is not None:
+            self.master.after_cancel(self.runner)
+        if self.scrubbing:
+            # back to the live run
+            self.scrubbing = False
+            self.show_history(self.history.span[1])
+            self.timeline.set(self.time / DAY)
+        self.worker.resume()
+        if self.comparison is not None:
+            self.comparison.resume(self.time, self.speed.get())
+        self.run_system()
 
     def toggle_with_ship(self):
         print('With ship: %s' % self.with_ship.get())
@@ -466,3 +895,5 @@ class Gui:
 
         self.panel = Panel(self.canvas, root, width=self.panel_width, height=self.canvas_height, padding=10)
         self.panel.grid(row=0, column=1)
+        # closing the window must flush the telemetry and stop the workers like Quit
+        self.root.protocol('WM_DELETE_WINDOW', self.panel.quit)
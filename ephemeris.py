@@ -0,0 +1,261 @@
+import hashlib
+import os.path
+import numpy as np
+
+from collections import OrderedDict
+from functools import partial
+
+from runner import INTEGRATORS, DerivativeBuffers, get_derivatives, get_system_stepper, update_thrust
+from simulation import DELTA_T, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, Ensemble, get_bodies, get_ships
+from thrust import ThrustTable
+
+
+EPHEMERIS_CACHE_SIZE = 16
+EPHEMERIS_FILE_PREFIX = 'ephemeris_'
+
+
+class Ephemeris:
+    """
+    Planet states sampled every delta_t * save_every seconds from time 0 on.
+
+    In between samples positions and velocities are cubic Hermite
+    interpolated from the sampled state derivatives. Asking for a
+    time past the last sample integrates the planets further.
+    """
+
+    def __init__(self, sun, planets, delta_t=DELTA_T, save_every=1, integrator='rk4', states=None):
+        self.names = [planet.name for planet in planets]
+        self.masses = np.array([planet.mass for planet in planets], dtype=float)
+        self.sun_mass = sun.mass
+        self.interval = delta_t * save_every
+        self.stepper = get_system_stepper(sun, planets, delta_t, integrator=integrator)
+        self.count = 0
+        self.states = np.empty((64,) + self.stepper.state.shape)
+        self.derivatives = np.empty_like(self.states)
+        self.buffers = DerivativeBuffers(len(planets), len(planets))
+        for state in (self.stepper.state[np.newaxis] if states is None else states):
+            self.append(state)
+        self.stepper.state[...] = self.states[self.count - 1]
+        self.stepper.time = self.end
+        self.extend(self.interval)
+
+    @property
+    def end(self):
+        return (self.count - 1) * self.interval
+
+    def append(self, state):
+        if self.count == len(self.states):
+            self.states = np.concatenate([self.states, np.empty_like(self.states)])
+            self.derivatives = np.concatenate([self.derivatives, np.empty_like(self.derivatives)])
+        self.states[self.count] = state
+        get_derivatives(state, self.masses, self.sun_mass, out=self.derivatives[self.count], buffers=self.buffers)
+        self.derivatives[self.count] *= self.interval
+        self.count += 1
+
+    def extend(self, until):
+        while self.end < until:
+            self.append(self.stepper.advance(self.count * self.interval))
+
+    def __call__(self, time, out=None):
+        """(P, 4) planet state at time."""
+        if time < 0:
+            raise ValueError('Ephemeris starts at 0, asked for %s' % time)
+        self.extend(time)
+        i = min(int(time / self.interval), self.count - 2)
+        s = time / self.interval - i
+        s2 = s * s
+        s3 = s2 * s
+        out = np.empty(self.states.shape[1:]) if out is None else out
+        np.multiply(self.states[i], 2 * s3 - 3 * s2 + 1, out=out)
+        out += (s3 - 2 * s2 + s) * self.derivatives[i]
+        out += (3 * s2 - 2 * s3) * self.states[i + 1]
+        out += (s3 - s2) * self.derivatives[i + 1]
+        return out
+
+
+class EphemerisCache:
+    """
+    LRU cache of Ephemeris by Earth and Mars true anomaly, delta_t and integrator.
+
+    With a directory, sampled states are also saved there and loaded back
+    by later processes.
+    """
+
+    def __init__(self, max_entries=EPHEMERIS_CACHE_SIZE, directory=None, save_every=1):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.save_every = save_every
+        self.entries = OrderedDict()
+
+    def get_path(self, key):
+        return os.path.join(
+            self.directory,
+            '%s%s.npy' % (EPHEMERIS_FILE_PREFIX, hashlib.sha1(repr(key).encode()).hexdigest()),
+        )
+
+    def get(self, earth_true_anomaly, mars_true_anomaly, delta_t=DELTA_T, integrator='rk4', duration=None):
+        """Ephemeris for the inputs, covering duration seconds if given."""
+        key = (float(earth_true_anomaly), float(mars_true_anomaly), float(delta_t), integrator, self.save_every)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            ephemeris = self.entries[key]
+        else:
+            sun, planets, _ = get_bodies(
+                earth_true_anomaly=earth_true_anomaly,
+                mars_true_anomaly=mars_true_anomaly,
+                with_ship=False,
+            )
+            states = None
+            if self.directory and os.path.exists(self.get_path(key)):
+                states = np.load(self.get_path(key))
+            ephemeris = self.entries[key] = Ephemeris(
+                sun, planets, delta_t, save_every=self.save_every, integrator=integrator, states=states,
+            )
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+        if duration is not None and ephemeris.end < duration:
+            ephemeris.extend(duration)
+            if self.directory:
+                if not os.path.exists(self.directory):
+                    os.makedirs(self.directory)
+                # workers share the directory, so never let one load a half written file
+                path = self.get_path(key)
+                partial_path = '%s.%s.partial' % (path, os.getpid())
+                with open(partial_path, 'wb') as f:
+                    np.save(f, ephemeris.states[:ephemeris.count])
+                os.replace(partial_path, path)
+        return ephemeris
+
+
+EPHEMERIS_CACHE = EphemerisCache()
+
+
+class ShipsOnEphemeris:
+    """
+    Right-hand side of massless ships moving among planets looked up from an Ephemeris.
+
+    Planet rows are filled from the ephemeris at the asked time ahead of the
+    ship rows, so the N-body derivatives and thrust rules apply unchanged.
+    """
+
+    def __init__(self, sun, ephemeris, ships_count, ships_a_configs):
+        planets_count = len(ephemeris.names)
+        self.ephemeris = ephemeris
+        self.planets_count = planets_count
+        self.full_state = np.empty((planets_count + ships_count, 4))
+        self.full_derivatives = np.empty_like(self.full_state)
+        self.planets_time = None
+        self.thrust = (np.zeros(len(self.full_state)), np.full(len(self.full_state), len(self.full_state)))
+        self.get_derivatives = partial(
+            get_derivatives, masses=ephemeris.masses, sun_mass=sun.mass, thrust=self.thrust,
+            buffers=DerivativeBuffers(len(self.full_state), planets_count),
+        )
+        self.update_thrust = partial(
+            update_thrust,
+            rule_rows=np.append(np.arange(planets_count), len(self.full_state)),
+            thrusting=np.arange(planets_count, len(self.full_state)),
+            table=ThrustTable(ships_a_configs),
+            thrust=self.thrust,
+        )
+
+    def fill(self, state, time):
+        if time != self.planets_time:
+            self.ephemeris(time, out=self.full_state[:self.planets_count])
+            self.planets_time = time
+        self.full_state[self.planets_count:] = state
+        return self.full_state
+
+    def derivatives(self, state, out, time):
+        self.get_derivatives(self.fill(state, time), out=self.full_derivatives)
+        out[...] = self.full_derivatives[self.planets_count:]
+        return out
+
+    def before_step(self, state, time):
+        return self.update_thrust(self.fill(state, time))
+
+
+def get_ephemeris_stepper(
+    sun, ephemeris, ships_state, ships_a_configs, delta_t, integrator='rk4', **integrator_options
+):
+    """Stepper of M massless ships given as an (M, 4) state; planets come from the ephemeris."""
+    ships_state = np.asarray(ships_state, dtype=float).reshape(-1, 4)
+    rhs = ShipsOnEphemeris(sun, ephemeris, len(ships_state), ships_a_configs)
+    return INTEGRATORS[integrator](
+        rhs.derivatives, ships_state, delta_t, before_step=rhs.before_step, **integrator_options
+    )
+
+
+class EphemerisEnsemble(Ensemble):
+    """
+    Ensemble integrating only the ships; planets are looked up from an Ephemeris.
+
+    state composes the planets at the current time with the ships, as in Ensemble.
+    """
+
+    def __init__(
+        self, sun, planets, ephemeris, ships_state, ships_a_configs, delta_t=DELTA_T,
+        integrator='rk4', **integrator_options
+    ):
+        self.sun = sun
+        self.planets = self.bodies = tuple(planets)
+        self.objects_with_custom_accelerations = ()
+        self.integrator = integrator
+        self.integrator_options = integrator_options
+        self.sample_interval = delta_t
+        self.ephemeris = ephemeris
+        self.stepper = get_ephemeris_stepper(
+            sun, ephemeris, ships_state, ships_a_configs, delta_t,
+            integrator=integrator, **integrator_options
+        )
+        self.full_state = np.empty((len(self.planets) + len(self.stepper.state), 4))
+
+    @property
+    def state(self):
+        self.ephemeris(self.time, out=self.full_state[:len(self.planets)])
+        self.full_state[len(self.planets):] = self.stepper.state
+        return self.full_state
+
+    @property
+    def ships_state(self):
+        return self.stepper.state
+
+    def restore(self, time, state):
+        self.stepper.reset(np.asarray(state)[len(self.planets):], time)
+
+    def derivatives(self, state, time):
+        state = np.array(state, dtype=float)
+        out = get_derivatives(state, self.ephemeris.masses, self.sun.mass)
+        self.stepper.derivatives(state[len(self.planets):], out=out[len(self.planets):], time=time)
+        return out
+
+
+def get_ephemeris_ensemble(
+    ships,
+    delta_t=DELTA_T,
+    earth_true_anomaly=EARTH_TRUE_ANOMALY,
+    mars_true_anomaly=MARS_TRUE_ANOMALY,
+    integrator='rk4',
+    integrator_options=None,
+    cache=EPHEMERIS_CACHE,
+    duration=None,
+):
+    """
+    Like simulation.get_ensemble, with the planets taken from the ephemeris cache.
+
+    Give the duration of the run to get the ephemeris covering it saved to
+    the cache directory up front.
+    """
+    ephemeris = cache.get(
+        earth_true_anomaly, mars_true_anomaly, delta_t=delta_t, integrator=integrator, duration=duration,
+    )
+    sun, planets, _ = get_bodies(
+        earth_true_anomaly=earth_true_anomaly,
+        mars_true_anomaly=mars_true_anomaly,
+        with_ship=False,
+    )
+    ships_state, ships_a_configs = get_ships(ships, earth_true_anomaly, mars_true_anomaly)
+    return EphemerisEnsemble(
+        sun, planets, ephemeris, ships_state, ships_a_configs, delta_t=delta_t,
+        integrator=integrator, **(integrator_options or {})
+    )
@@ -0,0 +1,156 @@
+import numpy as np
+
+from collections import namedtuple
+
+from scipy.optimize import brentq
+
+from runner import X, V_X, Y, V_Y
+
+
+EVENT_TIME_TOLERANCE = 1e-3  # seconds
+
+EventRecord = namedtuple('EventRecord', 'name time state')
+
+
+class Event:
+    """
+    Zero crossings of function(time, state) of the (N, 4) state.
+
+    direction 1 catches only rising crossings, -1 only falling ones and
+    0 both. A terminal event stops the run it happens in.
+    """
+
+    def __init__(self, name, function, direction=0, terminal=False):
+        self.name = name
+        self.function = function
+        self.direction = direction
+        self.terminal = terminal
+
+    def __call__(self, time, state):
+        return self.function(time, state)
+
+
+def get_relative_state(state, row, target=None):
+    """(x, v_x, y, v_y) of the body at row relative to the one at target, the sun if None."""
+    return state[row] if target is None else state[row] - state[target]
+
+
+def get_distance_event(name, row, target, radius, direction=0, terminal=False):
+    """Crossings of the sphere of radius around target by the body at row; entering is falling."""
+    def distance_over_radius(time, state):
+        relative = get_relative_state(state, row, target)
+        return np.hypot(relative[X], relative[Y]) - radius
+    return Event(name, distance_over_radius, direction, terminal)
+
+
+def get_closest_approach_event(name, row, target, terminal=False):
+    """Local minima of the distance between the bodies at row and target, where r . v turns positive."""
+    def radial_velocity(time, state):
+        relative = get_relative_state(state, row, target)
+        return relative[X] * relative[V_X] + relative[Y] * relative[V_Y]
+    return Event(name, radial_velocity, 1, terminal)
+
+
+def get_ship_events(names, ship='Ship', targets=('Earth', 'Mars', 'Sun'), radii=None, a_configs=None, terminal=()):
+    """
+    Events of the ship among the bodies of a simulation with the given names.
+
+    For every target there is a 'closest <target>' approach, and given
+    radii[target] an 'enter <target>' and 'exit <target>' event of that
+    sphere. a_configs[target] tables add a '<target> band <distance>'
+    crossing for every band. Events named in terminal stop the run.
+    """
+    radii, a_configs = radii or {}, a_configs or {}
+    row = names.index(ship)
+    events = []
+    for target in targets:
+        target_row = None if target == 'Sun' else names.index(target)
+        events.append(get_closest_approach_event('closest %s' % target, row, target_row))
+        if target in radii:
+            events.append(get_distance_event('enter %s' % target, row, target_row, radii[target], -1))
+            events.append(get_distance_event('exit %s' % target, row, target_row, radii[target], 1))
+        for distance, _ in a_configs.get(target, ()):
+            events.append(get_distance_event('%s band %g' % (target, distance), row, target_row, distance))
+    for event in events:
+        event.terminal = event.name in terminal
+    return events
+
+
+def hermite(time, time0, state0, derivatives0, time1, state1, derivatives1):
+    """Cubic Hermite interpolation of the state between two steps."""
+    h = time1 - time0
+    s = (time - time0) / h
+    s2 = s * s
+    s3 = s2 * s
+    return (
+        (2 * s3 - 3 * s2 + 1) * state0 + (s3 - 2 * s2 + s) * h * derivatives0
+        + (3 * s2 - 2 * s3) * state1 + (s3 - s2) * h * derivatives1
+    )
+
+
+class EventDetector:
+    """
+    Finds the events of a run between consecutive steps.
+
+    Crossings are located by Brent's method on the cubic Hermite
+    interpolant of the step, so they cost two extra right-hand side
+    evaluations per step containing any. records holds all the events
+    found, in time order within every step; stopped the terminal one
+    the last check stopped at.
+    """
+
+    def __init__(self, events, time_tolerance=EVENT_TIME_TOLERANCE):
+        self.events = list(events)
+        self.time_tolerance = time_tolerance
+        self.records = []
+        self.values = None
+        self.stopped = None
+
+    def evaluate(self, time, state):
+        return np.array([event(time, state) for event in self.events], dtype=float)
+
+    def start(self, time, state):
+        self.values = self.evaluate(time, state)
+
+    def check(self, time0, state0, time1, state1, derivatives):
+        """
+        Record the events between two steps and return the first terminal one, if any.
+
+        derivatives(state, time) gives the (N, 4) time derivative of a state.
+        """
+        self.stopped = None
+        if self.values is None:
+            self.start(time0, state0)
+        values = self.evaluate(time1, state1)
+        rising = (self.values < 0) & (values >= 0)
+        falling = (self.values > 0) & (values <= 0)
+        crossed = [
+            i for i, event in enumerate(self.events)
+            if (rising[i] and event.direction >= 0) or (falling[i] and event.direction <= 0)
+        ]
+        self.values = values
+        if not crossed:
+            return None
+
+        derivatives0, derivatives1 = derivatives(state0, time0), derivatives(state1, time1)
+
+        def interpolate(time):
+            return hermite(time, time0, state0, derivatives0, time1, state1, derivatives1)
+
+        records = []
+        for i in crossed:
+            event = self.events[i]
+            time = brentq(
+                lambda time: event(time, interpolate(time)), time0, time1, xtol=self.time_tolerance,
+            ) if event(time0, state0) * event(time1, state1) < 0 else time1
+            records.append((time, i))
+        records.sort()
+        for time, i in records:
+            self.records.append(EventRecord(self.events[i].name, time, interpolate(time)))
+            if self.events[i].terminal:
+                # the run continues from here, so don't catch the same crossing again
+                self.values = self.evaluate(time, self.records[-1].state)
+                self.values[i] = 0
+                self.stopped = self.records[-1]
+                return self.stopped
+        return None
@@ -0,0 +1,303 @@
+import argparse
+import os
+import os.path
+import subprocess
+import numpy as np
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from catalog import PLANET_CATALOG
+from runner import INTEGRATORS, X, Y
+from simulation import (
+    DELTA_T, START_VELOCITY, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, SHIP_TRUE_ANOMALY,
+    get_planet_configs, get_simulation, parse_a_config,
+)
+
+
+FRAMES_PER_SECOND = 30
+FRAME_WIDTH, FRAME_HEIGHT = 1280, 720  # pixels
+FRAME_DPI = 100
+FRAMES_PER_JOB = 30
+TRAIL_FRAMES = 120
+EXTENT_MARGIN = 1.2
+VIDEO_EXTENSIONS = ('.mp4', '.mkv', '.mov', '.avi', '.webm')
+FRAME_FILE_NAME = 'frame_%06d.png'
+REFERENCE_HEIGHT = 720  # pixels, frames this tall draw bodies at their canvas radii
+DAY = 24 * 3600
+
+# worker process state set up by init_renderer
+renderer = None
+
+
+def get_body_styles(names, scale=1):
+    """(color, marker diameter in pixels) of every planet or ship name, scale times their canvas size."""
+    configs = get_planet_configs(0, 0, 0, 0, 0, 0)
+    known = dict(
+        Sun=configs['sun_config'], Earth=configs['earth_config'], Mars=configs['mars_config'],
+        Ship=configs['ship_config'], **PLANET_CATALOG
+    )
+    styles = []
+    for name in names:
+        if name in known:
+            styles.append((known[name]['color'], 2 * scale * known[name]['planet_r']))
+        else:
+            styles.append((known['Ship']['color'], 2 * scale * known['Ship']['planet_r']))
+    return styles
+
+
+def get_bodies_count(names):
+    """Number of planets and ships, the rows before the asteroids."""
+    return len(names) - sum(name.startswith('Asteroid') for name in names)
+
+
+class Renderer:
+    """
+    A matplotlib Agg figure reused for every frame.
+
+    Planets and ships are drawn with their trails, asteroids as bare points.
+    """
+
+    def __init__(self, names, extent, width=FRAME_WIDTH, height=FRAME_HEIGHT, dpi=FRAME_DPI):
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+        self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi, facecolor='black')
+        self.canvas = FigureCanvasAgg(self.figure)
+        axes = self.figure.add_axes([0, 0, 1, 1], facecolor='black')
+        # extent fits the shorter side, the axes fill the figure at equal scales
+        axes.set_xlim(-extent * max(width / height, 1), extent * max(width / height, 1))
+        extent *= max(height / width, 1)
+        axes.set_ylim(-extent, extent)
+        axes.set_axis_off()
+        self.bodies = get_bodies_count(names)
+        # marker sizes are in points
+        scale = min(width, height) / REFERENCE_HEIGHT * 72 / dpi
+        styles = get_body_styles(names[:self.bodies], scale)
+        sun_color, sun_size = get_body_styles(['Sun'], scale)[0]
+        axes.plot([0], [0], 'o', color=sun_color, markersize=sun_size)
+        # Tk canvas y grows downwards, keep the same picture
+        axes.invert_yaxis()
+        self.trails = [axes.plot([], [], '-', color=color, linewidth=0.8)[0] for color, _ in styles]
+        self.dots = [axes.plot([], [], 'o', color=color, markersize=size)[0] for color, size in styles]
+        self.minor = axes.plot([], [], '.', color='gray', markersize=1)[0]
+        self.label = axes.text(0.01, 0.98, '', color='white', transform=axes.transAxes, va='top')
+
+    def render(self, time, trail, minor_state=None):
+        """RGB bytes of the frame at time; trail is the (T, N, 4) planet and ship history ending at it."""
+        for i, (line, dot) in enumerate(zip(self.trails, self.dots)):
+            line.set_data(trail[:, i, X], trail[:, i, Y])
+            dot.set_data(trail[-1:, i, X], trail[-1:, i, Y])
+        if minor_state is not None:
+            self.minor.set_data(minor_state[:, X], minor_state[:, Y])
+        self.label.set_text('day %.0f' % (time / DAY))
+        self.canvas.draw()
+        return np.asarray(self.canvas.buffer_rgba())[..., :3].tobytes()
+
+
+def init_renderer(names, extent, width, height, dpi):
+    global renderer
+    renderer = Renderer(names, extent, width, height, dpi)
+
+
+def render_job(job):
+    """
+    Render the frames of one job and return their RGB bytes, or None once written as PNGs.
+
+    job is (first frame index, times, states, history, minor states,
+    directory): states are the planet and ship rows, preceded by history
+    rows kept only for the trails, and minor states the asteroid rows of
+    the frames themselves, None without asteroids.
+    """
+    first, times, states, history, minor_states, directory = job
+    frames = []
+    for i, time in enumerate(times):
+        trail = states[max(0, history + i - TRAIL_FRAMES):history + i + 1]
+        frame = renderer.render(time, trail, None if minor_states is None else minor_states[i])
+        if directory is None:
+            frames.append(frame)
+        else:
+            from matplotlib.image import imsave
+            height, width = renderer.canvas.get_width_height()[::-1]
+            imsave(
+                os.path.join(directory, FRAME_FILE_NAME % (first + i)),
+                np.frombuffer(frame, dtype=np.uint8).reshape(height, width, 3),
+            )
+    return frames if directory is None else None
+
+
+def get_frame_states(simulation, duration, frames):
+    """(time, state) of frames evenly spaced over duration, integrated as they are consumed."""
+    save_every = duration / (frames - 1) / simulation.sample_interval
+    for times, states in simulation.stream(duration, save_every, chunk_size=FRAMES_PER_JOB):
+        yield from zip(times, states)
+
+
+def get_saved_frame_states(times, states, frames):
+    """(time, state) of frames evenly spaced over a saved run, taken at the nearest earlier sample."""
+    for time in np.linspace(times[0], times[-1], frames):
+        i = min(np.searchsorted(times, time, side='right') - 1, len(times) - 1)
+        yield times[i], states[i]
+
+
+def open_video(path, width, height, frames_per_second):
+    """ffmpeg process encoding the raw RGB frames written to its stdin, matplotlib's animation.ffmpeg_path."""
+    from matplotlib import rcParams
+    ffmpeg = rcParams['animation.ffmpeg_path']
+    try:
+        return subprocess.Popen([
+            ffmpeg, '-y', '-loglevel', 'error',
+            '-f', 'rawvideo', '-pix_fmt', 'rgb24', '-s', '%sx%s' % (width, height), '-r', str(frames_per_second),
+            '-i', '-', '-pix_fmt', 'yuv420p', path,
+        ], stdin=subprocess.PIPE)
+    except FileNotFoundError:
+        raise RuntimeError('%s not found, install ffmpeg or export PNG frames to a directory' % ffmpeg)
+
+
+def export(
+    frame_states,
+    names,
+    output,
+    extent,
+    width=FRAME_WIDTH,
+    height=FRAME_HEIGHT,
+    dpi=FRAME_DPI,
+    frames_per_second=FRAMES_PER_SECOND,
+    workers=None,
+    frames_per_job=FRAMES_PER_JOB,
+):
+    """
+    Render the (time, state) pairs of frame_states offscreen in a process pool.
+
+    output is a directory for numbered PNGs or a video file by its
+    extension, encoded by ffmpeg. frame_states is consumed while earlier
+    jobs render, with at most two jobs per worker in flight. Returns the
+    number of frames.
+    """
+    video = os.path.splitext(output)[1].lower() in VIDEO_EXTENSIONS
+    directory = None if video else output
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    encoder = open_video(output, width, height, frames_per_second) if video else None
+    workers = workers or os.cpu_count() or 1
+    bodies = get_bodies_count(names)
+    pending = deque()
+    history = deque(maxlen=TRAIL_FRAMES)
+    count = 0
+
+    def finish_oldest():
+        frames = pending.popleft().result()
+        if encoder is not None:
+            for frame in frames:
+                encoder.stdin.write(frame)
+
+    def submit(times, states):
+        # only the frames themselves draw the asteroids, the trails are planets and ships
+        body_states = [state[:bodies] for state in states]
+        job_states = np.array(list(history) + body_states)
+        minor_states = np.array([state[bodies:] for state in states]) if bodies < len(names) else None
+        pending.append(executor.submit(
+            render_job, (count, times, job_states, len(history), minor_states, directory),
+        ))
+        history.extend(body_states)
+        while len(pending) > 2 * workers:
+            finish_oldest()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_renderer, initargs=(names, extent, width, height, dpi)
+    ) as executor:
+        times, states = [], []
+        for time, state in frame_states:
+            times.append(time)
+            states.append(state)
+            if len(times) == frames_per_job:
+                submit(times, states)
+                count += len(times)
+                times, states = [], []
+        if times:
+            submit(times, states)
+            count += len(times)
+        while pending:
+            finish_oldest()
+    if encoder is not None:
+        encoder.stdin.close()
+        if encoder.wait():
+            raise RuntimeError('ffmpeg failed writing %s' % output)
+    return count
+
+
+def write_frames(args, names, initial_state, frame_states):
+    extent = args.extent or EXTENT_MARGIN * np.hypot(initial_state[:, X], initial_state[:, Y]).max()
+    frames = export(
+        frame_states,
+        names,
+        args.output,
+        extent,
+        width=args.width,
+        height=args.height,
+        frames_per_second=args.fps,
+        workers=args.workers,
+    )
+    print('Wrote %s frames to %s' % (frames, args.output))
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Render a headless run to PNG frames or a video offscreen.')
+    parser.add_argument('output', help='directory for PNG frames, or a %s file' % '/'.join(VIDEO_EXTENSIONS))
+    parser.add_argument('--input', help='trajectory .npz saved by simulation.py instead of a new run')
+    parser.add_argument('--duration', type=float, help='simulated time of a new run, seconds')
+    parser.add_argument('--seconds', type=float, default=10, help='length of the animation')
+    parser.add_argument('--fps', type=int, default=FRAMES_PER_SECOND)
+    parser.add_argument('--width', type=int, default=FRAME_WIDTH)
+    parser.add_argument('--height', type=int, default=FRAME_HEIGHT)
+    parser.add_argument('--extent', type=float, help='half width of the view, m; fits the initial orbits by default')
+    parser.add_argument('--workers', type=int, help='render processes, all CPUs by default')
+    parser.add_argument('--delta-t', type=float, default=DELTA_T)
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='rk4')
+    parser.add_argument('--start-velocity', type=float, default=START_VELOCITY)
+    parser.add_argument('--earth-true-anomaly', type=float, default=EARTH_TRUE_ANOMALY)
+    parser.add_argument('--mars-true-anomaly', type=float, default=MARS_TRUE_ANOMALY)
+    parser.add_argument('--ship-true-anomaly', type=float, default=SHIP_TRUE_ANOMALY)
+    parser.add_argument('--without-ship', action='store_true')
+    parser.add_argument('--extra-planets', nargs='*', default=[], choices=sorted(PLANET_CATALOG), metavar='PLANET')
+    parser.add_argument('--asteroids', type=int, default=0)
+    for body in ('earth', 'mars', 'sun'):
+        parser.add_argument(
+            '--%s-a-config' % body, type=parse_a_config, nargs='*', default=[],
+            metavar='DISTANCE:ACCELERATION',
+        )
+    return parser
+
+
+def run(args=None):
+    parser = get_argument_parser()
+    args = parser.parse_args(args)
+    frames = max(int(args.seconds * args.fps), 2)
+    if args.input:
+        saved = np.load(args.input)
+        names, initial_state = list(saved['names']), saved['states'][0]
+        frame_states = get_saved_frame_states(saved['times'], saved['states'], frames)
+        return write_frames(args, names, initial_state, frame_states)
+    if args.duration is None:
+        parser.error('--duration is required without --input')
+    simulation = get_simulation(
+        delta_t=args.delta_t,
+        integrator=args.integrator,
+        ship_start_velocity=args.start_velocity,
+        earth_true_anomaly=args.earth_true_anomaly,
+        mars_true_anomaly=args.mars_true_anomaly,
+        ship_true_anomaly=args.ship_true_anomaly,
+        ship_earth_a_config=args.earth_a_config,
+        ship_mars_a_config=args.mars_a_config,
+        ship_sun_a_config=args.sun_a_config,
+        with_ship=not args.without_ship,
+        extra_planets=args.extra_planets,
+        minor_bodies=args.asteroids,
+    )
+    return write_frames(args, simulation.names, simulation.state, get_frame_states(simulation, args.duration, frames))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,143 @@
+import numpy as np
+
+
+HISTORY_LEVEL_SIZE = 4096  # samples per level
+HISTORY_LEVELS = 16
+HISTORY_INITIAL_SIZE = 256
+
+
+class HistoryLevel:
+    """
+    Ring buffer of every stride-th sample, growing by doubling up to size samples.
+
+    Once full, the newest sample overwrites the oldest one.
+    """
+
+    def __init__(self, shape, stride, size, initial_size=HISTORY_INITIAL_SIZE):
+        self.stride = stride
+        self.size = size
+        capacity = min(initial_size, size)
+        self.times = np.empty(capacity)
+        self.states = np.empty((capacity,) + tuple(shape))
+        self.start = self.count = 0
+
+    def grow(self, needed):
+        capacity = len(self.times)
+        while capacity < min(needed, self.size):
+            capacity *= 2
+        capacity = min(capacity, self.size)
+        if capacity > len(self.times):
+            # never wrapped before reaching size, so the samples are in order
+            times, states = self.times, self.states
+            self.times = np.empty(capacity)
+            self.states = np.empty((capacity,) + states.shape[1:])
+            self.times[:self.count], self.states[:self.count] = times[:self.count], states[:self.count]
+
+    def extend(self, times, states):
+        times, states = times[-self.size:], states[-self.size:]
+        self.grow(self.count + len(times))
+        capacity = len(self.times)
+        indices = (self.start + self.count + np.arange(len(times))) % capacity
+        self.times[indices], self.states[indices] = times, states
+        overflow = max(0, self.count + len(times) - capacity)
+        self.start = (self.start + overflow) % capacity
+        self.count = min(self.count + len(times), capacity)
+
+    def order(self):
+        """Buffer indices of the samples, oldest first."""
+        return (self.start + np.arange(self.count)) % len(self.times)
+
+    @property
+    def first_time(self):
+        return self.times[self.start]
+
+
+class TrajectoryHistory:
+    """
+    Bounded history of (time, state) samples with a level-of-detail pyramid.
+
+    Level k keeps every 2 ** k-th sample in a ring of level_size, so it
+    covers the last level_size * 2 ** k samples. Lookups use the finest
+    level reaching back far enough; samples older than the coarsest level
+    are dropped, bounding memory to about levels * level_size states.
+    """
+
+    def __init__(self, shape, level_size=HISTORY_LEVEL_SIZE, levels=HISTORY_LEVELS):
+        self.shape = tuple(shape)
+        self.levels = [HistoryLevel(self.shape, 2 ** k, level_size) for k in range(levels)]
+        self.appended = 0
+
+    def __len__(self):
+        return self.appended
+
+    def extend(self, times, states):
+        """Append (T,) times and (T, *shape) states."""
+        times = np.asarray(times, dtype=float)
+        states = np.asarray(states, dtype=float).reshape((len(times),) + self.shape)
+        numbers = self.appended + np.arange(len(times))
+        for level in self.levels:
+            taken = numbers % level.stride == 0
+            if taken.any():
+                level.extend(times[taken], states[taken])
+        self.appended += len(times)
+
+    def append(self, time, state):
+        self.extend([time], [state])
+
+    @property
+    def span(self):
+        """(first, last) time kept, None if empty."""
+        if not self.appended:
+            return None
+        finest = self.levels[0]
+        return float(self.levels[-1].first_time), float(finest.times[finest.order()[-1]])
+
+    def get_level(self, time):
+        """The finest level holding samples at or before time, the coarsest one if none does."""
+        for level in self.levels:
+            if level.count and level.first_time <= time:
+                return level
+        return self.levels[-1]
+
+    def at(self, time):
+        """(time, state) of the latest sample at or before time, the oldest one before it."""
+        level = self.get_level(time)
+        order = level.order()
+        i = order[max(np.searchsorted(level.times[order], time, side='right') - 1, 0)]
+        return level.times[i], level.states[i]
+
+    def samples(self, start, end, max_points, counted=None):
+        """
+        (times, states) between start and end at the finest detail with at most max_points of them.
+
+        The recent part comes from the chosen level and the part before it
+        from the coarser ones. counted(states) masks the samples counting
+        against max_points, all by default. The coarsest detail is returned
+        whatever its count.
+        """
+        for k in range(len(self.levels)):
+            pieces = []
+            total = 0
+            until, side = end, 'right'
+            for level in self.levels[k:]:
+                if not level.count:
+                    break
+                order = level.order()
+                times = level.times[order]
+                selected = order[np.searchsorted(times, start, side='left'):np.searchsorted(times, until, side=side)]
+                pieces.insert(0, selected)
+                states = level.states[selected]
+                total += len(selected) if counted is None else np.count_nonzero(counted(states))
+                if level.first_time <= start:
+                    break
+                if level.first_time < until:
+                    until, side = level.first_time, 'left'
+            if total <= max_points or k == len(self.levels) - 1:
+                break
+        levels = self.levels[k:k + len(pieces)][::-1]
+        return (
+            np.concatenate([np.empty(0)] + [level.times[selected] for level, selected in zip(levels, pieces)]),
+            np.concatenate(
+                [np.empty((0,) + self.shape)] + [level.states[selected] for level, selected in zip(levels, pieces)]
+            ),
+        )
@@ -0,0 +1,321 @@
+import argparse
+import json
+import warnings
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+
+from scipy.optimize import differential_evolution, minimize
+
+from ephemeris import EPHEMERIS_CACHE, get_ephemeris_ensemble
+from events import EventDetector, get_ship_events
+from planet import get_orbit_states, to_radian
+from runner import INTEGRATORS, X, V_X, Y, V_Y
+from simulation import (
+    DELTA_T, START_VELOCITY, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, SHIP_TRUE_ANOMALY,
+    get_planet_configs, parse_a_config,
+)
+from sweep import get_closest_approach, set_ephemeris_directory
+from thrust import ThrustTable
+
+
+OBJECTIVES = ('miss_distance', 'arrival_velocity', 'delta_v')
+METHODS = ('differential_evolution', 'L-BFGS-B', 'Nelder-Mead')
+PARALLEL_METHODS = ('differential_evolution', 'L-BFGS-B')
+A_CONFIG_TABLES = ('ship_earth_a_config', 'ship_mars_a_config', 'ship_sun_a_config')
+# m/s; a start velocity of 0 means the orbital one, keep it out of the search space
+VELOCITY_BOUNDS = (10000, 50000)
+TRUE_ANOMALY_BOUNDS = (0, 360)  # degrees
+DISTANCE_BOUNDS = (0, 3e11)  # m
+ACCELERATION_BOUNDS = (-0.01, 0.01)  # m/s^2
+ARRIVAL_RADIUS = 1e9  # m, misses within it are not penalized
+MISS_WEIGHT = 1e-6  # m/s of the velocity objectives per m of miss beyond ARRIVAL_RADIUS
+GRADIENT_STEP = 1e-4  # of the unit scaled variables
+
+
+def get_launch_delta_v(ship_true_anomaly, ship_start_velocity):
+    """Velocity change from the Earth orbit the ship starts on to its start velocity."""
+    ship_config = get_planet_configs(0, 0, 0, 0, 0, 0)['ship_config']
+    states = get_orbit_states(
+        ship_config['large_half_life'],
+        ship_config['eccentricity'],
+        to_radian(ship_config['perihelion_longitude']),
+        to_radian(ship_true_anomaly),
+        [0, ship_start_velocity],
+    )
+    return float(np.hypot(*(states[1] - states[0])[[V_X, V_Y]]))
+
+
+def get_thrust_delta_v(times, states, ship_row, rule_rows, table):
+    """Trapezoid integral of the thrust acceleration magnitude along the sampled trajectory, braking included."""
+    x = np.concatenate([states[:, :, X], np.zeros((len(states), 1))], axis=1)
+    y = np.concatenate([states[:, :, Y], np.zeros((len(states), 1))], axis=1)
+    distances = np.hypot(x[:, [ship_row]] - x[:, rule_rows], y[:, [ship_row]] - y[:, rule_rows])
+    _, accelerations = table.resolve(distances)
+    accelerations = np.abs(accelerations)
+    return float(np.sum((accelerations[1:] + accelerations[:-1]) / 2 * np.diff(times)))
+
+
+class TrajectoryProblem:
+    """
+    Launch and thrust parameters of one ship as a vector of unit scaled variables.
+
+    The variables are the start velocity, the true anomaly and the distance
+    and acceleration of every band of the three a_config tables, with
+    shape giving the number of bands per table. Calling the problem with a
+    vector runs the ship against the cached planet ephemeris and returns
+    the objective; instances pickle, so workers can evaluate them.
+    """
+
+    def __init__(
+        self,
+        shape,
+        duration,
+        objective='miss_distance',
+        earth_true_anomaly=EARTH_TRUE_ANOMALY,
+        mars_true_anomaly=MARS_TRUE_ANOMALY,
+        delta_t=DELTA_T,
+        integrator='rk4',
+        target='Mars',
+        arrival_radius=ARRIVAL_RADIUS,
+        miss_weight=MISS_WEIGHT,
+        velocity_bounds=VELOCITY_BOUNDS,
+        true_anomaly_bounds=TRUE_ANOMALY_BOUNDS,
+        distance_bounds=DISTANCE_BOUNDS,
+        acceleration_bounds=ACCELERATION_BOUNDS,
+    ):
+        if objective not in OBJECTIVES:
+            raise ValueError('Unknown objective %s, expected one of %s' % (objective, ', '.join(OBJECTIVES)))
+        self.shape = tuple(shape)
+        self.duration = duration
+        self.objective = objective
+        self.earth_true_anomaly = earth_true_anomaly
+        self.mars_true_anomaly = mars_true_anomaly
+        self.delta_t = delta_t
+        self.integrator = integrator
+        self.target = target
+        self.arrival_radius = arrival_radius
+        self.miss_weight = miss_weight
+        self.bounds = np.array(
+            [velocity_bounds, true_anomaly_bounds] + [distance_bounds, acceleration_bounds] * sum(self.shape),
+            dtype=float,
+        )
+
+    def to_unit(self, variables):
+        low, high = self.bounds.T
+        return (np.asarray(variables, dtype=float) - low) / (high - low)
+
+    def from_unit(self, unit):
+        low, high = self.bounds.T
+        return low + np.clip(unit, 0, 1) * (high - low)
+
+    def encode(self, ship):
+        """
+        Unit scaled variables of a ship dict as taken by simulation.get_ensemble.
+
+        Values outside the bounds are clipped to them with a warning, the
+        optimizers only search within.
+        """
+        variables = [ship['ship_start_velocity'] or 0, ship['ship_true_anomaly']]
+        for name, bands in zip(A_CONFIG_TABLES, self.shape):
+            table = list(ship.get(name, ()))
+            if len(table) != bands:
+                raise ValueError('%s has %s bands, expected %s' % (name, len(table), bands))
+            variables.extend(value for band in table for value in band)
+        unit = self.to_unit(variables)
+        outside = np.flatnonzero((unit < 0) | (unit > 1))
+        if len(outside):
+            warnings.warn('starting values %s are outside the bounds %s, clipped to them' % (
+                ', '.join('%g' % variables[i] for i in outside),
+                ', '.join('(%g, %g)' % tuple(self.bounds[i]) for i in outside),
+            ))
+        return np.clip(unit, 0, 1)
+
+    def decode(self, unit):
+        variables = self.from_unit(unit)
+        ship = dict(ship_start_velocity=float(variables[0]), ship_true_anomaly=float(variables[1]))
+        offset = 2
+        for name, bands in zip(A_CONFIG_TABLES, self.shape):
+            ship[name] = [
+                (float(variables[i]), float(variables[i + 1])) for i in range(offset, offset + 2 * bands, 2)
+            ]
+            offset += 2 * bands
+        return ship
+
+    def metrics(self, unit):
+        """miss_distance, arrival_time, arrival_velocity and delta_v of the decoded ship."""
+        ship = self.decode(unit)
+        simulation = get_ephemeris_ensemble(
+            [ship],
+            delta_t=self.delta_t,
+            earth_true_anomaly=self.earth_true_anomaly,
+            mars_true_anomaly=self.mars_true_anomaly,
+            integrator=self.integrator,
+            duration=self.duration,
+        )
+        detector = EventDetector(get_ship_events(
+            simulation.names, ship='Ship 0', targets=(self.target,),
+            radii={self.target: self.arrival_radius}, terminal=('enter %s' % self.target,),
+        ))
+        times, states = simulation.run(self.duration, detector=detector)
+        ship_row = len(simulation.planets)
+        delta_v = get_launch_delta_v(ship['ship_true_anomaly'], ship['ship_start_velocity']) + get_thrust_delta_v(
+            times, states, ship_row,
+            np.append(np.arange(len(simulation.planets)), states.shape[1]),
+            ThrustTable([[ship[name] for name in A_CONFIG_TABLES]]),
+        )
+        if detector.records:
+            times = np.append(times, [record.time for record in detector.records])
+            states = np.concatenate([states, [record.state for record in detector.records]])
+        miss_distance, arrival_time, arrival_velocity = get_closest_approach(
+            times, states, ship_row, simulation.names.index(self.target),
+        )
+        return dict(
+            miss_distance=float(miss_distance),
+            arrival_time=float(arrival_time),
+            arrival_velocity=float(arrival_velocity),
+            delta_v=delta_v,
+        )
+
+    def get_objective(self, metrics):
+        if self.objective == 'miss_distance':
+            return metrics['miss_distance']
+        miss = max(metrics['miss_distance'] - self.arrival_radius, 0)
+        return metrics[self.objective] + self.miss_weight * miss
+
+    def __call__(self, unit):
+        return self.get_objective(self.metrics(unit))
+
+
+def get_parallel_gradient(problem, map_function, step=GRADIENT_STEP):
+    """Objective and forward difference gradient of problem, evaluating all the points through map_function."""
+    def value_and_gradient(unit):
+        points = [unit]
+        for i in range(len(unit)):
+            point = np.array(unit, dtype=float)
+            point[i] += step if point[i] + step <= 1 else -step
+            points.append(point)
+        values = np.array(list(map_function(problem, points)))
+        steps = np.array([point[i] - unit[i] for i, point in enumerate(points[1:])])
+        return values[0], (values[1:] - values[0]) / steps
+    return value_and_gradient
+
+
+def optimize(
+    problem,
+    ship,
+    method='differential_evolution',
+    workers=None,
+    max_iterations=100,
+    seed=None,
+    ephemeris_directory=None,
+):
+    """
+    Minimise the problem objective starting from the ship dict.
+
+    Objective evaluations of the PARALLEL_METHODS run in a process pool,
+    Nelder-Mead evaluates one point at a time in this process; with an
+    ephemeris_directory the planets are integrated once up front and
+    shared with the workers on disk. Returns a dict with the best ship,
+    its metrics and objective, the number of evaluations and the
+    optimizer message.
+    """
+    if method not in METHODS:
+        raise ValueError('Unknown method %s, expected one of %s' % (method, ', '.join(METHODS)))
+    initial = problem.encode(ship)
+    if ephemeris_directory:
+        EPHEMERIS_CACHE.directory = ephemeris_directory
+        EPHEMERIS_CACHE.get(
+            problem.earth_true_anomaly, problem.mars_true_anomaly,
+            delta_t=problem.delta_t, integrator=problem.integrator, duration=problem.duration,
+        )
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_ephemeris_directory, initargs=(ephemeris_directory,)
+    ) if method in PARALLEL_METHODS else nullcontext() as executor:
+        if method == 'differential_evolution':
+            result = differential_evolution(
+                problem, [(0, 1)] * len(initial), x0=initial, maxiter=max_iterations, seed=seed,
+                updating='deferred', workers=executor.map, polish=False,
+            )
+        elif method == 'L-BFGS-B':
+            result = minimize(
+                get_parallel_gradient(problem, executor.map), initial, jac=True, method=method,
+                bounds=[(0, 1)] * len(initial), options=dict(maxiter=max_iterations),
+            )
+        else:
+            result = minimize(
+                problem, initial, method=method,
+                bounds=[(0, 1)] * len(initial), options=dict(maxiter=max_iterations),
+            )
+    metrics = problem.metrics(result.x)
+    return dict(
+        ship=problem.decode(result.x),
+        metrics=metrics,
+        objective=problem.get_objective(metrics),
+        evaluations=int(result.nfev),
+        message=str(result.message),
+    )
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Optimise the ship launch and thrust settings.')
+    parser.add_argument('--duration', type=float, required=True, help='simulated time of every run, seconds')
+    parser.add_argument('--objective', choices=OBJECTIVES, default='miss_distance')
+    parser.add_argument('--method', choices=METHODS, default='differential_evolution')
+    parser.add_argument('--max-iterations', type=int, default=100)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--delta-t', type=float, default=DELTA_T)
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='rk4')
+    parser.add_argument('--arrival-radius', type=float, default=ARRIVAL_RADIUS, help='stop runs this close to Mars, m')
+    parser.add_argument('--start-velocity', type=float, default=START_VELOCITY)
+    parser.add_argument('--ship-true-anomaly', type=float, default=SHIP_TRUE_ANOMALY)
+    parser.add_argument('--earth-true-anomaly', type=float, default=EARTH_TRUE_ANOMALY)
+    parser.add_argument('--mars-true-anomaly', type=float, default=MARS_TRUE_ANOMALY)
+    for body in ('earth', 'mars', 'sun'):
+        parser.add_argument(
+            '--%s-a-config' % body, type=parse_a_config, nargs='*', default=[],
+            metavar='DISTANCE:ACCELERATION',
+            help='initial bands near the %s, their number stays fixed' % body.capitalize(),
+        )
+    parser.add_argument('--workers', type=int, help='worker processes, all CPUs by default')
+    parser.add_argument('--ephemeris-directory', help='directory to keep planet ephemerides between runs')
+    parser.add_argument('--output', default='optimized.json')
+    return parser
+
+
+def run(args=None):
+    args = get_argument_parser().parse_args(args)
+    ship = dict(
+        ship_start_velocity=args.start_velocity,
+        ship_true_anomaly=args.ship_true_anomaly,
+        ship_earth_a_config=args.earth_a_config,
+        ship_mars_a_config=args.mars_a_config,
+        ship_sun_a_config=args.sun_a_config,
+    )
+    problem = TrajectoryProblem(
+        [len(ship[name]) for name in A_CONFIG_TABLES],
+        args.duration,
+        objective=args.objective,
+        earth_true_anomaly=args.earth_true_anomaly,
+        mars_true_anomaly=args.mars_true_anomaly,
+        delta_t=args.delta_t,
+        integrator=args.integrator,
+        arrival_radius=args.arrival_radius,
+    )
+    result = optimize(
+        problem, ship,
+        method=args.method,
+        workers=args.workers,
+        max_iterations=args.max_iterations,
+        seed=args.seed,
+        ephemeris_directory=args.ephemeris_directory,
+    )
+    with open(args.output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print('%s %s after %s evaluations: %s' % (args.objective, result['objective'], result['evaluations'], result['message']))
+    print(', '.join('%s=%s' % item for item in sorted(result['ship'].items())))
+
+
+if __name__ == '__main__':
+    run()
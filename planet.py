@@ -1,10 +1,15 @@
 import math
 import numpy as np
 
-from collections import namedtuple
-from runner import get_new_position_around_sun
+from collections import deque
+from itertools import chain
+
+from runner import get_acceleration_pair
 
 PLANET_ORBIT_LINES_PADDING = 100
+TRACE_MIN_PIXEL_DISTANCE = 2
+TRACE_LENGTH = 5000
+MAX_DRAWN_MINOR_BODIES = 1000
 
 SUN_MASS = 1.989 * math.pow(10, 30)
 G = 6.674 * math.pow(10, -11)
@@ -20,9 +25,47 @@ def to_radian(alfa):
 
 def turn_dot_on_angle(x, y, turn_over_angle):
     return (
-        x * math.cos(turn_over_angle) + y * math.sin(turn_over_angle),
-        - x * math.sin(turn_over_angle) + y * math.cos(turn_over_angle),
+        x * np.cos(turn_over_angle) + y * np.sin(turn_over_angle),
+        - x * np.sin(turn_over_angle) + y * np.cos(turn_over_angle),
+    )
+
+
+def get_orbit_states(large_half_life, eccentricity, perihelion_longitude, true_anomaly, start_velocity=0):
+    """
+    (..., 4) heliocentric (x, v_x, y, v_y) on Keplerian orbits around the sun.
+
+    Angles are in radians and all arguments broadcast against each other, so
+    many bodies or anomalies are computed at once. The true anomaly is
+    counted from perihelion, which lies along +y before the orbit is turned
+    by perihelion_longitude. A nonzero start_velocity replaces the orbital
+    velocity the way ship launches do.
+    """
+    large_half_life, eccentricity, perihelion_longitude, true_anomaly, start_velocity = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (
+            large_half_life, eccentricity, perihelion_longitude, true_anomaly, start_velocity,
+        ))
     )
+    semi_latus_rectum = large_half_life * (1 - eccentricity ** 2)
+    orbit_r = semi_latus_rectum / (1 + eccentricity * np.cos(true_anomaly))
+    x = orbit_r * np.sin(true_anomaly)
+    y = orbit_r * np.cos(true_anomaly)
+    velocity_pref = np.sqrt(np.divide(
+        G * SUN_MASS, semi_latus_rectum,
+        out=np.zeros_like(semi_latus_rectum), where=semi_latus_rectum > 0,
+    ))
+    v_x = velocity_pref * (eccentricity + np.cos(true_anomaly))
+    v_y = -velocity_pref * np.sin(true_anomaly)
+
+    new_v_x = start_velocity * np.cos(true_anomaly)
+    new_v_y = start_velocity * np.sin(true_anomaly)
+    launched = start_velocity != 0
+    v_x = np.where(launched, np.where(np.sign(v_x) != np.sign(new_v_x), -new_v_x, new_v_x), v_x)
+    v_y = np.where(launched, np.where(np.sign(v_y) != np.sign(new_v_y), -new_v_y, new_v_y), v_y)
+
+    turn_over_angle = perihelion_longitude + math.pi / 2
+    x, y = turn_dot_on_angle(x, y, turn_over_angle)
+    v_x, v_y = turn_dot_on_angle(v_x, v_y, turn_over_angle)
+    return np.stack([x, v_x, y, v_y], axis=-1)
 
 
 class Planet:
@@ -38,6 +81,9 @@ class Planet:
         mass=None,
         a_config=(),
         start_velocity=None,
+        trace_length=TRACE_LENGTH,
+        trace_min_pixel_distance=TRACE_MIN_PIXEL_DISTANCE,
+        trace_min_interval=0,
     ):
         self.name = name
         self.canvas = canvas
@@ -55,46 +101,35 @@ class Planet:
 
         self.planet_r = planet_r
 
-        self.perihelion_velocity = self.__get_perihelion_velocity()
-        self.perihelion_radius = self.large_half_life * (1 - self.orbit_eccentricity)
-
         self.orbit_x = orbit_center[0]
         self.orbit_y = orbit_center[1]
 
-        self._lambda = 0
-
-        s = self.orbit_r = self.__get_current_orbit_radius()
-
-        self.current_velocity = self.__get_current_velocity()
-        self.x, self.y = self.__get_next_coordinates()
-
-        self.__fit_velocity_and_position(to_radian(lambda_offset))
-
-        self.x, self.y = self.turn_orbit_to_appropriate_perihelion_longitude(self.x, self.y)
-        if start_velocity:
-            new_v_x = start_velocity * math.cos(self._lambda)
-            self.v_x = -new_v_x if np.sign(self.v_x) != np.sign(new_v_x) else new_v_x
-            new_v_y = start_velocity * math.sin(self._lambda)
-            self.v_y = -new_v_y if np.sign(self.v_y) != np.sign(new_v_y) else new_v_y
-        self.v_x, self.v_y = self.turn_orbit_to_appropriate_perihelion_longitude(self.v_x, self.v_y)
-        a = self.orbit_r = math.sqrt(self.x ** 2 + self.y ** 2)
+        self._lambda = to_radian(lambda_offset)
+        self.x, self.v_x, self.y, self.v_y = get_orbit_states(
+            large_half_life, eccentricity, self.perihelion_longitude, self._lambda, start_velocity or 0,
+        ).tolist()
+        self.orbit_r = math.sqrt(self.x ** 2 + self.y ** 2)
 
         rel_x, rel_y = self.get_relative_coordinates(self.x, self.y)
         self.rel_x, self.rel_y = rel_x, rel_y
 
+        # trace polyline: at most trace_length points (unlimited if falsy),
+        # a new one only after moving trace_min_pixel_distance pixels and trace_min_interval seconds
+        self.trace_points = deque(maxlen=trace_length or None)
+        self.trace_min_pixel_distance = trace_min_pixel_distance
+        self.trace_min_interval = trace_min_interval
+        self.trace_time = None
+        self.trace_item = None
+        self.trace_segments = []
+
         self.item = canvas.create_oval(
             scale * self.rel_x - planet_r, scale * self.rel_y - planet_r,
             scale * self.rel_x + planet_r, scale * self.rel_y + planet_r,
             fill=color,
-        )
+        ) if canvas is not None else None
 
     def get_acceleration_pair(self, distance):
-        for d, a in self.a_config:
-            if d >= distance:
-                return d, a
-
-    def __get_current_angular_velocity(self):
-        return self.perihelion_velocity * self.perihelion_radius / (self.orbit_r ** 2) if self.orbit_r else 0
+        return get_acceleration_pair(self.a_config, distance)
 
     def move(self, new_x, new_y):
         new_rel_x, new_rel_y = self.get_relative_coordinates(new_x, new_y)
@@ -104,12 +139,6 @@ class Planet:
         self.rel_x = new_rel_x
         self.rel_y = new_rel_y
 
-    def __get_next_coordinates(self):
-        return (
-            self.orbit_r * math.sin(self._lambda),
-            self.orbit_r * math.cos(self._lambda),
-        )
-
     def get_relative_coordinates(self, x, y):
         rel_x = self.orbit_x / self.scale + x
         rel_y = self.orbit_y / self.scale + y
@@ -125,39 +154,115 @@ class Planet:
         turn_over_angle = self.perihelion_longitude + self._equinox_dot_initial_angle
         return turn_dot_on_angle(x, y, turn_over_angle)
 
-    def left_trace_dot(self):
-        self.canvas.create_oval(
-            int(self.scale * self.rel_x), int(self.scale * self.rel_y),
-            int(self.scale * self.rel_x) + 1, int(self.scale * self.rel_y) + 1,
-            outline=self.color,
-            fill='white',
-        )
-
-    def __get_perihelion_velocity(self):
-        return math.sqrt((
-            (G * SUN_MASS * (1 + self.orbit_eccentricity))
-            /
-            (self.large_half_life * (1 - self.orbit_eccentricity))
-        )) if self.large_half_life and self.orbit_eccentricity != 1 else 0
-
-    def __get_current_orbit_radius(self):
-        return (
-            (self.large_half_life * (1 - math.pow(self.orbit_eccentricity, 2)))
-            /
-            (1 + self.orbit_eccentricity * math.cos(self._lambda))
-        )
-
-    def __get_current_velocity(self):
-        velocity = math.sqrt(G * SUN_MASS * (2 / self.orbit_r - 1 / self.large_half_life)) if self.orbit_r else 0
-        self.v_x = velocity * math.cos(self._lambda)
-        self.v_y = velocity * math.sin(self._lambda)
-        return velocity
-
-    def __fit_velocity_and_position(self, _lambda):
-        delta_t_to_fit = 10000
-        SunPseudo = namedtuple('SunPseudo', ['x', 'y', 'mass'])
-        mock_sun = SunPseudo(0, 0, SUN_MASS)
-        while self._lambda < _lambda:
-            self.x, self.y, self.v_x, self.v_y = get_new_position_around_sun(self, mock_sun, delta_t_to_fit)
-            self.orbit_r = math.sqrt(self.x ** 2 + self.y ** 2)
-            self._lambda += self.__get_current_angular_velocity() * delta_t_to_fit
+    def left_trace_dot(self, time=None):
+        point = (self.scale * self.rel_x, self.scale * self.rel_y)
+        if self.trace_points:
+            last_x, last_y = self.trace_points[-1]
+            if math.hypot(point[0] - last_x, point[1] - last_y) < self.trace_min_pixel_distance:
+                return
+            if time is not None and self.trace_time is not None and time - self.trace_time < self.trace_min_interval:
+                return
+        self.trace_points.append(point)
+        self.trace_time = time
+        self.trace_item = self.draw_line(self.trace_item, self.trace_points)
+
+    def draw_line(self, item, points):
+        """Set the polyline item, None for a new one, to pixel points; returns the item, None below two points."""
+        if len(points) < 2:
+            if item is not None:
+                self.canvas.delete(item)
+            return None
+        if item is None:
+            item = self.canvas.create_line(*chain.from_iterable(points), fill=self.color)
+            self.canvas.tag_lower(item)
+        else:
+            self.canvas.coords(item, *chain.from_iterable(points))
+        return item
+
+    def set_view(self, scale, orbit_center):
+        """Redraw at a new scale and sun pixel, mapping the trace items and points along."""
+        old_scale, old_x, old_y = self.scale, self.orbit_x, self.orbit_y
+        if (scale, tuple(orbit_center)) == (old_scale, (old_x, old_y)):
+            return
+        x, y = self.rel_x - old_x / old_scale, self.rel_y - old_y / old_scale
+        self.scale = scale
+        self.orbit_x, self.orbit_y = orbit_center
+        self.rel_x, self.rel_y = self.get_relative_coordinates(x, y)
+        if self.item is not None:
+            pixel_x, pixel_y = self.scale * self.rel_x, self.scale * self.rel_y
+            self.canvas.coords(
+                self.item,
+                pixel_x - self.planet_r, pixel_y - self.planet_r, pixel_x + self.planet_r, pixel_y + self.planet_r,
+            )
+        # pixel -> orbit + scale * (pixel - old orbit) / old scale, for all trace items at once
+        ratio = scale / old_scale
+        offset_x, offset_y = self.orbit_x - ratio * old_x, self.orbit_y - ratio * old_y
+        for item in self.trace_segments + ([self.trace_item] if self.trace_item is not None else []):
+            self.canvas.scale(item, 0, 0, ratio, ratio)
+            self.canvas.move(item, offset_x, offset_y)
+        if self.trace_points:
+            points = ratio * np.array(self.trace_points) + (offset_x, offset_y)
+            self.trace_points.clear()
+            self.trace_points.extend(map(tuple, points.tolist()))
+
+    def set_trace(self, runs, time=None):
+        """
+        Replace the trace by runs of heliocentric (xs, ys) points, oldest first.
+
+        New trace dots continue the last run; the others are drawn as they are.
+        """
+        for item in self.trace_segments:
+            self.canvas.delete(item)
+        self.trace_segments = []
+        pixels = [
+            list(zip((self.orbit_x + self.scale * np.asarray(xs)).tolist(),
+                     (self.orbit_y + self.scale * np.asarray(ys)).tolist()))
+            for xs, ys in runs
+        ]
+        for points in pixels[:-1]:
+            item = self.draw_line(None, points)
+            if item is not None:
+                self.trace_segments.append(item)
+        self.trace_points.clear()
+        self.trace_points.extend(pixels[-1] if pixels else ())
+        self.trace_time = time
+        self.trace_item = self.draw_line(self.trace_item, self.trace_points)
+
+
+class MinorBodies:
+    """
+    Massless minor bodies drawn as one pixel dots.
+
+    Only max_drawn of them, evenly spread over the state rows, get a
+    canvas item; the rest are integrated but not drawn. Moving them is one
+    batched Tcl script per frame rather than a Python to Tcl call per dot.
+    """
+
+    def __init__(self, canvas, scale, orbit_center, state, color='gray', max_drawn=MAX_DRAWN_MINOR_BODIES):
+        self.canvas = canvas
+        self.scale = scale
+        self.orbit_center = np.asarray(orbit_center, dtype=float)
+        self.state = state
+        self.drawn = np.unique(np.linspace(0, len(state) - 1, min(len(state), max_drawn)).astype(int))
+        self.items = [
+            canvas.create_rectangle(x, y, x + 1, y + 1, outline=color, fill=color)
+            for x, y in self.get_pixels(state)
+        ]
+
+    def get_pixels(self, state):
+        return self.orbit_center + self.scale * np.asarray(state)[self.drawn][:, [0, 2]]
+
+    def set_view(self, scale, orbit_center):
+        """Redraw at a new scale and sun pixel."""
+        self.scale = scale
+        self.orbit_center = np.asarray(orbit_center, dtype=float)
+        self.move(self.state)
+
+    def move(self, state):
+        """Move the dots to the (M, 4) state of all minor bodies, in a single Tcl call."""
+        self.state = state
+        canvas = str(self.canvas)
+        self.canvas.tk.eval('\n'.join(
+            '%s coords %s %.1f %.1f %.1f %.1f' % (canvas, item, x, y, x + 1, y + 1)
+            for item, (x, y) in zip(self.items, self.get_pixels(state).tolist())
+        ))
@@ -0,0 +1,150 @@
+import time as wall_clock
+
+from collections import defaultdict
+from functools import wraps
+from threading import Lock
+
+
+# stepper methods timed by Profiler.instrument, by phase name
+STEPPER_PHASES = (
+    ('step', 'take_step'),
+    ('derivatives', 'derivatives'),
+    ('thrust', 'before_step'),
+)
+
+
+class NullPhase:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_PHASE = NullPhase()
+
+
+class Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.start = wall_clock.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profiler.add(self.name, wall_clock.perf_counter() - self.start)
+        return False
+
+
+class Profiler:
+    """
+    Wall time and call counts per named phase of the simulation loop.
+
+    Disabled profilers cost nothing in the integrator: steppers are only
+    timed between instrument and uninstrument, which replace their methods
+    with timing wrappers. phase(name) is a no-op context while disabled.
+    Phases may be timed from several threads, the totals are updated and
+    read under lock.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.lock = Lock()
+        self.instrumented = {}
+        self.counters = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.seconds = defaultdict(float)
+            self.calls = defaultdict(int)
+            self.started = wall_clock.perf_counter()
+
+    def enable(self):
+        if not self.enabled:
+            self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        for stepper, _ in list(self.instrumented.values()):
+            self.uninstrument(stepper)
+
+    def add(self, name, seconds, calls=1):
+        with self.lock:
+            self.seconds[name] += seconds
+            self.calls[name] += calls
+
+    def phase(self, name):
+        return Phase(self, name) if self.enabled else NULL_PHASE
+
+    def count(self, name, value):
+        """Record a gauge such as the number of canvas items."""
+        with self.lock:
+            self.counters[name] = value
+
+    def wrap(self, name, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = wall_clock.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.add(name, wall_clock.perf_counter() - start)
+        return timed
+
+    def instrument(self, stepper):
+        """Time the steps, right-hand side and thrust updates of stepper."""
+        if id(stepper) in self.instrumented:
+            return
+        originals = {}
+        for name, attribute in STEPPER_PHASES:
+            function = getattr(stepper, attribute)
+            if function is not None:
+                originals[attribute] = vars(stepper).get(attribute)
+                setattr(stepper, attribute, self.wrap(name, function))
+        self.instrumented[id(stepper)] = stepper, originals
+
+    def uninstrument(self, stepper):
+        stepper, originals = self.instrumented.pop(id(stepper), (stepper, {}))
+        for attribute, original in originals.items():
+            if original is None:
+                delattr(stepper, attribute)
+            else:
+                setattr(stepper, attribute, original)
+
+    def report(self):
+        """Dict of the elapsed wall time, steps per second, phases and counters."""
+        with self.lock:
+            seconds, calls, counters = dict(self.seconds), dict(self.calls), dict(self.counters)
+            elapsed = wall_clock.perf_counter() - self.started
+        return dict(
+            elapsed=elapsed,
+            steps_per_second=calls.get('step', 0) / elapsed if elapsed else 0,
+            phases={
+                name: dict(
+                    calls=calls[name],
+                    seconds=total,
+                    mean=total / calls[name] if calls[name] else 0,
+                    share=total / elapsed if elapsed else 0,
+                )
+                for name, total in sorted(seconds.items())
+            },
+            counters=counters,
+        )
+
+    def format(self):
+        report = self.report()
+        lines = ['%.0f steps/s' % report['steps_per_second']]
+        for name, phase in report['phases'].items():
+            lines.append('%s: %s calls, %.1f us each, %.0f%%' % (
+                name, phase['calls'], phase['mean'] * 1e6, phase['share'] * 100,
+            ))
+        for name, value in sorted(report['counters'].items()):
+            lines.append('%s: %s' % (name, value))
+        return '\n'.join(lines)
+
+
+PROFILER = Profiler()
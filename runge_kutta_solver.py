@@ -1,19 +1,279 @@
 import numpy as np
 
 
-def get_k_addon(functions, previous, delta_t):
+class FixedStepper:
+    """
+    Base of the fixed step integrators: subclasses implement take_step(delta_t).
 
-    def get_coef(args):
-        return delta_t * np.array([func(*args) for func in functions])
+    derivatives(state, out=..., time=...) must write the time derivative of
+    state into out. before_step(state, time=...), if given, is called at the
+    start of every step.
+    """
+    adaptive = False
 
-    previous = np.array(previous)
-    k1 = get_coef(previous)
-    k2 = get_coef(previous + 1 / 2 * k1)
-    k3 = get_coef(previous + 1 / 2 * k2)
-    k4 = get_coef(previous + k3)
-    return 1 / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+    def __init__(self, derivatives, state, delta_t, before_step=None):
+        self.derivatives = derivatives
+        self.before_step = before_step
+        self.delta_t = delta_t
+        self.time = 0
+        self.evaluations = 0
+        self.state = np.array(state, dtype=float, order='C')
 
+    def step(self, steps=1):
+        for _ in range(steps):
+            self.take_step(self.delta_t)
+        return self.state
 
-def solve_runge_kutta(functions, previous, delta_t):
-    previous = np.array(previous)
-    return list(previous + get_k_addon(functions, previous, delta_t))
+    def advance(self, until):
+        """Step up to the time until, shortening the last step to land on it; never steps back."""
+        if until <= self.time:
+            return self.state
+        self.step(int((until - self.time) / self.delta_t + 1e-9))
+        if until - self.time > 1e-9 * self.delta_t:
+            self.take_step(until - self.time)
+        self.time = until
+        return self.state
+
+    def reset(self, state, time):
+        """Continue from state at time, e.g. one restored from a checkpoint."""
+        self.state[...] = state
+        self.time = time
+
+    def take_step(self, delta_t):
+        raise NotImplementedError
+
+
+class RungeKuttaStepper(FixedStepper):
+    """Classic RK4 advancing a contiguous state array in place."""
+
+    def __init__(self, derivatives, state, delta_t, before_step=None):
+        super().__init__(derivatives, state, delta_t, before_step)
+        self.k1 = np.empty_like(self.state)
+        self.k2 = np.empty_like(self.state)
+        self.k3 = np.empty_like(self.state)
+        self.k4 = np.empty_like(self.state)
+        self.scratch = np.empty_like(self.state)
+
+    def take_step(self, delta_t):
+        state, scratch = self.state, self.scratch
+        k1, k2, k3, k4 = self.k1, self.k2, self.k3, self.k4
+        if self.before_step is not None:
+            self.before_step(state, time=self.time)
+        self.derivatives(state, out=k1, time=self.time)
+        np.multiply(k1, delta_t / 2, out=scratch)
+        scratch += state
+        self.derivatives(scratch, out=k2, time=self.time + delta_t / 2)
+        np.multiply(k2, delta_t / 2, out=scratch)
+        scratch += state
+        self.derivatives(scratch, out=k3, time=self.time + delta_t / 2)
+        np.multiply(k3, delta_t, out=scratch)
+        scratch += state
+        self.derivatives(scratch, out=k4, time=self.time + delta_t)
+        k2 += k3
+        k2 *= 2
+        k2 += k1
+        k2 += k4
+        k2 *= delta_t / 6
+        state += k2
+        self.time += delta_t
+        self.evaluations += 4
+
+
+DORMAND_PRINCE_C = (0, 1 / 5, 3 / 10, 4 / 5, 8 / 9, 1, 1)
+DORMAND_PRINCE_A = (
+    (),
+    (1 / 5,),
+    (3 / 40, 9 / 40),
+    (44 / 45, -56 / 15, 32 / 9),
+    (19372 / 6561, -25360 / 2187, 64448 / 6561, -212 / 729),
+    (9017 / 3168, -355 / 33, 46732 / 5247, 49 / 176, -5103 / 18656),
+    (35 / 384, 0, 500 / 1113, 125 / 192, -2187 / 6784, 11 / 84),
+)
+# difference between the 5th and the embedded 4th order weights
+DORMAND_PRINCE_E = (71 / 57600, 0, -71 / 16695, 71 / 1920, -17253 / 339200, 22 / 525, -1 / 40)
+# 4th order dense output: stage i weighs sum(P[i][j] * theta ** (j + 1)) at theta of a step, as in Hairer
+DORMAND_PRINCE_P = np.array([
+    (1, -8048581381 / 2820520608, 8663915743 / 2820520608, -12715105075 / 11282082432),
+    (0, 0, 0, 0),
+    (0, 131558114200 / 32700410799, -68118460800 / 10900136933, 87487479700 / 32700410799),
+    (0, -1754552775 / 470086768, 14199869525 / 1410260304, -10690763975 / 1880347072),
+    (0, 127303824393 / 49829197408, -318862633887 / 49829197408, 701980252875 / 199316789632),
+    (0, -282668133 / 205662961, 2019193451 / 616988883, -1453857185 / 822651844),
+    (0, 40617522 / 29380423, -110615467 / 29380423, 69997945 / 29380423),
+])
+
+
+class DormandPrinceStepper:
+    """
+    Adaptive Dormand-Prince RK5(4) with error control, advancing the state in place.
+
+    A step is accepted when the RMS of the embedded error estimate scaled by
+    atol + rtol * |state| is at most 1; otherwise it is retried with a
+    smaller delta_t. delta_t holds the size proposed for the next step.
+    before_step(state, time=...) may return True to tell that the derivatives changed,
+    so the last stage of the previous step can't be reused as the first one.
+
+    advance never shortens steps to land on its target: a step past it is
+    kept and the state at the target interpolated from the step's stages,
+    so sampling often costs no extra derivative evaluations.
+    """
+    adaptive = True
+
+    def __init__(
+        self, derivatives, state, delta_t, before_step=None,
+        rtol=1e-8, atol=1e-3, max_step=np.inf, min_step=1e-6,
+        safety=0.9, min_factor=0.2, max_factor=5, record_steps=False,
+    ):
+        self.derivatives = derivatives
+        self.before_step = before_step
+        self.delta_t = delta_t
+        self.rtol, self.atol = rtol, atol
+        self.max_step, self.min_step = max_step, min_step
+        self.safety, self.min_factor, self.max_factor = safety, min_factor, max_factor
+        self.time = 0
+        self.evaluations = self.accepted = self.rejected = 0
+        self.min_taken_step, self.max_taken_step = np.inf, 0
+        self.step_sizes = [] if record_steps else None
+
+        self.state = np.array(state, dtype=float, order='C')
+        self.ks = [np.empty_like(self.state) for _ in range(7)]
+        self.new_state = np.empty_like(self.state)
+        self.error = np.empty_like(self.state)
+        self.scratch = np.empty_like(self.state)
+        self.fsal = False
+        # the step past the last advance target: its end state and time, start state and dense output
+        self.front_state = np.empty_like(self.state)
+        self.front_time = None
+        self.step_start = np.empty_like(self.state)
+        self.step_start_time = 0
+        self.dense = np.empty((DORMAND_PRINCE_P.shape[1],) + self.state.shape)
+
+    def step(self, steps=1):
+        self.catch_up()
+        for _ in range(steps):
+            self.take_step(min(self.delta_t, self.max_step))
+        return self.state
+
+    def advance(self, until):
+        """Take adaptive steps up to the time until, interpolating the state there; never steps back."""
+        if until <= self.time:
+            return self.state
+        if self.front_time is not None and until < self.front_time:
+            return self.interpolate(until)
+        self.catch_up()
+        while until - self.time > self.min_step:
+            self.step_start_time = self.time
+            self.step_start[...] = self.state
+            taken = self.take_step(min(self.delta_t, self.max_step))
+            if self.time - until > self.min_step:
+                self.front_state[...] = self.state
+                self.front_time = self.time
+                self.dense.fill(0)
+                # stages in order, the first one was swapped to the end for reuse
+                for coefs, k in zip(DORMAND_PRINCE_P, [self.ks[6]] + self.ks[1:6] + [self.ks[0]]):
+                    for j, coef in enumerate(coefs):
+                        if coef:
+                            np.multiply(k, taken * coef, out=self.scratch)
+                            self.dense[j] += self.scratch
+                return self.interpolate(until)
+        self.time = until
+        return self.state
+
+    def interpolate(self, time):
+        """Set the state to its dense output at time within the step past the last target."""
+        theta = (time - self.step_start_time) / (self.front_time - self.step_start_time)
+        self.state[...] = self.step_start
+        for j, coefs in enumerate(self.dense):
+            np.multiply(coefs, theta ** (j + 1), out=self.scratch)
+            self.state += self.scratch
+        self.time = time
+        return self.state
+
+    def catch_up(self):
+        """Move the state back to the end of the step past the last target, if any."""
+        if self.front_time is not None:
+            self.state[...] = self.front_state
+            self.time = self.front_time
+            self.front_time = None
+
+    def reset(self, state, time):
+        """Continue from state at time, e.g. one restored from a checkpoint."""
+        self.state[...] = state
+        self.time = time
+        self.fsal = False
+        self.front_time = None
+
+    def stats(self):
+        return dict(
+            accepted=self.accepted,
+            rejected=self.rejected,
+            evaluations=self.evaluations,
+            min_step=self.min_taken_step,
+            max_step=self.max_taken_step,
+            next_step=self.delta_t,
+        )
+
+    def combine(self, out, delta_t, coefs):
+        """out = state + delta_t * sum(coef * k)"""
+        out[...] = self.state
+        for coef, k in zip(coefs, self.ks):
+            if coef:
+                np.multiply(k, delta_t * coef, out=self.scratch)
+                out += self.scratch
+        return out
+
+    def take_step(self, delta_t):
+        """Take one accepted step of at most delta_t and return its size."""
+        ks = self.ks
+        changed = self.before_step(self.state, time=self.time) if self.before_step is not None else False
+        if not self.fsal or changed:
+            self.derivatives(self.state, out=ks[0], time=self.time)
+            self.evaluations += 1
+
+        step_rejected = False
+        while True:
+            for i in range(1, 7):
+                self.derivatives(
+                    self.combine(self.new_state, delta_t, DORMAND_PRINCE_A[i]),
+                    out=ks[i],
+                    time=self.time + DORMAND_PRINCE_C[i] * delta_t,
+                )
+            self.evaluations += 6
+
+            self.error.fill(0)
+            for coef, k in zip(DORMAND_PRINCE_E, ks):
+                if coef:
+                    np.multiply(k, delta_t * coef, out=self.scratch)
+                    self.error += self.scratch
+            np.maximum(np.abs(self.state), np.abs(self.new_state), out=self.scratch)
+            self.scratch *= self.rtol
+            self.scratch += self.atol
+            self.error /= self.scratch
+            error_norm = np.sqrt(np.mean(np.square(self.error, out=self.error)))
+
+            factor = self.max_factor if error_norm == 0 else min(
+                self.max_factor, max(self.min_factor, self.safety * error_norm ** -0.2),
+            )
+            if error_norm <= 1 or delta_t <= self.min_step:
+                break
+            self.rejected += 1
+            step_rejected = True
+            delta_t = max(delta_t * factor, self.min_step)
+
+        if step_rejected:
+            factor = min(factor, 1)
+        self.state[...] = self.new_state
+        ks[0], ks[6] = ks[6], ks[0]
+        self.fsal = True
+        self.time += delta_t
+        self.accepted += 1
+        self.min_taken_step = min(self.min_taken_step, delta_t)
+        self.max_taken_step = max(self.max_taken_step, delta_t)
+        if self.step_sizes is not None:
+            self.step_sizes.append(delta_t)
+        self.delta_t = min(max(delta_t * factor, self.min_step), self.max_step)
+        return delta_t
+
+
+def solve_runge_kutta(derivatives, previous, delta_t):
+    return RungeKuttaStepper(derivatives, previous, delta_t).step()
@@ -1,131 +1,182 @@
 import math
+import numpy as np
 
-from functools import reduce
+from functools import partial
 from itertools import chain
 
 
-from runge_kutta_solver import solve_runge_kutta
+from runge_kutta_solver import RungeKuttaStepper, DormandPrinceStepper
+from symplectic_solver import LeapfrogStepper, YoshidaStepper
+from thrust import ThrustTable
 
 
 G = 6.674 * math.pow(10, -11)
 A = 0.0007
 
-
-def acceleration_y(central_body, moving):
-    return (
-        G * central_body.mass * (central_body.y - moving.y)
-        / math.pow(
-            (central_body.x - moving.x) ** 2
-            + (central_body.y - moving.y) ** 2,
-            3 / 2,
-        )
+X, V_X, Y, V_Y = range(4)
+
+INTEGRATORS = {
+    'rk4': RungeKuttaStepper,
+    'dopri5': DormandPrinceStepper,
+    'leapfrog': LeapfrogStepper,
+    'yoshida4': YoshidaStepper,
+}
+
+
+def get_system_stepper(
+    sun, planets, delta_t, objects_with_custom_accelerations=(), integrator='rk4', minor_state=None,
+    **integrator_options
+):
+    """
+    Stepper of the planets, the ships and optionally massless minor bodies given as an (M, 4) state.
+
+    Minor bodies follow the planets and ships in the state, feel the sun,
+    the planets and the ships, and never thrust.
+    """
+    moving = list(chain(planets, objects_with_custom_accelerations))
+    state = get_state(moving).reshape(-1, 4)
+    if minor_state is not None:
+        state = np.concatenate([state, np.asarray(minor_state, dtype=float).reshape(-1, 4)])
+    thrust = (np.zeros(len(state)), np.full(len(state), len(state)))
+    derivatives = partial(
+        get_derivatives,
+        masses=np.array([body.mass for body in moving], dtype=float),
+        sun_mass=sun.mass,
+        thrust=thrust,
+        buffers=DerivativeBuffers(len(state), len(moving)),
+    )
+    update_thrust_for_step = partial(
+        update_thrust,
+        rule_rows=np.append(np.arange(len(moving)), len(state)),
+        thrusting=np.arange(len(planets), len(moving)),
+        table=ThrustTable([[body.a_config for body in chain(moving, [sun])]] * len(objects_with_custom_accelerations)),
+        thrust=thrust,
+    )
+    return INTEGRATORS[integrator](
+        derivatives, state, delta_t, before_step=update_thrust_for_step, **integrator_options
     )
 
 
-def acceleration_x(central_body, moving):
-    return (
-        G * central_body.mass * (central_body.x - moving.x)
-        / math.pow(
-            (central_body.x - moving.x) ** 2
-            + (central_body.y - moving.y) ** 2,
-            3 / 2,
-        )
+def get_ensemble_stepper(
+    sun, planets, ships_state, ships_a_configs, delta_t, integrator='rk4', **integrator_options
+):
+    """
+    Stepper of the planets followed by M massless ships given as an (M, 4) state.
+
+    Ships feel the sun and the planets but not each other. ships_a_configs
+    holds for every ship its a_config tables for every planet followed by the sun.
+    """
+    state = np.concatenate([get_state(planets), np.asarray(ships_state, dtype=float).reshape(-1, 4)])
+    thrust = (np.zeros(len(state)), np.full(len(state), len(state)))
+    derivatives = partial(
+        get_derivatives,
+        masses=np.array([body.mass for body in planets], dtype=float),
+        sun_mass=sun.mass,
+        thrust=thrust,
+        buffers=DerivativeBuffers(len(state), len(planets)),
+    )
+    update_thrust_for_step = partial(
+        update_thrust,
+        rule_rows=np.append(np.arange(len(planets)), len(state)),
+        thrusting=np.arange(len(planets), len(state)),
+        table=ThrustTable(ships_a_configs),
+        thrust=thrust,
+    )
+    return INTEGRATORS[integrator](
+        derivatives, state, delta_t, before_step=update_thrust_for_step, **integrator_options
     )
 
 
-def get_new_position_around_sun(planet, sun, delta_t):
-    earth_vx = planet.v_x + acceleration_x(sun, planet) * delta_t
-    earth_vy = planet.v_y + acceleration_y(sun, planet) * delta_t
-    earth_x = planet.x + earth_vx * delta_t
-    earth_y = planet.y + earth_vy * delta_t
-    return earth_x, earth_y, earth_vx, earth_vy
+def get_get_new_positions(sun, planets, delta_t, objects_with_custom_accelerations=()):
+    return get_system_stepper(sun, planets, delta_t, objects_with_custom_accelerations).step()
 
 
-def get_get_new_positions(sun, planets, delta_t, objects_with_custom_accelerations=()):
-    functions = get_functions(sun, planets, objects_with_custom_accelerations)
-    current_positions_and_velocities = []
-    for body in chain(planets, objects_with_custom_accelerations):
-        current_positions_and_velocities.extend([body.x, body.v_x, body.y, body.v_y])
-    return solve_runge_kutta(functions, current_positions_and_velocities, delta_t)
-
-
-def get_functions(sun, planets, objects_with_custom_accelerations):
-    functions = []
-    num_of_moving = len(planets) + len(objects_with_custom_accelerations)
-    for i, body in enumerate(chain(planets, objects_with_custom_accelerations)):
-
-        def get_acceleration_for_body(y_x, y_y):
-            a = [
-                (
-                    b.get_acceleration_pair(math.sqrt((y_x - b.x) ** 2 + (y_y - b.y) ** 2)),
-                    i_b,
-                ) for i_b, b in enumerate(chain(planets, objects_with_custom_accelerations, [sun]))
-                ]
-            ad = list(filter(lambda t: t[0] and t[0][0] and t[0][1], a))
-            a_pairs = sorted(ad, key=lambda t: t[0][0])
-            if a_pairs:
-                (d, a), central_body_index = a_pairs[0]
-                return a, central_body_index
-            return 0, 0
-
-        def get_current_object_equations(i=i, body=body):
-            a, accelerate_to = get_acceleration_for_body(body.x, body.y) if body in objects_with_custom_accelerations else (0, 0)
-            return [
-                lambda *y: y[i * 4 + 1],
-                lambda *y: reduce(lambda acc, v: acc + v, chain(
-                    [
-                        -get_g_x(sun.mass, y[i * 4], y[i * 4 + 2]),
-                    ],
-                    [
-                        -get_g_x(body.mass, y[i * 4] - y[i_b * 4], y[i * 4 + 2] - y[i_b * 4 + 2]) if b != body else 0
-                        for i_b, b in enumerate(chain(planets, objects_with_custom_accelerations))
-                    ],
-                    (
-                        [-get_a_x(
-                            a,
-                            y[i * 4] - (y[accelerate_to * 4] if accelerate_to < num_of_moving else 0),
-                            y[i * 4 + 2] - (y[accelerate_to * 4 + 2] if accelerate_to < num_of_moving else 0)
-                        )]
-                        if body in objects_with_custom_accelerations and a else []
-                    ),
-                ), 0),
-                lambda *y: y[i * 4 + 3],
-                lambda *y: reduce(lambda acc, v: acc + v, chain(
-                    [-get_g_y(sun.mass, y[i * 4], y[i * 4 + 2])],
-                    [
-                        -get_g_y(body.mass, y[i * 4] - y[i_b * 4], y[i * 4 + 2] - y[i_b * 4 + 2]) if b != body else 0
-                        for i_b, b in enumerate(chain(planets, objects_with_custom_accelerations))
-                    ],
-                    (
-                        [-get_a_y(
-                            a,
-                            y[i * 4] - (y[accelerate_to * 4] if accelerate_to < num_of_moving else 0),
-                            y[i * 4 + 2] - (y[accelerate_to * 4 + 2] if accelerate_to < num_of_moving else 0)
-                        )]
-                        if body in objects_with_custom_accelerations and a else []
-                    ),
-                ), 0),
-            ]
-
-        functions.extend(get_current_object_equations())
-    return functions
-
-
-def __get_pref(mass, distance_x, distance_y):
-    return G * mass / math.pow((distance_x ** 2 + distance_y ** 2), 3 / 2)
-
-
-def get_g_x(mass, distance_x, distance_y):
-    return distance_x * __get_pref(mass, distance_x, distance_y)
-
-
-def get_g_y(mass, distance_x, distance_y):
-    return distance_y * __get_pref(mass, distance_x, distance_y)
-
-
-def get_a_x(a, distance_x, distance_y):
-    return a * distance_x / math.pow((distance_x ** 2 + distance_y ** 2), 1 / 2)
-
-
-def get_a_y(a, distance_x, distance_y):
-    return a * distance_y / math.pow((distance_x ** 2 + distance_y ** 2), 1 / 2)
+def get_state(bodies):
+    """(x, v_x, y, v_y) rows of the moving bodies, one row per body."""
+    return np.array([[body.x, body.v_x, body.y, body.v_y] for body in bodies], dtype=float)
+
+
+def get_acceleration_pair(a_config, distance):
+    """The narrowest (distance, acceleration) band of a sorted a_config containing distance."""
+    for d, a in a_config:
+        if d >= distance:
+            return d, a
+
+
+def update_thrust(state, rule_rows, thrusting, table, thrust, time=None):
+    """
+    Fill thrust with the acceleration magnitude and index of the body to accelerate to for every moving body.
+    Return True if it changed.
+
+    rule_rows are the state rows of the bodies having a_config tables,
+    len(state) standing for the sun at the origin; table is the ThrustTable
+    of the thrusting rows. The rule is picked at the current positions and
+    kept for the whole step. time is unused, the rules don't depend on it.
+    """
+    accelerations, targets = thrust
+    x = np.append(state[:, X], 0)
+    y = np.append(state[:, Y], 0)
+    distances = np.hypot(
+        x[thrusting, np.newaxis] - x[rule_rows],
+        y[thrusting, np.newaxis] - y[rule_rows],
+    )
+    body, new_accelerations = table.resolve(distances)
+    new_targets = np.where(body >= 0, rule_rows[body], len(state))
+    changed = not (
+        np.array_equal(accelerations[thrusting], new_accelerations)
+        and np.array_equal(targets[thrusting], new_targets)
+    )
+    accelerations[thrusting] = new_accelerations
+    targets[thrusting] = new_targets
+    return changed
+
+
+class DerivativeBuffers:
+    """Scratch arrays of get_derivatives for bodies rows of which the first massive attract, reused every call."""
+
+    def __init__(self, bodies, massive):
+        self.d_x = np.empty((bodies, massive))
+        self.d_y = np.empty((bodies, massive))
+        self.distance_cubed = np.empty((bodies, massive))
+        self.pref = np.empty((bodies, massive))
+
+
+def get_derivatives(state, masses, sun_mass, thrust=None, out=None, time=None, buffers=None):
+    """
+    Time derivative of the (N, 4) state of N moving bodies around a sun fixed at the origin.
+
+    Every body is attracted by the sun and by the first len(masses) bodies,
+    the rest are massless test particles; thrust is the (accelerations,
+    targets) pair filled by update_thrust. buffers, a DerivativeBuffers
+    of the state's shape, saves allocating the N x len(masses)
+    temporaries. time is unused, the system is autonomous.
+    """
+    x, y = state[:, X], state[:, Y]
+    massive = len(masses)
+    if buffers is None:
+        buffers = DerivativeBuffers(len(state), massive)
+    d_x = np.subtract(x[np.newaxis, :massive], x[:, np.newaxis], out=buffers.d_x)
+    d_y = np.subtract(y[np.newaxis, :massive], y[:, np.newaxis], out=buffers.d_y)
+    distance_cubed = np.multiply(d_x, d_x, out=buffers.distance_cubed)
+    distance_cubed += np.multiply(d_y, d_y, out=buffers.pref)
+    np.power(distance_cubed, 1.5, out=distance_cubed)
+    np.fill_diagonal(distance_cubed[:massive], np.inf)
+    pref = np.divide(G * masses, distance_cubed, out=buffers.pref)
+    sun_pref = G * sun_mass / (x ** 2 + y ** 2) ** 1.5
+
+    derivatives = np.empty_like(state) if out is None else out
+    derivatives[:, X] = state[:, V_X]
+    derivatives[:, Y] = state[:, V_Y]
+    np.multiply(pref, d_x, out=d_x).sum(axis=1, out=derivatives[:, V_X])
+    np.multiply(pref, d_y, out=d_y).sum(axis=1, out=derivatives[:, V_Y])
+    derivatives[:, V_X] -= sun_pref * x
+    derivatives[:, V_Y] -= sun_pref * y
+
+    if thrust is not None:
+        accelerations, targets = thrust
+        to_x = np.append(x, 0)[targets] - x
+        to_y = np.append(y, 0)[targets] - y
+        pref = accelerations / np.sqrt(to_x ** 2 + to_y ** 2)
+        derivatives[:, V_X] += pref * to_x
+        derivatives[:, V_Y] += pref * to_y
+    return derivatives
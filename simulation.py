@@ -0,0 +1,539 @@
+import argparse
+import json
+import math
+import numpy as np
+
+from copy import deepcopy
+
+from catalog import MINOR_BODIES_SEED, PLANET_CATALOG, get_catalog_configs, get_minor_bodies_state
+from diagnostics import ConservationMonitor, get_planet_masses
+from events import EventDetector, get_ship_events
+from checkpoint import get_checkpoint, load_checkpoint, save_checkpoint
+from profiling import Profiler
+from planet import Planet, get_orbit_states, to_radian
+from runner import INTEGRATORS, get_ensemble_stepper, get_system_stepper
+
+
+DELTA_T = 100000
+START_VELOCITY = 30000
+EARTH_TRUE_ANOMALY = 259
+MARS_TRUE_ANOMALY = 244
+SHIP_TRUE_ANOMALY = 260
+STREAM_CHUNK_SIZE = 1024  # samples
+
+
+def get_planet_configs(
+    canvas_width,
+    canvas_height,
+    ship_start_velocity,
+    earth_true_anomaly,
+    mars_true_anomaly,
+    ship_true_anomaly,
+    ship_earth_a_config=(),
+    ship_mars_a_config=(),
+    ship_sun_a_config=(),
+):
+    canvas_orbit_radius = min(canvas_height, canvas_width) / 2 - 30
+    start_of_coordinates = (canvas_width / 2, canvas_height / 2)
+
+    sun_config = dict(
+        large_half_life=0,
+        planet_r=15,  # pixels
+        orbit_center=start_of_coordinates,
+        eccentricity=0,
+        color='yellow',
+        lambda_offset=0,
+        mass=1.989 * math.pow(10, 30),
+        a_config=ship_sun_a_config,
+    )
+
+    earth_config = dict(
+        large_half_life=1.496 * math.pow(10, 11),  # meters
+        planet_r=7,  # pixels
+        orbit_center=start_of_coordinates,
+        eccentricity=0.0167,
+        color='blue',
+        lambda_offset=earth_true_anomaly,
+        perihelion_longitude=336,
+        mass=5.972 * math.pow(10, 24),
+        a_config=ship_earth_a_config,
+    )
+
+    mars_config = dict(
+        large_half_life=2.279 * math.pow(10, 11),  # meters
+        planet_r=4,  # pixels
+        orbit_center=start_of_coordinates,
+        eccentricity=0.0934,
+        color='red',
+        lambda_offset=mars_true_anomaly,
+        perihelion_longitude=101,
+        mass=6.39 * math.pow(10, 23),
+        a_config=ship_mars_a_config,
+    )
+
+    ship_config = deepcopy(earth_config)
+    ship_config.update(dict(
+        color='green',
+        lambda_offset=ship_true_anomaly,
+        planet_r=2,
+        mass=10000,
+        a_config=(),
+        start_velocity=ship_start_velocity,
+    ))
+
+    scale = canvas_orbit_radius / max(
+        earth_config['large_half_life'] * (1 + earth_config['eccentricity']),
+        mars_config['large_half_life'] * (1 + mars_config['eccentricity']),
+    )
+    return dict(
+        earth_config=earth_config,
+        sun_config=sun_config,
+        mars_config=mars_config,
+        ship_config=ship_config,
+        canvas_orbit_radius=canvas_orbit_radius,
+        scale=scale,
+    )
+
+
+def get_bodies(
+    ship_start_velocity=START_VELOCITY,
+    earth_true_anomaly=EARTH_TRUE_ANOMALY,
+    mars_true_anomaly=MARS_TRUE_ANOMALY,
+    ship_true_anomaly=SHIP_TRUE_ANOMALY,
+    ship_earth_a_config=(),
+    ship_mars_a_config=(),
+    ship_sun_a_config=(),
+    with_ship=True,
+    extra_planets=(),
+):
+    """
+    Sun, planets and ships built from get_planet_configs without any canvas.
+
+    extra_planets names catalog.PLANET_CATALOG bodies to add after the Earth and Mars.
+    """
+    configs = get_planet_configs(
+        0, 0,
+        ship_start_velocity,
+        earth_true_anomaly=earth_true_anomaly,
+        mars_true_anomaly=mars_true_anomaly,
+        ship_true_anomaly=ship_true_anomaly,
+        ship_earth_a_config=ship_earth_a_config,
+        ship_mars_a_config=ship_mars_a_config,
+        ship_sun_a_config=ship_sun_a_config,
+    )
+    sun = Planet('Sun', None, 1, **configs['sun_config'])
+    planets = (
+        Planet('Earth', None, 1, **configs['earth_config']),
+        Planet('Mars', None, 1, **configs['mars_config']),
+    ) + tuple(
+        Planet(name, None, 1, **config) for name, config in zip(extra_planets, get_catalog_configs(extra_planets))
+    )
+    ships = (Planet('Ship', None, 1, **configs['ship_config']),) if with_ship else ()
+    return sun, planets, ships
+
+
+class Simulation:
+    """
+    Integrates the sun, planets and ships without any GUI.
+
+    The state is an (N, 4) array of (x, v_x, y, v_y) rows, planets first,
+    then ships, then the massless minor bodies of minor_state if given.
+    Planet objects are only read at construction time; call sync_bodies
+    to copy the state back to them. sample_interval is the configured
+    delta_t, which run and stream sample at, while adaptive integrators
+    change their own delta_t as they go.
+    """
+
+    def __init__(
+        self, sun, planets, objects_with_custom_accelerations=(), delta_t=DELTA_T,
+        integrator='rk4', minor_state=None, **integrator_options
+    ):
+        self.sun = sun
+        self.planets = tuple(planets)
+        self.objects_with_custom_accelerations = tuple(objects_with_custom_accelerations)
+        self.bodies = self.planets + self.objects_with_custom_accelerations
+        self.integrator = integrator
+        self.integrator_options = integrator_options
+        self.sample_interval = delta_t
+        self.stepper = get_system_stepper(
+            sun, self.planets, delta_t, self.objects_with_custom_accelerations,
+            integrator=integrator, minor_state=minor_state, **integrator_options
+        )
+
+    @property
+    def names(self):
+        return [body.name for body in self.bodies] + ['Asteroid %s' % i for i in range(len(self.minor_state))]
+
+    @property
+    def minor_state(self):
+        return self.state[len(self.bodies):]
+
+    @property
+    def state(self):
+        return self.stepper.state
+
+    @property
+    def time(self):
+        return self.stepper.time
+
+    @property
+    def adaptive(self):
+        return self.stepper.adaptive
+
+    @property
+    def delta_t(self):
+        return self.stepper.delta_t
+
+    @delta_t.setter
+    def delta_t(self, delta_t):
+        self.stepper.delta_t = self.sample_interval = delta_t
+
+    def step(self, steps=1):
+        return self.stepper.step(steps)
+
+    def advance(self, until):
+        return self.stepper.advance(until)
+
+    def restore(self, time, state):
+        """Continue from the (N, 4) state at time."""
+        self.stepper.reset(state, time)
+
+    def derivatives(self, state, time):
+        """Time derivative of an (N, 4) state under the current thrust."""
+        return self.stepper.derivatives(np.array(state, dtype=float), out=np.empty(np.shape(state)), time=time)
+
+    def advance_detecting(self, until, detector):
+        """
+        Advance to until one step at a time, checking detector for events.
+
+        Stops at the first terminal event instead and returns True then.
+        """
+        while until - self.time > 1e-9 * self.delta_t:
+            time0, state0 = self.time, self.state.copy()
+            self.advance(min(self.time + self.delta_t, until))
+            record = detector.check(time0, state0, self.time, self.state.copy(), self.derivatives)
+            if record is not None:
+                self.restore(record.time, record.state)
+                return True
+        return False
+
+    def stream(self, duration=None, save_every=1, detector=None, chunk_size=STREAM_CHUNK_SIZE):
+        """
+        Integrate for duration seconds, forever if None, yielding (times, states) chunks.
+
+        Chunks hold up to chunk_size consecutive samples of run, times of
+        shape (T,) and states (T, N, 4), the first chunk starting with the
+        current state. Every chunk is a new array the consumer may keep,
+        and the next one is only integrated when it is asked for, so
+        chained generators process any run length in constant memory.
+        """
+        interval = save_every * self.sample_interval
+        start = self.time
+        end = math.inf if duration is None else start + duration
+        samples = math.inf if duration is None else int(math.ceil(duration / interval - 1e-9)) + 1
+        i = 0
+        while i < samples:
+            size = int(min(chunk_size, samples - i))
+            times = np.empty(size)
+            states = np.empty((size,) + self.state.shape)
+            for j in range(size):
+                if i + j:
+                    until = min(start + (i + j) * interval, end)
+                    if detector is None:
+                        self.advance(until)
+                    elif self.advance_detecting(until, detector):
+                        times[j], states[j] = self.time, self.state
+                        yield times[:j + 1], states[:j + 1]
+                        return
+                times[j], states[j] = self.time, self.state
+            yield times, states
+            i += size
+
+    def run(self, duration, save_every=1, detector=None):
+        """
+        Integrate for duration seconds and return (times, states).
+
+        states is a (T, N, 4) array holding the initial state and the state
+        every save_every * sample_interval seconds after it. Adaptive
+        integrators choose their own steps in between. With an events.EventDetector the
+        run stops early at a terminal event, the last sample being its state.
+        """
+        interval = save_every * self.sample_interval
+        samples = int(math.ceil(duration / interval - 1e-9)) + 1
+        return next(self.stream(duration, save_every, detector, chunk_size=samples))
+
+    def sync_bodies(self):
+        for (x, v_x, y, v_y), body in zip(self.state, self.bodies):
+            body.set_coordinates_and_velocity(x, v_x, y, v_y)
+
+
+class Ensemble(Simulation):
+    """
+    Planets integrated once together with many massless ships.
+
+    The state holds the planets followed by one row per ship. Every ship
+    has its own thrust tables and feels the sun and the planets only.
+    """
+
+    def __init__(
+        self, sun, planets, ships_state, ships_a_configs, delta_t=DELTA_T,
+        integrator='rk4', **integrator_options
+    ):
+        self.sun = sun
+        self.planets = self.bodies = tuple(planets)
+        self.objects_with_custom_accelerations = ()
+        self.integrator = integrator
+        self.integrator_options = integrator_options
+        self.sample_interval = delta_t
+        self.stepper = get_ensemble_stepper(
+            sun, self.planets, ships_state, ships_a_configs, delta_t,
+            integrator=integrator, **integrator_options
+        )
+
+    @property
+    def names(self):
+        return [body.name for body in self.planets] + ['Ship %s' % i for i in range(len(self.ships_state))]
+
+    @property
+    def ships_state(self):
+        return self.state[len(self.planets):]
+
+
+def get_ensemble(
+    ships,
+    delta_t=DELTA_T,
+    earth_true_anomaly=EARTH_TRUE_ANOMALY,
+    mars_true_anomaly=MARS_TRUE_ANOMALY,
+    integrator='rk4',
+    integrator_options=None,
+):
+    """
+    Ensemble of ship variants sharing the planets.
+
+    ships is a sequence of dicts with ship_start_velocity, ship_true_anomaly
+    and the ship_earth_a_config, ship_mars_a_config, ship_sun_a_config tables.
+    """
+    sun, planets, _ = get_bodies(
+        earth_true_anomaly=earth_true_anomaly,
+        mars_true_anomaly=mars_true_anomaly,
+        with_ship=False,
+    )
+    ships_state, ships_a_configs = get_ships(ships, earth_true_anomaly, mars_true_anomaly)
+    return Ensemble(
+        sun, planets, ships_state, ships_a_configs, delta_t=delta_t,
+        integrator=integrator, **(integrator_options or {})
+    )
+
+
+def get_ships(ships, earth_true_anomaly=EARTH_TRUE_ANOMALY, mars_true_anomaly=MARS_TRUE_ANOMALY):
+    """(M, 4) initial state and per ship a_config tables of the ship dicts taken by get_ensemble."""
+    ship_config = get_planet_configs(0, 0, 0, earth_true_anomaly, mars_true_anomaly, 0)['ship_config']
+    ships_state = get_orbit_states(
+        ship_config['large_half_life'],
+        ship_config['eccentricity'],
+        to_radian(ship_config['perihelion_longitude']),
+        to_radian(np.array([ship.get('ship_true_anomaly', SHIP_TRUE_ANOMALY) for ship in ships], dtype=float)),
+        np.array([ship.get('ship_start_velocity', START_VELOCITY) or 0 for ship in ships], dtype=float),
+    )
+    ships_a_configs = [
+        [ship.get(name, ()) for name in ('ship_earth_a_config', 'ship_mars_a_config', 'ship_sun_a_config')]
+        for ship in ships
+    ]
+    return ships_state.reshape(-1, 4), ships_a_configs
+
+
+def get_simulation(
+    delta_t=DELTA_T, integrator='rk4', integrator_options=None, minor_bodies=0, minor_bodies_seed=MINOR_BODIES_SEED,
+    **kwargs
+):
+    """
+    Headless Simulation taking the same inputs as get_planet_configs, see get_bodies.
+
+    minor_bodies is the number of massless asteroids drawn from minor_bodies_seed.
+    """
+    sun, planets, ships = get_bodies(**kwargs)
+    return Simulation(
+        sun, planets, ships, delta_t=delta_t, integrator=integrator,
+        minor_state=get_minor_bodies_state(minor_bodies, minor_bodies_seed) if minor_bodies else None,
+        **(integrator_options or {})
+    )
+
+
+def restore_simulation(checkpoint, **overrides):
+    """
+    Simulation continuing from a checkpoint.load_checkpoint result.
+
+    overrides replace config entries, so branches with other thrust
+    settings can fork from the same state.
+    """
+    simulation = get_simulation(
+        delta_t=checkpoint['delta_t'],
+        integrator=checkpoint['integrator'],
+        integrator_options=checkpoint['integrator_options'],
+        **dict(checkpoint['config'], **overrides)
+    )
+    if simulation.names != checkpoint['names']:
+        raise ValueError('Checkpoint of %s can not restore %s' % (checkpoint['names'], simulation.names))
+    simulation.restore(checkpoint['time'], checkpoint['state'])
+    return simulation
+
+
+def parse_a_config(value):
+    """'distance:acceleration' pair as used by the a_config tables."""
+    distance, acceleration = value.split(':')
+    return float(distance), float(acceleration)
+
+
+def parse_radius(value):
+    """'body:radius' pair of an event sphere."""
+    body, radius = value.split(':')
+    return body.capitalize(), float(radius)
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Run the Earth-Mars ship simulation without GUI.')
+    parser.add_argument('--delta-t', type=float, default=DELTA_T, help='time step (initial one if adaptive), seconds')
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='rk4')
+    parser.add_argument('--rtol', type=float, help='relative tolerance of adaptive integrators')
+    parser.add_argument('--atol', type=float, help='absolute tolerance of adaptive integrators')
+    parser.add_argument('--duration', type=float, required=True, help='simulated time, seconds')
+    parser.add_argument('--save-every', type=int, default=1, help='keep every N-th step of the trajectory')
+    parser.add_argument('--start-velocity', type=float, default=START_VELOCITY)
+    parser.add_argument('--earth-true-anomaly', type=float, default=EARTH_TRUE_ANOMALY)
+    parser.add_argument('--mars-true-anomaly', type=float, default=MARS_TRUE_ANOMALY)
+    parser.add_argument('--ship-true-anomaly', type=float, default=SHIP_TRUE_ANOMALY)
+    parser.add_argument('--without-ship', action='store_true')
+    parser.add_argument(
+        '--extra-planets', nargs='*', default=[], choices=sorted(PLANET_CATALOG), metavar='PLANET',
+        help='catalog planets to add, any of %s' % ', '.join(PLANET_CATALOG),
+    )
+    parser.add_argument('--asteroids', type=int, default=0, help='number of massless asteroids')
+    parser.add_argument('--asteroids-seed', type=int, default=MINOR_BODIES_SEED)
+    for body in ('earth', 'mars', 'sun'):
+        parser.add_argument(
+            '--%s-a-config' % body, type=parse_a_config, nargs='*', default=[],
+            metavar='DISTANCE:ACCELERATION',
+            help='ship acceleration settings near the %s' % body.capitalize(),
+        )
+    parser.add_argument('--output', default='trajectory.npz', help='.npz file with times, states and names')
+    parser.add_argument('--restore', metavar='CHECKPOINT', help='continue from a checkpoint, ignoring the body options')
+    parser.add_argument('--checkpoint', help='.npz file to keep the latest checkpoint in')
+    parser.add_argument('--checkpoint-every', type=float, help='simulated seconds between checkpoints')
+    parser.add_argument(
+        '--event-radius', type=parse_radius, nargs='*', default=[], metavar='BODY:RADIUS',
+        help='record the ship entering and leaving this sphere around the body',
+    )
+    parser.add_argument(
+        '--stop-on', nargs='*', default=[], metavar='EVENT',
+        help="stop at the first of these events, e.g. 'enter Mars' or 'closest Mars'",
+    )
+    parser.add_argument('--profile', metavar='REPORT', help='time the integration and write a JSON report')
+    parser.add_argument(
+        '--max-drift', type=float,
+        help='fail if the relative energy or angular momentum drift of the planets exceeds this',
+    )
+    return parser
+
+
+def run(args=None):
+    parser = get_argument_parser()
+    args = parser.parse_args(args)
+    if args.restore:
+        checkpoint = load_checkpoint(args.restore)
+        config = checkpoint['config']
+        simulation = restore_simulation(checkpoint)
+    else:
+        config = dict(
+            ship_start_velocity=args.start_velocity,
+            earth_true_anomaly=args.earth_true_anomaly,
+            mars_true_anomaly=args.mars_true_anomaly,
+            ship_true_anomaly=args.ship_true_anomaly,
+            ship_earth_a_config=args.earth_a_config,
+            ship_mars_a_config=args.mars_a_config,
+            ship_sun_a_config=args.sun_a_config,
+            with_ship=not args.without_ship,
+            extra_planets=args.extra_planets,
+            minor_bodies=args.asteroids,
+            minor_bodies_seed=args.asteroids_seed,
+        )
+        simulation = get_simulation(
+            delta_t=args.delta_t,
+            integrator=args.integrator,
+            integrator_options={
+                name: getattr(args, name) for name in ('rtol', 'atol') if getattr(args, name) is not None
+            },
+            **config
+        )
+
+    profiler = Profiler(enabled=True) if args.profile else None
+    if profiler:
+        profiler.instrument(simulation.stepper)
+
+    detector = None
+    if args.event_radius or args.stop_on:
+        if not config['with_ship']:
+            parser.error('--event-radius and --stop-on need a ship')
+        events = get_ship_events(
+            simulation.names,
+            targets=[planet.name for planet in simulation.planets] + ['Sun'],
+            radii=dict(args.event_radius),
+            a_configs={
+                name: config['ship_%s_a_config' % name.lower()] for name in ('Earth', 'Mars', 'Sun')
+            },
+            terminal=args.stop_on,
+        )
+        unknown = set(args.stop_on) - {event.name for event in events}
+        if unknown:
+            parser.error('unknown --stop-on events %s, expected any of %s' % (
+                ', '.join(sorted(unknown)), ', '.join(event.name for event in events),
+            ))
+        detector = EventDetector(events)
+
+    end = simulation.time + args.duration
+    segment = args.checkpoint_every or args.duration
+    times, states = simulation.run(min(segment, args.duration), save_every=args.save_every, detector=detector)
+    parts = [(times, states)]
+    while end - simulation.time > 1e-9 * simulation.sample_interval and not (detector and detector.stopped):
+        if args.checkpoint:
+            save_checkpoint(args.checkpoint, get_checkpoint(simulation, config))
+        times, states = simulation.run(
+            min(segment, end - simulation.time), save_every=args.save_every, detector=detector,
+        )
+        parts.append((times[1:], states[1:]))
+    if args.checkpoint:
+        save_checkpoint(args.checkpoint, get_checkpoint(simulation, config))
+    times = np.concatenate([times for times, _ in parts])
+    states = np.concatenate([states for _, states in parts])
+
+    records = detector.records if detector else []
+    monitor = ConservationMonitor(get_planet_masses(simulation), simulation.sun.mass)
+    monitor.reset(states[0])
+    energy_drift, angular_momentum_drift = monitor.get_drifts(states)
+    np.savez(
+        args.output, times=times, states=states, names=simulation.names,
+        energy_drift=energy_drift, angular_momentum_drift=angular_momentum_drift,
+        event_names=[record.name for record in records],
+        event_times=np.array([record.time for record in records]),
+        event_states=np.array([record.state for record in records]).reshape((-1,) + states.shape[1:]),
+    )
+    print('Saved %s states of %s to %s' % (len(times), ', '.join(simulation.names), args.output))
+    for record in records:
+        print('%s at %s s' % (record.name, record.time))
+    if simulation.adaptive:
+        print(', '.join('%s: %s' % item for item in sorted(simulation.stepper.stats().items())))
+    max_drift = max(np.abs(energy_drift).max(), np.abs(angular_momentum_drift).max())
+    print('Max relative drift: energy %.2e, angular momentum %.2e' % (
+        np.abs(energy_drift).max(), np.abs(angular_momentum_drift).max(),
+    ))
+    if profiler:
+        profiler.count('bodies', len(simulation.state))
+        profiler.count('evaluations', simulation.stepper.evaluations)
+        with open(args.profile, 'w') as f:
+            json.dump(profiler.report(), f, indent=2)
+        print(profiler.format())
+    if args.max_drift and max_drift > args.max_drift:
+        raise SystemExit('Relative drift %.3g exceeds --max-drift %.3g' % (max_drift, args.max_drift))
+
+
+if __name__ == '__main__':
+    run()
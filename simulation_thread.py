@@ -0,0 +1,94 @@
+import math
+import time as wall_clock
+
+from queue import Queue, Empty, Full
+from threading import Event, Thread
+
+from profiling import PROFILER
+
+
+QUEUE_SIZE = 256
+
+
+class SimulationThread(Thread):
+    """
+    Advances a Simulation in the background and publishes (time, state) copies.
+
+    Every published state is interval simulated seconds after the previous
+    one. The thread keeps at most speed simulated seconds per wall second
+    and blocks while the bounded queue is full, so a slow consumer slows
+    the simulation down instead of piling states up. A speed of zero or
+    less holds the run until the speed changes.
+    """
+
+    def __init__(self, simulation, interval, speed, queue_size=QUEUE_SIZE):
+        super().__init__(daemon=True)
+        self.simulation = simulation
+        self.interval = interval
+        self.states = Queue(maxsize=queue_size)
+        self.running = Event()
+        self.stopped = Event()
+        self.error = None
+        self.set_speed(speed)
+
+    def set_speed(self, speed):
+        self.speed = speed
+        self.reset_clock()
+
+    def reset_clock(self):
+        self.clock_start = wall_clock.perf_counter(), self.simulation.time
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.reset_clock()
+        self.running.set()
+
+    def stop(self):
+        self.stopped.set()
+        self.running.set()
+
+    def run(self):
+        try:
+            while not self.stopped.is_set():
+                if not self.running.wait(timeout=0.1) or self.stopped.is_set():
+                    continue
+                if not self.simulation.adaptive:
+                    self.simulation.delta_t = self.interval
+                self.simulation.sample_interval = self.interval
+                self.simulation.advance(self.simulation.time + self.interval)
+                with PROFILER.phase('publish'):
+                    self.publish((self.simulation.time, self.simulation.state.copy()))
+                self.throttle()
+        except Exception as e:
+            self.error = e
+            self.stopped.set()
+
+    def publish(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.states.put(item, timeout=0.1)
+                return
+            except Full:
+                pass
+
+    def throttle(self):
+        """Wait until the wall clock catches up with the simulation, for good while the speed is not positive."""
+        while self.running.is_set() and not self.stopped.is_set():
+            wall_start, time_start = self.clock_start
+            ahead = math.inf
+            if self.speed > 0:
+                ahead = (self.simulation.time - time_start) / self.speed - (wall_clock.perf_counter() - wall_start)
+                if ahead <= 0:
+                    return
+            wall_clock.sleep(min(ahead, 0.1))
+
+    def drain(self):
+        """All states published since the last drain, oldest first."""
+        items = []
+        while True:
+            try:
+                items.append(self.states.get_nowait())
+            except Empty:
+                return items
@@ -0,0 +1,176 @@
+import argparse
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import product
+
+from ephemeris import EPHEMERIS_CACHE, get_ephemeris_ensemble
+from events import EventDetector, get_ship_events
+from runner import INTEGRATORS, X, V_X, Y, V_Y
+from simulation import (
+    DELTA_T, START_VELOCITY, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, SHIP_TRUE_ANOMALY,
+    get_simulation, parse_a_config,
+)
+
+
+SWEEP_AXES = ('ship_true_anomaly', 'earth_true_anomaly', 'mars_true_anomaly', 'ship_start_velocity')
+METRICS = ('min_distance', 'closest_approach_time', 'arrival_velocity')
+
+
+def get_closest_approach(times, states, ship_index, body_index):
+    """Minimum ship-body distance, its time and the relative velocity at it."""
+    relative = states[:, ship_index] - states[:, body_index]
+    distances = np.hypot(relative[:, X], relative[:, Y])
+    i = np.argmin(distances)
+    return distances[i], times[i], np.hypot(relative[i, V_X], relative[i, V_Y])
+
+
+def evaluate_point(
+    point, duration, delta_t=DELTA_T, integrator='rk4', target='Mars', arrival_radius=None, use_ephemeris=False,
+    **a_configs
+):
+    """
+    METRICS of one launch configuration, point is a tuple of SWEEP_AXES values.
+
+    The planets and the ship are integrated together unless use_ephemeris,
+    when the ship is integrated alone against the process' ephemeris cache
+    and points sharing the Earth and Mars anomalies integrate the planets
+    once. With only the Earth and Mars that is no faster and slightly less
+    accurate. Closest approaches are located between the steps, and with
+    an arrival_radius the run stops once the ship gets that close to target.
+    """
+    ship_true_anomaly, earth_true_anomaly, mars_true_anomaly, ship_start_velocity = point
+    ship = dict(a_configs, ship_true_anomaly=ship_true_anomaly, ship_start_velocity=ship_start_velocity)
+    if use_ephemeris:
+        simulation = get_ephemeris_ensemble(
+            [ship],
+            delta_t=delta_t,
+            earth_true_anomaly=earth_true_anomaly,
+            mars_true_anomaly=mars_true_anomaly,
+            integrator=integrator,
+            duration=duration,
+        )
+        ship_name = 'Ship 0'
+    else:
+        simulation = get_simulation(
+            delta_t, integrator,
+            earth_true_anomaly=earth_true_anomaly, mars_true_anomaly=mars_true_anomaly, **ship
+        )
+        ship_name = 'Ship'
+    detector = EventDetector(get_ship_events(
+        simulation.names, ship=ship_name, targets=(target,),
+        radii={target: arrival_radius} if arrival_radius else None,
+        terminal=('enter %s' % target,),
+    ))
+    times, states = simulation.run(duration, detector=detector)
+    if detector.records:
+        times = np.append(times, [record.time for record in detector.records])
+        states = np.concatenate([states, [record.state for record in detector.records]])
+    return get_closest_approach(
+        times, states, simulation.names.index(ship_name), simulation.names.index(target),
+    )
+
+
+def set_ephemeris_directory(directory):
+    EPHEMERIS_CACHE.directory = directory
+
+
+def sweep(
+    duration,
+    ship_true_anomaly=(SHIP_TRUE_ANOMALY,),
+    earth_true_anomaly=(EARTH_TRUE_ANOMALY,),
+    mars_true_anomaly=(MARS_TRUE_ANOMALY,),
+    ship_start_velocity=(START_VELOCITY,),
+    workers=None,
+    chunksize=8,
+    ephemeris_directory=None,
+    **evaluate_kwargs
+):
+    """
+    Evaluate every combination of the axis values in a process pool.
+
+    Returns a dict of METRICS arrays, each shaped by the lengths of the
+    axes in SWEEP_AXES order. With use_ephemeris in evaluate_kwargs workers
+    keep planet ephemerides in memory and, with ephemeris_directory, share
+    them on disk.
+    """
+    axes = [np.atleast_1d(np.asarray(values, dtype=float)) for values in (
+        ship_true_anomaly, earth_true_anomaly, mars_true_anomaly, ship_start_velocity,
+    )]
+    shape = tuple(len(values) for values in axes)
+    results = np.empty(shape + (len(METRICS),))
+    evaluate = partial(evaluate_point, duration=duration, **evaluate_kwargs)
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=set_ephemeris_directory, initargs=(ephemeris_directory,)
+    ) as executor:
+        for i, metrics in enumerate(executor.map(evaluate, product(*axes), chunksize=chunksize)):
+            results[np.unravel_index(i, shape)] = metrics
+    return dict(
+        {name: results[..., i] for i, name in enumerate(METRICS)},
+        **dict(zip(SWEEP_AXES, axes))
+    )
+
+
+def parse_range(value):
+    """'start:stop:count' as np.linspace or a single number."""
+    if ':' not in value:
+        return np.array([float(value)])
+    start, stop, count = value.split(':')
+    return np.linspace(float(start), float(stop), int(count))
+
+
+def get_argument_parser():
+    parser = argparse.ArgumentParser(description='Sweep launch parameters and find the closest approach to Mars.')
+    parser.add_argument('--duration', type=float, required=True, help='simulated time of every run, seconds')
+    parser.add_argument('--delta-t', type=float, default=DELTA_T)
+    parser.add_argument('--integrator', choices=sorted(INTEGRATORS), default='rk4')
+    for name, default in zip(SWEEP_AXES, (SHIP_TRUE_ANOMALY, EARTH_TRUE_ANOMALY, MARS_TRUE_ANOMALY, START_VELOCITY)):
+        parser.add_argument(
+            '--%s' % name.replace('_', '-'), type=parse_range, default=np.array([default]),
+            metavar='START:STOP:COUNT',
+        )
+    for body in ('earth', 'mars', 'sun'):
+        parser.add_argument(
+            '--%s-a-config' % body, type=parse_a_config, nargs='*', default=[],
+            metavar='DISTANCE:ACCELERATION',
+        )
+    parser.add_argument('--arrival-radius', type=float, help='stop a run once the ship is this close to Mars, m')
+    parser.add_argument('--workers', type=int, help='worker processes, all CPUs by default')
+    parser.add_argument(
+        '--ephemeris', action='store_true',
+        help='integrate the ship alone against cached planet ephemerides instead of with the planets',
+    )
+    parser.add_argument(
+        '--ephemeris-directory', help='directory to keep planet ephemerides between runs, implies --ephemeris',
+    )
+    parser.add_argument('--output', default='sweep.npz')
+    return parser
+
+
+def run(args=None):
+    args = get_argument_parser().parse_args(args)
+    results = sweep(
+        args.duration,
+        delta_t=args.delta_t,
+        integrator=args.integrator,
+        workers=args.workers,
+        ephemeris_directory=args.ephemeris_directory,
+        arrival_radius=args.arrival_radius,
+        use_ephemeris=args.ephemeris or bool(args.ephemeris_directory),
+        ship_earth_a_config=args.earth_a_config,
+        ship_mars_a_config=args.mars_a_config,
+        ship_sun_a_config=args.sun_a_config,
+        **{name: getattr(args, name) for name in SWEEP_AXES}
+    )
+    np.savez(args.output, **results)
+    best = np.unravel_index(np.argmin(results['min_distance']), results['min_distance'].shape)
+    print('Closest approach %s m at %s s with %s' % (
+        results['min_distance'][best],
+        results['closest_approach_time'][best],
+        ', '.join('%s=%s' % (name, results[name][i]) for name, i in zip(SWEEP_AXES, best)),
+    ))
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,85 @@
+import numpy as np
+
+from runge_kutta_solver import FixedStepper
+
+
+YOSHIDA_W1 = 1 / (2 - 2 ** (1 / 3))
+YOSHIDA_W0 = -2 ** (1 / 3) / (2 - 2 ** (1 / 3))
+
+# ('kick' | 'drift', fraction of delta_t) sequences
+LEAPFROG_SEQUENCE = (
+    ('kick', 1 / 2),
+    ('drift', 1),
+    ('kick', 1 / 2),
+)
+# leapfrog composed over w1, w0, w1 fractions of the step
+YOSHIDA_SEQUENCE = (
+    ('kick', YOSHIDA_W1 / 2),
+    ('drift', YOSHIDA_W1),
+    ('kick', (YOSHIDA_W1 + YOSHIDA_W0) / 2),
+    ('drift', YOSHIDA_W0),
+    ('kick', (YOSHIDA_W0 + YOSHIDA_W1) / 2),
+    ('drift', YOSHIDA_W1),
+    ('kick', YOSHIDA_W1 / 2),
+)
+
+
+class SymplecticStepper(FixedStepper):
+    """
+    Kick-drift splitting integrator advancing the state in place.
+
+    State rows alternate position and velocity components, (x, v_x, y, v_y),
+    and the accelerations written by derivatives may depend on positions only.
+    The acceleration of the last kick is reused by the first kick of the
+    next step unless before_step returns True.
+    """
+    sequence = ()
+
+    def __init__(self, derivatives, state, delta_t, before_step=None):
+        super().__init__(derivatives, state, delta_t, before_step)
+        self.positions = self.state[..., 0::2]
+        self.velocities = self.state[..., 1::2]
+        self.derivative = np.empty_like(self.state)
+        self.accelerations = self.derivative[..., 1::2]
+        self.scratch = np.empty_like(self.positions)
+        self.accelerations_are_current = False
+        self.stage_time = 0
+
+    def kick(self, delta_t):
+        if not self.accelerations_are_current:
+            self.derivatives(self.state, out=self.derivative, time=self.stage_time)
+            self.evaluations += 1
+            self.accelerations_are_current = True
+        np.multiply(self.accelerations, delta_t, out=self.scratch)
+        self.velocities += self.scratch
+
+    def drift(self, delta_t):
+        np.multiply(self.velocities, delta_t, out=self.scratch)
+        self.positions += self.scratch
+        self.stage_time += delta_t
+        self.accelerations_are_current = False
+
+    def reset(self, state, time):
+        super().reset(state, time)
+        self.accelerations_are_current = False
+
+    def take_step(self, delta_t):
+        if self.before_step is not None and self.before_step(self.state, time=self.time):
+            self.accelerations_are_current = False
+        self.stage_time = self.time
+        for operation, fraction in self.sequence:
+            if operation == 'kick':
+                self.kick(fraction * delta_t)
+            else:
+                self.drift(fraction * delta_t)
+        self.time += delta_t
+
+
+class LeapfrogStepper(SymplecticStepper):
+    """Second order kick-drift-kick leapfrog."""
+    sequence = LEAPFROG_SEQUENCE
+
+
+class YoshidaStepper(SymplecticStepper):
+    """Fourth order Yoshida composition of three leapfrog steps."""
+    sequence = YOSHIDA_SEQUENCE
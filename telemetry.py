@@ -0,0 +1,150 @@
+import os
+import os.path
+import numpy as np
+
+
+TELEMETRY_BLOCK_SIZE = 65536  # rows kept in memory per column before a flush
+NPY_HEADER_SIZE = 128
+COLUMNS_FILE_NAME = 'columns.txt'
+
+
+def get_telemetry_columns(planet_names):
+    return [
+        'time', 'ship_sun_velocity', 'ship_sun_velocity_x', 'ship_sun_velocity_y', 'ship_sun_distance',
+    ] + [
+        'ship_%s_%s' % (name.lower(), quantity) for name in planet_names for quantity in ('velocity', 'distance')
+    ]
+
+
+def get_ship_telemetry(times, states, ship_index, planets_count):
+    """
+    (T, C) rows of get_telemetry_columns for T (N, 4) states of the ship at ship_index.
+
+    Ship-sun velocity and distance are followed by the ship relative velocity
+    and distance to each of the first planets_count bodies.
+    """
+    states = np.asarray(states)
+    ship = states[:, ship_index]
+    relative = ship[:, np.newaxis] - states[:, :planets_count]
+    rows = np.empty((len(states), 5 + 2 * planets_count))
+    rows[:, 0] = times
+    rows[:, 1] = np.hypot(ship[:, 1], ship[:, 3])
+    rows[:, 2] = ship[:, 1]
+    rows[:, 3] = ship[:, 3]
+    rows[:, 4] = np.hypot(ship[:, 0], ship[:, 2])
+    rows[:, 5::2] = np.hypot(relative[..., 1], relative[..., 3])
+    rows[:, 6::2] = np.hypot(relative[..., 0], relative[..., 2])
+    return rows
+
+
+def get_npy_header(count, dtype=np.float64):
+    """Fixed size version 1.0 .npy header of a 1-d array, rewritten in place as the file grows."""
+    header = repr({'descr': np.lib.format.dtype_to_descr(np.dtype(dtype)), 'fortran_order': False, 'shape': (count,)})
+    prefix = np.lib.format.MAGIC_PREFIX + bytes([1, 0])
+    length = NPY_HEADER_SIZE - len(prefix) - 2
+    header = header.ljust(length - 1) + '\n'
+    return prefix + length.to_bytes(2, 'little') + header.encode('latin1')
+
+
+class TelemetryWriter:
+    """
+    Appends rows of float columns to one .npy file per column in directory.
+
+    Rows are collected in preallocated column blocks and written out
+    block_size rows at a time; the .npy headers are updated on every flush,
+    so whatever was flushed stays loadable. Only every every-th row is kept,
+    and with min_change only rows where some column other than the first
+    changed by more than that fraction since the last kept row.
+    """
+
+    def __init__(self, directory, columns, block_size=TELEMETRY_BLOCK_SIZE, every=1, min_change=0):
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.columns = list(columns)
+        self.every = max(int(every), 1)
+        self.min_change = min_change
+        self.block = np.empty((len(self.columns), block_size))
+        self.used = 0
+        self.count = 0
+        self.seen = 0
+        self.last = None
+        with open(os.path.join(directory, COLUMNS_FILE_NAME), 'w') as f:
+            f.write('\n'.join(self.columns) + '\n')
+        self.files = [open(os.path.join(directory, '%s.npy' % name), 'wb') for name in self.columns]
+        for f in self.files:
+            f.write(get_npy_header(0))
+            f.flush()
+
+    def select(self, rows):
+        kept = rows[(np.arange(self.seen, self.seen + len(rows)) % self.every) == 0]
+        self.seen += len(rows)
+        if not self.min_change or not len(kept):
+            return kept
+        # each step compares all the rows left against the last kept one at once
+        selected = []
+        start = 0
+        if self.last is None:
+            selected.append(0)
+            self.last = kept[0]
+            start = 1
+        while start < len(kept):
+            changed = np.any(
+                np.abs(kept[start:, 1:] - self.last[1:]) > self.min_change * np.abs(self.last[1:]), axis=1,
+            )
+            if not changed.any():
+                break
+            start += int(changed.argmax())
+            selected.append(start)
+            self.last = kept[start]
+            start += 1
+        return kept[selected]
+
+    def extend(self, rows):
+        """Append (T, C) rows."""
+        rows = self.select(np.asarray(rows, dtype=float).reshape(-1, len(self.columns)))
+        while len(rows):
+            taken = min(len(rows), self.block.shape[1] - self.used)
+            self.block[:, self.used:self.used + taken] = rows[:taken].T
+            self.used += taken
+            rows = rows[taken:]
+            if self.used == self.block.shape[1]:
+                self.flush()
+
+    def append(self, row):
+        self.extend(np.asarray(row, dtype=float)[np.newaxis])
+
+    def flush(self):
+        if not self.used:
+            return
+        self.count += self.used
+        for f, column in zip(self.files, self.block[:, :self.used]):
+            f.write(column.tobytes())
+            f.seek(0)
+            f.write(get_npy_header(self.count))
+            f.seek(0, os.SEEK_END)
+            f.flush()
+        self.used = 0
+
+    def close(self):
+        if self.files:
+            self.flush()
+            for f in self.files:
+                f.close()
+            self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def load_telemetry(directory, mmap_mode='r'):
+    """Dict of column name to the memory-mapped column written by TelemetryWriter."""
+    with open(os.path.join(directory, COLUMNS_FILE_NAME)) as f:
+        columns = f.read().split()
+    return {
+        name: np.load(os.path.join(directory, '%s.npy' % name), mmap_mode=mmap_mode)
+        for name in columns
+    }
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from checkpoint import get_checkpoint, load_checkpoint, save_checkpoint
+from simulation import get_simulation, restore_simulation
+
+
+CONFIG = dict(
+    ship_start_velocity=30000,
+    earth_true_anomaly=259,
+    mars_true_anomaly=244,
+    ship_true_anomaly=260,
+    ship_earth_a_config=[(1e9, 0.01)],
+    ship_mars_a_config=[],
+    ship_sun_a_config=[(3e11, -0.001)],
+    with_ship=True,
+    extra_planets=['Jupiter'],
+    minor_bodies=20,
+    minor_bodies_seed=7,
+)
+
+
+@pytest.mark.parametrize('integrator, integrator_options, rtol', [
+    ('rk4', {}, 0),
+    # the restored run takes its own steps, agreeing to the tolerance
+    ('dopri5', dict(rtol=1e-9), 1e-7),
+])
+def test_checkpoint_round_trip(tmp_path, integrator, integrator_options, rtol):
+    simulation = get_simulation(3600, integrator, integrator_options, **CONFIG)
+    simulation.advance(30 * 86400)
+    path = str(tmp_path / 'run' / 'checkpoint.npz')
+    save_checkpoint(path, get_checkpoint(simulation, CONFIG))
+    assert not (tmp_path / 'run' / 'checkpoint.npz.partial').exists()
+
+    checkpoint = load_checkpoint(path)
+    assert checkpoint['config'] == CONFIG
+    assert checkpoint['integrator_options'] == integrator_options
+    assert checkpoint['delta_t'] == 3600
+    restored = restore_simulation(checkpoint)
+    assert restored.names == simulation.names
+    assert restored.time == simulation.time
+    assert np.array_equal(restored.state, simulation.state)
+
+    simulation.advance(60 * 86400)
+    restored.advance(60 * 86400)
+    assert np.allclose(restored.state, simulation.state, rtol=rtol, atol=0)
+
+
+def test_restore_rejects_other_bodies(tmp_path):
+    simulation = get_simulation(3600, **CONFIG)
+    path = str(tmp_path / 'checkpoint.npz')
+    save_checkpoint(path, get_checkpoint(simulation, CONFIG))
+    with pytest.raises(ValueError):
+        restore_simulation(load_checkpoint(path), extra_planets=[])
@@ -0,0 +1,81 @@
+import numpy as np
+
+from history import HistoryLevel, TrajectoryHistory
+
+
+def get_history(samples, level_size=8, levels=4):
+    """History of one body whose state at time t is all t, for t in 0, 1, ..."""
+    history = TrajectoryHistory((1, 4), level_size=level_size, levels=levels)
+    times = np.arange(samples, dtype=float)
+    history.extend(times, np.repeat(times, 4).reshape(-1, 1, 4))
+    return history
+
+
+def get_times(level):
+    return level.times[level.order()].tolist()
+
+
+def test_level_grows_then_wraps():
+    level = HistoryLevel((1,), stride=1, size=6, initial_size=2)
+    for start in range(0, 9, 3):
+        times = np.arange(start, start + 3, dtype=float)
+        level.extend(times, times[:, np.newaxis])
+    assert len(level.times) == 6
+    assert get_times(level) == [3, 4, 5, 6, 7, 8]
+    assert level.first_time == 3
+
+
+def test_extend_in_pieces_matches_one_extend():
+    whole = get_history(100)
+    pieces = TrajectoryHistory((1, 4), level_size=8, levels=4)
+    for start in range(0, 100, 7):
+        times = np.arange(start, min(start + 7, 100), dtype=float)
+        pieces.extend(times, np.repeat(times, 4).reshape(-1, 1, 4))
+    assert len(pieces) == len(whole) == 100
+    for level, other in zip(pieces.levels, whole.levels):
+        assert get_times(level) == get_times(other)
+
+
+def test_levels_keep_strided_recent_samples():
+    history = get_history(100)
+    assert [get_times(level) for level in history.levels] == [
+        [92, 93, 94, 95, 96, 97, 98, 99],
+        [84, 86, 88, 90, 92, 94, 96, 98],
+        [68, 72, 76, 80, 84, 88, 92, 96],
+        [40, 48, 56, 64, 72, 80, 88, 96],
+    ]
+    assert history.span == (40, 99)
+
+
+def test_at_uses_finest_level_reaching_back():
+    history = get_history(100)
+    time, state = history.at(97.5)
+    assert time == 97
+    assert state.tolist() == [[97, 97, 97, 97]]
+    assert history.at(85)[0] == 84
+    assert history.at(1000)[0] == 99
+    # before the oldest sample kept
+    assert history.at(-10)[0] == 40
+
+
+def test_samples_stitch_levels_oldest_first():
+    history = get_history(100)
+    times, states = history.samples(0, 99, max_points=100)
+    assert times.tolist() == [
+        40, 48, 56, 64, 68, 72, 76, 80, 84, 86, 88, 90, 92, 93, 94, 95, 96, 97, 98, 99,
+    ]
+    assert np.array_equal(states[:, 0, 0], times)
+
+
+def test_samples_coarsen_to_max_points():
+    history = get_history(100)
+    assert history.samples(0, 99, max_points=12)[0].tolist() == [40, 48, 56, 64, 68, 72, 76, 80, 84, 88, 92, 96]
+    assert history.samples(92, 99, max_points=4)[0].tolist() == [92, 94, 96, 98]
+    # the coarsest level whatever its count
+    assert history.samples(0, 99, max_points=1)[0].tolist() == get_times(history.levels[-1])
+
+
+def test_samples_count_only_counted_points():
+    history = get_history(100)
+    times, _ = history.samples(92, 99, max_points=3, counted=lambda states: states[:, 0, 0] > 96)
+    assert times.tolist() == [92, 93, 94, 95, 96, 97, 98, 99]
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from planet import G, SUN_MASS, get_orbit_states
+
+
+AU = 1.496e11
+
+
+def get_speed(states):
+    return np.hypot(states[..., 1], states[..., 3])
+
+
+def test_circular_orbit_speed():
+    anomalies = np.radians(np.arange(0, 360, 15))
+    states = get_orbit_states(AU, 0, np.radians(102.9), anomalies)
+    assert states.shape == (len(anomalies), 4)
+    assert get_speed(states) == pytest.approx(np.sqrt(G * SUN_MASS / AU), rel=1e-12)
+    # about 29.8 km/s for the Earth
+    assert get_speed(states) == pytest.approx(29.8e3, rel=1e-2)
+    # perpendicular to the radius
+    assert states[:, 0] * states[:, 1] + states[:, 2] * states[:, 3] == pytest.approx(0, abs=1e-3 * AU)
+
+
+def test_eccentric_orbit_follows_vis_viva():
+    large_half_life = 2.279e11
+    anomalies = np.radians(np.arange(0, 360, 15))
+    states = get_orbit_states(large_half_life, 0.0934, np.radians(336.1), anomalies)
+    r = np.hypot(states[:, 0], states[:, 2])
+    assert r.min() == pytest.approx(large_half_life * (1 - 0.0934))
+    assert r.max() == pytest.approx(large_half_life * (1 + 0.0934))
+    expected = np.sqrt(G * SUN_MASS * (2 / r - 1 / large_half_life))
+    assert get_speed(states) == pytest.approx(expected, rel=1e-12)
+
+
+def test_start_velocity_replaces_orbital_speed():
+    states = get_orbit_states(AU, 0, 0, np.radians([10, 100, 200, 300]), start_velocity=[0, 25000, 25000, 35000])
+    assert get_speed(states) == pytest.approx([np.sqrt(G * SUN_MASS / AU), 25000, 25000, 35000])
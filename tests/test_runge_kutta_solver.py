@@ -0,0 +1,85 @@
+import numpy as np
+
+from runge_kutta_solver import DormandPrinceStepper, RungeKuttaStepper
+
+
+def kepler_derivatives(state, out, time=None):
+    """One body around a unit mass at the origin, G = 1: the orbit of semi-major axis 1 takes 2 pi."""
+    x, v_x, y, v_y = state[0]
+    r_cubed = np.hypot(x, y) ** 3
+    out[0] = v_x, -x / r_cubed, v_y, -y / r_cubed
+    return out
+
+
+def get_kepler_state(eccentricity):
+    """Perihelion state of the unit orbit of eccentricity."""
+    return np.array([[1 - eccentricity, 0, 0, np.sqrt((1 + eccentricity) / (1 - eccentricity))]])
+
+
+def test_dormand_prince_steps_meet_tolerance():
+    stepper = DormandPrinceStepper(kepler_derivatives, get_kepler_state(0.9), 0.5, rtol=1e-6, atol=1e-6)
+    for _ in range(40):
+        start, start_time = stepper.state.copy(), stepper.time
+        stepper.step()
+        exact = RungeKuttaStepper(kepler_derivatives, start, (stepper.time - start_time) / 1000)
+        exact.step(1000)
+        scale = 1e-6 + 1e-6 * np.maximum(np.abs(start), np.abs(stepper.state))
+        # the local error of every accepted step in the RMS norm of the controller
+        assert np.sqrt(np.mean(((stepper.state - exact.state) / scale) ** 2)) <= 1
+    assert stepper.rejected > 0
+
+
+def test_dormand_prince_converges_with_tolerance():
+    state = get_kepler_state(0.5)
+    errors = []
+    for rtol in (1e-6, 1e-9):
+        stepper = DormandPrinceStepper(kepler_derivatives, state, 0.01, rtol=rtol, atol=rtol)
+        stepper.advance(2 * np.pi)
+        errors.append(np.abs(stepper.state - state).max())
+        assert errors[-1] < 1000 * rtol
+    assert errors[1] < errors[0] / 100
+
+
+def test_dormand_prince_recovers_from_rejected_steps():
+    state = get_kepler_state(0.9)
+    stepper = DormandPrinceStepper(kepler_derivatives, state, 1.0, rtol=1e-10, atol=1e-10)
+    stepper.advance(2 * np.pi)
+    assert stepper.rejected > 0
+    assert stepper.min_taken_step < stepper.max_taken_step / 10
+    assert np.abs(stepper.state - state).max() < 1e-5
+
+
+def test_dormand_prince_reuses_last_stage():
+    stepper = DormandPrinceStepper(kepler_derivatives, get_kepler_state(0.5), 0.01)
+    stepper.step(50)
+    # six new stages a try, the first stage only once
+    assert stepper.evaluations == 1 + 6 * (stepper.accepted + stepper.rejected)
+    # unless before_step says the derivatives changed
+    changed = DormandPrinceStepper(
+        kepler_derivatives, get_kepler_state(0.5), 0.01, before_step=lambda state, time: True,
+    )
+    changed.step(50)
+    assert changed.evaluations == 50 + 6 * (changed.accepted + changed.rejected)
+
+
+def test_dormand_prince_samples_without_shortening_steps():
+    state = get_kepler_state(0.3)
+    reference = DormandPrinceStepper(kepler_derivatives, state, 0.01, rtol=1e-10, atol=1e-10)
+    sampled = DormandPrinceStepper(kepler_derivatives, state, 0.01, rtol=1e-10, atol=1e-10)
+    for time in np.linspace(0, 2 * np.pi, 2001)[1:]:
+        sampled.advance(time)
+        assert sampled.time == time
+    reference.advance(2 * np.pi)
+    # the samples land between the steps, which stay those of the unsampled run
+    assert sampled.accepted == reference.accepted
+    assert sampled.max_taken_step > 2 * np.pi / 2000
+    assert np.abs(sampled.state - reference.state).max() < 1e-9
+
+
+def test_runge_kutta_advance_lands_on_time():
+    stepper = RungeKuttaStepper(kepler_derivatives, get_kepler_state(0), 0.01)
+    stepper.advance(1.005)
+    assert stepper.time == 1.005
+    assert np.allclose(stepper.state[0, [0, 2]], [np.cos(1.005), np.sin(1.005)], atol=1e-9)
+    stepper.advance(0.5)
+    assert stepper.time == 1.005
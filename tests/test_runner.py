@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from runner import G, X, V_X, Y, V_Y, DerivativeBuffers, get_derivatives
+
+
+SUN_MASS = 1.989e30
+
+
+def get_pairwise_derivatives(state, masses, sun_mass, thrust=None):
+    """get_derivatives summed body by body: every row is pulled by the sun and by the massive rows."""
+    derivatives = np.zeros_like(state)
+    for i, (x, v_x, y, v_y) in enumerate(state):
+        a_x = -G * sun_mass * x / np.hypot(x, y) ** 3
+        a_y = -G * sun_mass * y / np.hypot(x, y) ** 3
+        for j, mass in enumerate(masses):
+            if j != i:
+                d_x, d_y = state[j, X] - x, state[j, Y] - y
+                # the attractor's mass, not the attracted one's
+                a_x += G * mass * d_x / np.hypot(d_x, d_y) ** 3
+                a_y += G * mass * d_y / np.hypot(d_x, d_y) ** 3
+        if thrust is not None:
+            acceleration, target = thrust[0][i], thrust[1][i]
+            to_x, to_y = (state[target, X], state[target, Y]) if target < len(state) else (0, 0)
+            to_x, to_y = to_x - x, to_y - y
+            a_x += acceleration * to_x / np.hypot(to_x, to_y)
+            a_y += acceleration * to_y / np.hypot(to_x, to_y)
+        derivatives[i] = v_x, a_x, v_y, a_y
+    return derivatives
+
+
+def get_random_state(count, rng):
+    radius = rng.uniform(1e11, 3e11, count)
+    angle = rng.uniform(0, 2 * np.pi, count)
+    return np.column_stack([
+        radius * np.cos(angle), -3e4 * np.sin(angle), radius * np.sin(angle), 3e4 * np.cos(angle),
+    ])
+
+
+def test_matches_pairwise_sum():
+    rng = np.random.default_rng(1)
+    state = get_random_state(7, rng)
+    # four massive bodies, three massless ones
+    masses = rng.uniform(1e23, 1e28, 4)
+    expected = get_pairwise_derivatives(state, masses, SUN_MASS)
+    assert np.allclose(get_derivatives(state, masses, SUN_MASS), expected, rtol=1e-12, atol=0)
+    assert np.array_equal(expected[:, [X, Y]], state[:, [V_X, V_Y]])
+
+
+def test_acceleration_uses_attractor_mass():
+    state = np.array([[1.5e11, 0, 0, 0], [1.5e11 + 1e9, 0, 0, 0]])
+    heavy_first = get_derivatives(state, np.array([1e28, 1]), 0)
+    # the light body falls towards the heavy one much faster than the other way round
+    assert heavy_first[1, V_X] == pytest.approx(-G * 1e28 / 1e18, rel=1e-12)
+    assert heavy_first[0, V_X] == pytest.approx(G * 1 / 1e18, rel=1e-12)
+
+
+def test_thrust_and_buffers():
+    rng = np.random.default_rng(2)
+    state = get_random_state(5, rng)
+    masses = rng.uniform(1e23, 1e25, 3)
+    thrust = (np.array([0, 0, 0, 0.01, -0.002]), np.array([5, 5, 5, 1, 5]))
+    expected = get_pairwise_derivatives(state, masses, SUN_MASS, thrust)
+    buffers = DerivativeBuffers(5, 3)
+    out = np.empty_like(state)
+    for _ in range(2):
+        get_derivatives(state, masses, SUN_MASS, thrust=thrust, out=out, buffers=buffers)
+        assert np.allclose(out, expected, rtol=1e-12, atol=0)
+    assert np.array_equal(out, get_derivatives(state, masses, SUN_MASS, thrust=thrust))
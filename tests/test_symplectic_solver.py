@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from runge_kutta_solver import RungeKuttaStepper
+from symplectic_solver import LeapfrogStepper, YoshidaStepper
+
+
+ORBITS = 100
+STEPS_PER_ORBIT = 200
+
+
+def kepler_derivatives(state, out, time=None):
+    """One body around a unit mass at the origin, G = 1: the orbit of semi-major axis 1 takes 2 pi."""
+    x, v_x, y, v_y = state[0]
+    r_cubed = np.hypot(x, y) ** 3
+    out[0] = v_x, -x / r_cubed, v_y, -y / r_cubed
+    return out
+
+
+def get_energy(state):
+    x, v_x, y, v_y = state[0]
+    return (v_x ** 2 + v_y ** 2) / 2 - 1 / np.hypot(x, y)
+
+
+def get_energy_errors(stepper_class, eccentricity=0.5):
+    """Largest relative energy error within each orbit of a Kepler orbit starting at perihelion."""
+    state = np.array([[1 - eccentricity, 0, 0, np.sqrt((1 + eccentricity) / (1 - eccentricity))]])
+    stepper = stepper_class(kepler_derivatives, state, 2 * np.pi / STEPS_PER_ORBIT)
+    errors = []
+    for _ in range(ORBITS):
+        error = 0
+        for _ in range(STEPS_PER_ORBIT):
+            stepper.step()
+            error = max(error, abs(get_energy(stepper.state) / get_energy(state) - 1))
+        errors.append(error)
+    return np.array(errors)
+
+
+@pytest.mark.parametrize('stepper_class, bound', [(LeapfrogStepper, 5e-3), (YoshidaStepper, 5e-5)])
+def test_energy_error_stays_bounded(stepper_class, bound):
+    errors = get_energy_errors(stepper_class)
+    assert errors.max() < bound
+    # no secular growth: the last orbits do no worse than the first ones
+    assert errors[-10:].max() < 1.1 * errors[:10].max()
+
+
+def test_runge_kutta_energy_drifts_in_comparison():
+    errors = get_energy_errors(RungeKuttaStepper)
+    assert errors[-10:].max() > 5 * errors[:10].max()
+
+
+def test_yoshida_is_fourth_order():
+    errors = [
+        np.abs(YoshidaStepper(kepler_derivatives, np.array([[1.0, 0, 0, 1.0]]), 2 * np.pi / steps).step(steps)
+               - np.array([[1.0, 0, 0, 1.0]])).max()
+        for steps in (100, 200)
+    ]
+    assert 12 < errors[0] / errors[1] < 20
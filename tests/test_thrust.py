@@ -0,0 +1,51 @@
+import numpy as np
+
+from thrust import ThrustTable
+
+
+EARTH = [(1e9, 0.01), (5e9, 0.002)]
+SUN = [(3e11, -0.001)]
+
+
+def test_resolve_picks_narrowest_band_of_nearest_body():
+    table = ThrustTable([[EARTH, SUN]] * 4)
+    body, accelerations = table.resolve(np.array([
+        [5e8, 2e11],  # inside the inner Earth band
+        [2e9, 2e11],  # the outer Earth band is narrower than the sun's
+        [4e9, 2e9],  # the sun is nearer but its band reaches out to 3e11
+        [6e9, 2e11],  # past the Earth bands
+    ]))
+    assert body.tolist() == [0, 0, 0, 1]
+    assert accelerations.tolist() == [0.01, 0.002, 0.002, -0.001]
+
+
+def test_resolve_without_match():
+    table = ThrustTable([[EARTH, SUN]])
+    body, accelerations = table.resolve(np.array([[6e9, 4e11]]))
+    assert body.tolist() == [-1]
+    assert accelerations.tolist() == [0]
+
+
+def test_resolve_skips_zero_bands():
+    table = ThrustTable([[[(0, 1), (1e9, 0)], [(1e10, 0.5)]]])
+    body, accelerations = table.resolve(np.array([[5e8, 5e9]]))
+    assert body.tolist() == [1]
+    assert accelerations.tolist() == [0.5]
+
+
+def test_resolve_per_ship_tables():
+    table = ThrustTable([[EARTH, SUN], [[], SUN], [EARTH, []]])
+    body, accelerations = table.resolve(np.array([[5e8, 2e11]] * 3))
+    assert body.tolist() == [0, 1, 0]
+    assert accelerations.tolist() == [0.01, -0.001, 0.01]
+    # a shared set resolves like the single set path
+    single = ThrustTable([[EARTH, SUN]] * 3).resolve(np.array([[5e8, 2e11]] * 3))
+    assert single[0].tolist() == [0, 0, 0]
+
+
+def test_resolve_empty():
+    body, accelerations = ThrustTable([]).resolve(np.empty((0, 2)))
+    assert len(body) == len(accelerations) == 0
+    body, accelerations = ThrustTable([[[], []]]).resolve(np.array([[1.0, 1.0]]))
+    assert body.tolist() == [-1]
+    assert accelerations.tolist() == [0]
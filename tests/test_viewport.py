@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from viewport import MAX_ZOOM, Viewport, get_visible_runs
+
+
+BOUNDS = (0, 0, 10, 10)
+
+
+def test_zoom_at_keeps_cursor_point_fixed():
+    viewport = Viewport(800, 600, base_scale=1e-9)
+    viewport.pan(120, -40)
+    before = viewport.to_world(650, 130)
+    for factor in (1.25, 1.25, 0.5, 3):
+        viewport.zoom_at(factor, 650, 130)
+        assert viewport.to_world(650, 130) == pytest.approx(before)
+    assert viewport.zoom == pytest.approx(1.25 * 1.25 * 0.5 * 3)
+
+
+def test_zoom_at_clamps_zoom():
+    viewport = Viewport(800, 600, base_scale=1e-9)
+    viewport.zoom_at(MAX_ZOOM * 10, 400, 300)
+    assert viewport.zoom == MAX_ZOOM
+
+
+def test_pan_and_reset():
+    viewport = Viewport(800, 600, base_scale=2)
+    viewport.pan(10, -20)
+    assert viewport.center == (-5, 10)
+    assert viewport.orbit_center == (410, 280)
+    viewport.reset()
+    assert viewport.orbit_center == (400, 300)
+
+
+def test_visible_runs_split_at_gaps():
+    xs = np.array([1, 2, 20, 30, 3, 4], dtype=float)
+    ys = np.array([1, 2, 20, 30, 3, 4], dtype=float)
+    runs = get_visible_runs(xs, ys, BOUNDS)
+    assert [run_xs.tolist() for run_xs, _ in runs] == [[1, 2, 20], [30, 3, 4]]
+
+
+def test_visible_runs_keep_segments_crossing_bounds():
+    # both ends outside, the segment passes through
+    runs = get_visible_runs(np.array([-5, 15], dtype=float), np.array([5, 5], dtype=float), BOUNDS)
+    assert [run_xs.tolist() for run_xs, _ in runs] == [[-5, 15]]
+
+
+def test_visible_runs_outside_and_single_points():
+    outside = np.array([20, 30, 40], dtype=float)
+    assert get_visible_runs(outside, outside, BOUNDS) == []
+    runs = get_visible_runs(np.array([5.0]), np.array([5.0]), BOUNDS)
+    assert [(run_xs.tolist(), run_ys.tolist()) for run_xs, run_ys in runs] == [([5], [5])]
+    assert get_visible_runs(np.array([50.0]), np.array([5.0]), BOUNDS) == []
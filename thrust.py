@@ -0,0 +1,58 @@
+import numpy as np
+
+
+class ThrustTable:
+    """
+    a_config tables of many ships compiled into padded, distance sorted arrays.
+
+    a_configs holds for every ship its (distance, acceleration) table for
+    every rule body. Ships sharing the same tables share one compiled set.
+    """
+
+    def __init__(self, a_configs):
+        sets = {}
+        self.set_index = np.array([
+            sets.setdefault(tuple(tuple(map(tuple, a_config)) for a_config in tables), len(sets))
+            for tables in a_configs
+        ], dtype=int)
+        rule_bodies = max((len(tables) for tables in sets), default=0)
+        bands = max((len(a_config) for tables in sets for a_config in tables), default=0)
+        self.distances = np.full((len(sets), rule_bodies, bands), np.inf)
+        self.accelerations = np.zeros((len(sets), rule_bodies, bands))
+        for tables, i in sets.items():
+            for k, a_config in enumerate(tables):
+                for j, (d, a) in enumerate(sorted(a_config, key=lambda t: t[0])):
+                    self.distances[i, k, j], self.accelerations[i, k, j] = d, a
+
+    def resolve(self, distances):
+        """
+        (body index, acceleration) of the active rule for every ship.
+
+        distances is an (M, K) array of ship to rule body distances. For
+        every body the narrowest band containing the distance matches unless
+        its distance or acceleration is zero; the nearest matching band over
+        all bodies wins. Ships with no match get index -1 and zero acceleration.
+        """
+        ships = len(distances)
+        if ships == 0 or self.distances.shape[2] == 0:
+            return np.full(ships, -1), np.zeros(ships)
+        if len(self.distances) == 1:
+            bands = np.empty(distances.shape, dtype=int)
+            for k, body_distances in enumerate(self.distances[0]):
+                bands[:, k] = np.searchsorted(body_distances, distances[:, k])
+        else:
+            bands = (self.distances[self.set_index] < distances[..., np.newaxis]).sum(axis=-1)
+        bands = np.minimum(bands, self.distances.shape[2] - 1)
+
+        set_index = self.set_index if len(self.distances) > 1 else np.zeros(ships, dtype=int)
+        bodies = np.arange(distances.shape[1])
+        matched_distances = self.distances[set_index[:, np.newaxis], bodies, bands]
+        matched_accelerations = self.accelerations[set_index[:, np.newaxis], bodies, bands]
+        matched_distances[
+            (matched_distances < distances) | (matched_distances == 0) | (matched_accelerations == 0)
+        ] = np.inf
+
+        body = np.argmin(matched_distances, axis=1)
+        rows = np.arange(ships)
+        found = np.isfinite(matched_distances[rows, body])
+        return np.where(found, body, -1), np.where(found, matched_accelerations[rows, body], 0)
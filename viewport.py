@@ -0,0 +1,90 @@
+import numpy as np
+
+
+ZOOM_STEP = 1.25
+MIN_ZOOM = 0.05
+MAX_ZOOM = 1e6
+CULL_MARGIN = 0.1  # of the viewport size
+
+
+class Viewport:
+    """
+    Camera mapping heliocentric meters to canvas pixels.
+
+    The canvas point canvas_center shows the world point center at
+    base_scale * zoom pixels per meter. Pixels grow along world x and y
+    like get_planet_configs lays them out.
+    """
+
+    def __init__(self, canvas_width, canvas_height, base_scale):
+        self.canvas_width = canvas_width
+        self.canvas_height = canvas_height
+        self.base_scale = base_scale
+        self.zoom = 1.0
+        self.center = (0.0, 0.0)
+
+    @property
+    def scale(self):
+        return self.base_scale * self.zoom
+
+    @property
+    def orbit_center(self):
+        """Pixel of the sun at the origin, the orbit_center of Planet and MinorBodies."""
+        return (
+            self.canvas_width / 2 - self.scale * self.center[0],
+            self.canvas_height / 2 - self.scale * self.center[1],
+        )
+
+    def to_world(self, pixel_x, pixel_y):
+        orbit_x, orbit_y = self.orbit_center
+        return (pixel_x - orbit_x) / self.scale, (pixel_y - orbit_y) / self.scale
+
+    def zoom_at(self, factor, pixel_x, pixel_y):
+        """Zoom by factor keeping the world point under the pixel in place."""
+        x, y = self.to_world(pixel_x, pixel_y)
+        zoom = min(max(self.zoom * factor, MIN_ZOOM), MAX_ZOOM)
+        ratio = self.zoom / zoom
+        self.center = (x + (self.center[0] - x) * ratio, y + (self.center[1] - y) * ratio)
+        self.zoom = zoom
+
+    def pan(self, pixels_x, pixels_y):
+        """Move the picture by pixels."""
+        self.center = (self.center[0] - pixels_x / self.scale, self.center[1] - pixels_y / self.scale)
+
+    def reset(self):
+        self.zoom = 1.0
+        self.center = (0.0, 0.0)
+
+    def get_bounds(self, margin=CULL_MARGIN):
+        """(x_min, y_min, x_max, y_max) of the world seen, widened by margin of the viewport on every side."""
+        half_width = (0.5 + margin) * self.canvas_width / self.scale
+        half_height = (0.5 + margin) * self.canvas_height / self.scale
+        return (
+            self.center[0] - half_width, self.center[1] - half_height,
+            self.center[0] + half_width, self.center[1] + half_height,
+        )
+
+
+def get_inside(xs, ys, bounds):
+    x_min, y_min, x_max, y_max = bounds
+    return (xs >= x_min) & (xs <= x_max) & (ys >= y_min) & (ys <= y_max)
+
+
+def get_visible_runs(xs, ys, bounds):
+    """
+    Split a polyline into the runs of its segments crossing bounds.
+
+    A segment is kept when its bounding box overlaps bounds, so runs join
+    only neighbouring points and gaps never turn into chords.
+    """
+    x_min, y_min, x_max, y_max = bounds
+    if len(xs) < 2:
+        inside = get_inside(xs, ys, bounds)
+        return [(xs[inside], ys[inside])] if inside.any() else []
+    crossing = (
+        (np.minimum(xs[:-1], xs[1:]) <= x_max) & (np.maximum(xs[:-1], xs[1:]) >= x_min)
+        & (np.minimum(ys[:-1], ys[1:]) <= y_max) & (np.maximum(ys[:-1], ys[1:]) >= y_min)
+    )
+    edges = np.flatnonzero(np.diff(np.concatenate([[False], crossing, [False]]).astype(int)))
+    # segments start:end span the points start:end + 1
+    return [(xs[start:end + 1], ys[start:end + 1]) for start, end in zip(edges[::2], edges[1::2])]